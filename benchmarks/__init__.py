@@ -0,0 +1,2 @@
+from .result import *
+from .users import *
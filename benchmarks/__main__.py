@@ -0,0 +1,186 @@
+import json
+import sys
+from argparse import ArgumentParser
+from collections.abc import Sequence
+from tempfile import TemporaryDirectory
+
+from .api import bench_api
+from .memory import bench_memory
+from .result import BenchmarkResult, compare_results, dump_results, load_results
+from .storage import STORAGE_TYPES, bench_storage, create_storage
+
+arg_parser = ArgumentParser(
+  prog="benchmarks",
+  description="Storage and REST API benchmarks",
+)
+
+subparsers = arg_parser.add_subparsers(dest="command", required=True)
+
+run_parser = subparsers.add_parser("run", help="run benchmarks and print or save JSON results")
+
+run_parser.add_argument(
+  "-s",
+  "--storages",
+  default="pickle,log,log-mmap,sqlite3,postgres",
+  metavar="<types>",
+  help=f"comma-separated storage types out of {', '.join(STORAGE_TYPES)} (default value is pickle,log,log-mmap,sqlite3,postgres)",
+)
+
+run_parser.add_argument(
+  "-n",
+  "--sizes",
+  default="1000,10000,100000",
+  metavar="<counts>",
+  help="comma-separated user counts (default value is 1000,10000,100000)",
+)
+
+run_parser.add_argument(
+  "-r",
+  "--repeat",
+  default=3,
+  type=int,
+  metavar="<count>",
+  help="runs per benchmark, the fastest one is reported (default value is 3)",
+)
+
+run_parser.add_argument(
+  "--sample-size",
+  default=200,
+  type=int,
+  metavar="<count>",
+  help="users touched by single-user benchmarks (default value is 200)",
+)
+
+run_parser.add_argument(
+  "--groups",
+  default="storage,api,memory",
+  metavar="<groups>",
+  help="comma-separated benchmark groups out of storage, api, memory (default value is storage,api,memory)",
+)
+
+run_parser.add_argument(
+  "--postgres-conninfo",
+  default=None,
+  metavar="<conninfo>",
+  help="postgres connection string, its users are DELETED (postgres is skipped by default)",
+)
+
+run_parser.add_argument(
+  "-o",
+  "--output",
+  default=None,
+  metavar="<filename>",
+  help="file to write JSON results to (stdout by default)",
+)
+
+run_parser.add_argument(
+  "-b",
+  "--baseline",
+  default=None,
+  metavar="<filename>",
+  help="compare results against this JSON file and fail on regressions",
+)
+
+compare_parser = subparsers.add_parser("compare", help="compare two JSON result files")
+compare_parser.add_argument("baseline", metavar="<baseline>", help="JSON results to compare against")
+compare_parser.add_argument("current", metavar="<current>", help="JSON results to check")
+
+for parser in (run_parser, compare_parser):
+  parser.add_argument(
+    "-t",
+    "--threshold",
+    default=0.25,
+    type=float,
+    metavar="<ratio>",
+    help="relative slowdown counted as a regression (default value is 0.25)",
+  )
+
+  parser.add_argument(
+    "--min-delta",
+    default=0.001,
+    type=float,
+    metavar="<seconds>",
+    help="absolute slowdown below which nothing is a regression (default value is 0.001)",
+  )
+
+
+def split_list(text: str) -> list[str]:
+  return [item.strip() for item in text.split(",") if item.strip()]
+
+
+def run(args) -> int:
+  storage_types = split_list(args.storages)
+  sizes = [int(size) for size in split_list(args.sizes)]
+  groups = split_list(args.groups)
+  results = list[BenchmarkResult]()
+  skipped = dict[str, str]()
+
+  if "memory" in groups:
+    for size in sizes:
+      print(f"memory x {size}", file=sys.stderr)
+      results += bench_memory(size, args.repeat)
+
+  for storage_type in storage_types:
+    for size in sizes:
+      with TemporaryDirectory() as dirname:
+        storage = create_storage(storage_type, dirname, args.postgres_conninfo)
+
+        if storage is None:
+          skipped[storage_type] = "no conninfo given" if args.postgres_conninfo is None else "connection failed"
+          break
+
+        print(f"{storage_type} x {size}", file=sys.stderr)
+
+        if "storage" in groups:
+          results += bench_storage(storage_type, storage, size, args.repeat, args.sample_size)
+
+        if "api" in groups:
+          results += bench_api(storage_type, storage, size, args.repeat, args.sample_size, dirname)
+
+        close = getattr(storage, "close", None)
+
+        if close is not None:
+          close()
+
+  data = dump_results(results, skipped, sizes=sizes, repeat=args.repeat, sample_size=args.sample_size)
+  text = json.dumps(data, indent=2)
+
+  if args.output is None:
+    print(text)
+  else:
+    with open(args.output, "w") as file:
+      file.write(text + "\n")
+
+  if args.baseline is None:
+    return 0
+
+  current = {result.key: result.toDict() for result in results}
+
+  return compare(load_results(args.baseline), current, args.threshold, args.min_delta)
+
+
+def compare(baseline, current, threshold: float, min_delta: float) -> int:
+  lines, regressions = compare_results(baseline, current, threshold, min_delta)
+
+  for line in lines:
+    print(line, file=sys.stderr)
+
+  if regressions:
+    print(f"{len(regressions)} regression(s) found", file=sys.stderr)
+    return 1
+
+  return 0
+
+
+def main(argv: Sequence[str] = sys.argv[1:]) -> int:
+  args = arg_parser.parse_args(argv)
+
+  match args.command:
+    case "run":
+      return run(args)
+    case _:
+      return compare(load_results(args.baseline), load_results(args.current), args.threshold, args.min_delta)
+
+
+if __name__ == "__main__":
+  sys.exit(main())
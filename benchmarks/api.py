@@ -0,0 +1,92 @@
+from collections.abc import Callable
+from os.path import join as join_paths
+from typing import Any
+
+from common.io.storage import Storage
+from common.user import User, UserManager
+from server.app import create_app
+from server.config import Config
+from server.multi_user_manager import MultiUserManager
+
+from .result import BenchmarkResult, measure
+from .users import make_users
+
+__all__ = ["bench_api"]
+
+
+def bench_api(
+  storage_type: str,
+  storage: Storage[User],
+  size: int,
+  repeat: int,
+  sample_size: int,
+  dirname: str,
+) -> list[BenchmarkResult]:
+  storage.delete_all()
+  storage.persist_many(make_users(size))
+
+  config = Config(enabled_storages=[storage_type], secret_filename=join_paths(dirname, "secret.key"))
+  multi_manager = MultiUserManager({storage_type: UserManager(storage)}, [storage_type])
+  client = create_app(config, multi_manager).test_client()
+
+  manager = multi_manager.get_manager(storage_type)
+  assert manager is not None
+
+  users = manager.get_all_users()
+  sample_ids = [user.id for user in users[:: max(1, size // sample_size)][:sample_size]]
+  results = list[BenchmarkResult]()
+  batch_counter = [0]
+
+  def add_result(operation: str, ops: int, run: Callable[[], Any]):
+    results.append(BenchmarkResult("api", storage_type, operation, size, ops, *measure(run, repeat)))
+
+  def request(method: str, url: str, **kwargs: Any):
+    res = client.open(url, method=method, **kwargs)
+
+    # Streamed bodies are only produced once they are read
+
+    res.get_data()
+
+    if res.status_code >= 400:
+      raise RuntimeError(f"{method} {url} failed with {res.status_code}: {res.get_data(as_text=True)[:200]}")
+
+  def get_users():
+    request("GET", "/api/users")
+
+  def get_users_ndjson():
+    request("GET", "/api/users", headers={"Accept": "application/x-ndjson"})
+
+  def get_users_page():
+    request("GET", "/api/users?sort=login&limit=100")
+
+  def get_user():
+    for user_id in sample_ids:
+      request("GET", f"/api/users/{user_id}")
+
+  def get_users_by_ids():
+    request("GET", "/api/users?ids=" + ",".join(map(str, sample_ids)))
+
+  def get_user_count():
+    request("GET", "/api/users/count")
+
+  def patch_user():
+    for user_id in sample_ids:
+      request("PATCH", f"/api/users/{user_id}", json={"name": f"Patched {user_id}"})
+
+  def post_users_batch():
+    batch_counter[0] += 1
+    items = [{"role": "user", "login": f"batch{batch_counter[0]}x{i}"} for i in range(len(sample_ids))]
+    request("POST", "/api/users/batch", json=items)
+
+  add_result("GET /users", size, get_users)
+  add_result("GET /users ndjson", size, get_users_ndjson)
+  add_result("GET /users?limit", 1, get_users_page)
+  add_result("GET /users/<id>", len(sample_ids), get_user)
+  add_result("GET /users?ids", len(sample_ids), get_users_by_ids)
+  add_result("GET /users/count", 1, get_user_count)
+  add_result("PATCH /users/<id>", len(sample_ids), patch_user)
+  add_result("POST /users/batch", len(sample_ids), post_users_batch)
+
+  storage.delete_all()
+
+  return results
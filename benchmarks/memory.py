@@ -0,0 +1,28 @@
+import pickle
+
+from .result import BenchmarkResult, measure, measure_memory
+from .users import make_users
+
+__all__ = ["bench_memory"]
+
+
+def bench_memory(size: int, repeat: int) -> list[BenchmarkResult]:
+  # Users are built both directly and from pickles, the way
+  # storages load them, bytes per user include the list slot
+
+  payloads = [pickle.dumps(user) for user in make_users(size)]
+  results = list[BenchmarkResult]()
+
+  def construct():
+    return make_users(size)
+
+  def unpickle():
+    return [pickle.loads(payload) for payload in payloads]
+
+  for operation, run in (("construct", construct), ("unpickle", unpickle)):
+    seconds, mean_seconds = measure(run, repeat)
+    bytes_per_user = measure_memory(run) / size
+
+    results.append(BenchmarkResult("memory", "user", operation, size, size, seconds, mean_seconds, bytes_per_user))
+
+  return results
@@ -0,0 +1,146 @@
+import json
+import platform
+import sys
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from gc import collect as collect_garbage
+from time import perf_counter
+from typing import Any
+
+__all__ = [
+  "BenchmarkResult",
+  "measure",
+  "measure_memory",
+  "dump_results",
+  "load_results",
+  "compare_results",
+]
+
+
+@dataclass
+class BenchmarkResult:
+  group: str
+  backend: str
+  operation: str
+  size: int
+  ops: int
+  seconds: float
+  mean_seconds: float
+  bytes_per_op: float = 0.0
+
+  @property
+  def key(self) -> str:
+    return f"{self.group}/{self.backend}/{self.operation}/{self.size}"
+
+  @property
+  def ops_per_second(self) -> float:
+    return self.ops / self.seconds if self.seconds > 0 else float("inf")
+
+  def toDict(self) -> dict[str, Any]:
+    d = asdict(self)
+    d["ops_per_second"] = self.ops_per_second
+    return d
+
+
+def measure(run: Callable[[], Any], repeat: int, setup: Callable[[], Any] | None = None) -> tuple[float, float]:
+  timings = list[float]()
+
+  for _ in range(repeat):
+    if setup is not None:
+      setup()
+
+    start = perf_counter()
+    run()
+    timings.append(perf_counter() - start)
+
+  return min(timings), sum(timings) / len(timings)
+
+
+def measure_memory(run: Callable[[], Any]) -> int:
+  # Bytes still allocated by whatever run returns,
+  # the result is kept alive until it's measured
+
+  collect_garbage()
+  tracemalloc.start()
+
+  try:
+    start = tracemalloc.get_traced_memory()[0]
+    result = run()
+    collect_garbage()
+    allocated = tracemalloc.get_traced_memory()[0] - start
+  finally:
+    tracemalloc.stop()
+
+  del result
+
+  return allocated
+
+
+def dump_results(results: list[BenchmarkResult], skipped: dict[str, str], **meta: Any) -> dict[str, Any]:
+  return {
+    "meta": {
+      "created_at": datetime.now(UTC).isoformat(),
+      "python": sys.version.split()[0],
+      "platform": platform.platform(),
+      **meta,
+    },
+    "skipped": skipped,
+    "results": [result.toDict() for result in results],
+  }
+
+
+def load_results(filename: str) -> dict[str, dict[str, Any]]:
+  with open(filename) as file:
+    data = json.load(file)
+
+  return {"/".join(str(r[k]) for k in ("group", "backend", "operation", "size")): r for r in data["results"]}
+
+
+def compare_results(
+  baseline: dict[str, dict[str, Any]],
+  current: dict[str, dict[str, Any]],
+  threshold: float,
+  min_delta: float,
+) -> tuple[list[str], list[str]]:
+  lines = list[str]()
+  regressions = list[str]()
+
+  for key in sorted(baseline.keys() & current.keys()):
+    old = baseline[key]["seconds"]
+    new = current[key]["seconds"]
+    ratio = new / old if old > 0 else float("inf")
+
+    # Tiny absolute differences are timer noise,
+    # so they never count as regressions
+
+    regressed = ratio > 1 + threshold and new - old > min_delta
+    mark = "REGRESSION" if regressed else ""
+
+    lines.append(f"{key:<48} {old:>10.4f}s {new:>10.4f}s {ratio:>7.2f}x {mark}".rstrip())
+
+    if regressed:
+      regressions.append(key)
+
+    old_bytes = baseline[key].get("bytes_per_op", 0.0)
+    new_bytes = current[key].get("bytes_per_op", 0.0)
+
+    if old_bytes <= 0 or new_bytes <= 0:
+      continue
+
+    bytes_ratio = new_bytes / old_bytes
+    bytes_regressed = bytes_ratio > 1 + threshold
+    mark = "REGRESSION" if bytes_regressed else ""
+
+    lines.append(f"{key:<48} {old_bytes:>10.0f}B {new_bytes:>10.0f}B {bytes_ratio:>7.2f}x {mark}".rstrip())
+
+    if bytes_regressed and key not in regressions:
+      regressions.append(key)
+
+  missing = len(baseline.keys() - current.keys())
+
+  if missing > 0:
+    lines.append(f"{missing} baseline result(s) not present in current results")
+
+  return lines, regressions
@@ -0,0 +1,95 @@
+from os.path import join as join_paths
+
+import psycopg
+
+from common.io.storage import Storage
+from common.user import User
+from server.io.storage import LogStorage, PickleStorage
+from server.user.io.storage import PostgresUserStorage, Sqlite3UserStorage
+
+from .result import BenchmarkResult, measure
+from .users import make_users, reset_ids
+
+__all__ = [
+  "STORAGE_TYPES",
+  "create_storage",
+  "bench_storage",
+]
+
+
+STORAGE_TYPES = ("pickle", "log", "log-mmap", "sqlite3", "postgres")
+
+
+def create_storage(storage_type: str, dirname: str, postgres_conninfo: str | None) -> Storage[User] | None:
+  match storage_type:
+    case "pickle":
+      return PickleStorage(join_paths(dirname, "db.pickle"))
+    case "log":
+      return LogStorage(join_paths(dirname, "db.log"))
+    case "log-mmap":
+      return LogStorage(join_paths(dirname, "db.log"), mmap_reads=True)
+    case "sqlite3":
+      return Sqlite3UserStorage(join_paths(dirname, "db.sqlite3"))
+    case "postgres":
+      if postgres_conninfo is None:
+        return None
+
+      try:
+        return PostgresUserStorage(postgres_conninfo)
+      except psycopg.OperationalError:
+        return None
+    case _:
+      raise ValueError(f"Unknown storage type: {storage_type}")
+
+
+def bench_storage(
+  storage_type: str,
+  storage: Storage[User],
+  size: int,
+  repeat: int,
+  sample_size: int,
+) -> list[BenchmarkResult]:
+  users = make_users(size)
+  sample_ids = list[int]()
+  results = list[BenchmarkResult]()
+
+  def add_result(operation: str, ops: int, timings: tuple[float, float]):
+    results.append(BenchmarkResult("storage", storage_type, operation, size, ops, *timings))
+
+  def clear():
+    storage.delete_all()
+    reset_ids(users)
+
+  def fill():
+    clear()
+    storage.persist_many(users)
+
+  def persist():
+    for user in users:
+      storage.persist(user)
+
+  def persist_many():
+    storage.persist_many(users)
+
+  def load():
+    for user_id in sample_ids:
+      storage.load(user_id)
+
+  def load_all():
+    for _ in storage.load_all():
+      ...
+
+  add_result("persist", size, measure(persist, repeat, clear))
+  add_result("persist_many", size, measure(persist_many, repeat, clear))
+
+  fill()
+  sample_ids.extend(user.id for user in users[:: max(1, size // sample_size)][:sample_size])
+
+  add_result("load", len(sample_ids), measure(load, repeat))
+  add_result("load_all", size, measure(load_all, repeat))
+  add_result("count", 1, measure(storage.count, repeat))
+  add_result("delete_all", size, measure(storage.delete_all, repeat, fill))
+
+  clear()
+
+  return results
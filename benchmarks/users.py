@@ -0,0 +1,39 @@
+from random import Random
+
+from common.user import Admin, Moderator, User
+
+__all__ = ["make_users", "reset_ids"]
+
+
+def make_users(count: int, seed: int = 0) -> list[User]:
+  random = Random(seed)
+  users = list[User]()
+
+  # Roughly 80% plain users, 15% moderators and 5% admins,
+  # moderators and admins reference a few other logins
+
+  for i in range(count):
+    login = f"user{i:07d}"
+    name = f"Name {i}" if i % 3 else None
+    roll = random.random()
+
+    if roll < 0.8:
+      users.append(User(login, name))
+      continue
+
+    verified_users = [f"user{random.randrange(count):07d}" for _ in range(random.randint(0, 5))]
+
+    if roll < 0.95:
+      users.append(Moderator(login, name, verified_users))
+      continue
+
+    created_pages = [f"page{i}-{j}" for j in range(random.randint(0, 5))]
+
+    users.append(Admin(login, name, verified_users, created_pages))
+
+  return users
+
+
+def reset_ids(users: list[User]):
+  for user in users:
+    user._id = -1
@@ -1,11 +1,14 @@
 import sys
 from collections.abc import Sequence
 
+from common.io.storage import CachingStorage, Storage, SyncStorageAdapter
+from common.user import User
+
 from .arg_parser import arg_parser
 from .config import Config
 from .io.dialog import CliDialog
 from .menu import Menu
-from .user.io.storage import RestUserStorage
+from .user.io.storage import AsyncRestUserStorage, RestUserStorage
 
 
 def create_config(args: Sequence[str] = sys.argv[1:]) -> Config:
@@ -15,9 +18,57 @@ def create_config(args: Sequence[str] = sys.argv[1:]) -> Config:
   return config
 
 
+def create_storage(config: Config) -> Storage[User]:
+  storage = create_rest_storage(config)
+
+  if not config.cache:
+    return storage
+
+  return CachingStorage(
+    storage,
+    max_entries=config.cache_size,
+    max_bytes=config.cache_bytes,
+    ttl=config.cache_ttl,
+  )
+
+
+def create_rest_storage(config: Config) -> Storage[User]:
+  if config.async_io:
+    return SyncStorageAdapter(
+      AsyncRestUserStorage(
+        config.address,
+        max_concurrency=config.max_concurrency,
+        connect_timeout=config.connect_timeout,
+        read_timeout=config.read_timeout,
+        retries=config.retries,
+        retry_backoff=config.retry_backoff,
+        compression=config.compression,
+      )
+    )
+
+  return RestUserStorage(
+    config.address,
+    pool_size=config.pool_size,
+    connect_timeout=config.connect_timeout,
+    read_timeout=config.read_timeout,
+    retries=config.retries,
+    retry_backoff=config.retry_backoff,
+    compression=config.compression,
+    conditional_requests=config.conditional_requests,
+  )
+
+
 config = create_config()
 dialog = CliDialog()
-storage = RestUserStorage(config.address)
+storage = create_storage(config)
 menu = Menu(dialog, storage)
 
-menu.run()
+try:
+  menu.run()
+finally:
+  # Backend specific close() is reached through the caching wrapper
+
+  close = getattr(storage, "close", None)
+
+  if close is not None:
+    close()
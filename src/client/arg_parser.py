@@ -1,4 +1,4 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, BooleanOptionalAction
 
 from .config import Config
 
@@ -18,3 +18,103 @@ arg_parser.add_argument(
   metavar="<address>",
   help=f"server's REST API address (default value is {repr(Config.address)})",
 )
+
+arg_parser.add_argument(
+  "--pool-size",
+  default=Config.pool_size,
+  type=int,
+  metavar="<count>",
+  help=f"number of kept-alive connections to the server (default value is {Config.pool_size})",
+)
+
+arg_parser.add_argument(
+  "--connect-timeout",
+  default=Config.connect_timeout,
+  type=float,
+  metavar="<seconds>",
+  help=f"timeout of connecting to the server (default value is {Config.connect_timeout})",
+)
+
+arg_parser.add_argument(
+  "--read-timeout",
+  default=Config.read_timeout,
+  type=float,
+  metavar="<seconds>",
+  help=f"timeout of waiting for the server's response (default value is {Config.read_timeout})",
+)
+
+arg_parser.add_argument(
+  "--retries",
+  default=Config.retries,
+  type=int,
+  metavar="<count>",
+  help=f"retries of failed idempotent requests (default value is {Config.retries})",
+)
+
+arg_parser.add_argument(
+  "--retry-backoff",
+  default=Config.retry_backoff,
+  type=float,
+  metavar="<seconds>",
+  help=f"backoff factor between retries (default value is {Config.retry_backoff})",
+)
+
+arg_parser.add_argument(
+  "--compression",
+  default=Config.compression,
+  action=BooleanOptionalAction,
+  help="accept compressed responses (enabled by default)",
+)
+
+arg_parser.add_argument(
+  "--conditional-requests",
+  default=Config.conditional_requests,
+  action=BooleanOptionalAction,
+  help="revalidate previous responses with ETags (enabled by default)",
+)
+
+arg_parser.add_argument(
+  "--async-io",
+  default=Config.async_io,
+  action="store_true",
+  help="talk to the server through the asyncio-based storage",
+)
+
+arg_parser.add_argument(
+  "--max-concurrency",
+  default=Config.max_concurrency,
+  type=int,
+  metavar="<count>",
+  help=f"requests in flight at once with --async-io (default value is {Config.max_concurrency})",
+)
+
+arg_parser.add_argument(
+  "--cache",
+  default=Config.cache,
+  action="store_true",
+  help="cache loaded users, the user count and ids in memory",
+)
+
+arg_parser.add_argument(
+  "--cache-size",
+  default=Config.cache_size,
+  type=int,
+  metavar="<entries>",
+  help=f"maximum number of cached entries with --cache (default value is {Config.cache_size})",
+)
+
+arg_parser.add_argument(
+  "--cache-bytes",
+  default=Config.cache_bytes,
+  type=int,
+  metavar="<bytes>",
+  help="maximum size of cached users with --cache (unlimited by default)",
+)
+
+arg_parser.add_argument(
+  "--cache-ttl",
+  default=Config.cache_ttl,
+  type=float,
+  metavar="<seconds>",
+  help=f"time after which cached entries expire with --cache (default value is {Config.cache_ttl})",
+)
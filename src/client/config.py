@@ -6,3 +6,16 @@ __all__ = ["Config"]
 @dataclass
 class Config:
   address: str = "http://localhost:8000/api"
+  pool_size: int = 10
+  connect_timeout: float = 3.05
+  read_timeout: float = 30.0
+  retries: int = 3
+  retry_backoff: float = 0.3
+  compression: bool = True
+  conditional_requests: bool = True
+  async_io: bool = False
+  max_concurrency: int = 100
+  cache: bool = False
+  cache_size: int = 1024
+  cache_bytes: int | None = None
+  cache_ttl: float | None = 30.0
@@ -1 +1,3 @@
+from .async_rest_user_storage import *
 from .rest_user_storage import *
+from .user_json import *
@@ -0,0 +1,327 @@
+import asyncio
+from collections.abc import Iterable
+from contextlib import suppress
+from json import loads
+from typing import Any, cast, override
+
+import aiohttp
+
+from client.error import BadStatusCodeError
+from client.util import compile_json_validator, validate_json
+from common.io.storage import AsyncStorage
+from common.user import User
+
+from .rest_user_storage import RestUserStorage
+from .user_json import (
+  AnyUserSchema,
+  DeletedCountSchema,
+  DeletedSchema,
+  ResultSchema,
+  SuccessSchema,
+  UpdateSchema,
+  apply_batch_results,
+  chunk_ids,
+  json_to_user,
+)
+
+__all__ = ["AsyncRestUserStorage"]
+
+
+class AsyncRestUserStorage(AsyncStorage[User]):
+  IDS_PER_REQUEST = RestUserStorage.IDS_PER_REQUEST
+  USERS_PER_PAGE = RestUserStorage.USERS_PER_PAGE
+
+  __url: str
+  __max_concurrency: int
+  __connect_timeout: float
+  __read_timeout: float
+  __retries: int
+  __retry_backoff: float
+  __compression: bool
+  __session: aiohttp.ClientSession | None
+  __semaphore: asyncio.Semaphore | None
+  __loop: asyncio.AbstractEventLoop | None
+
+  def __init__(
+    self,
+    url: str = "http://localhost:8000/api",
+    max_concurrency: int = 100,
+    connect_timeout: float = 3.05,
+    read_timeout: float = 30.0,
+    retries: int = 3,
+    retry_backoff: float = 0.3,
+    compression: bool = True,
+  ):
+    if max_concurrency < 1:
+      raise ValueError("max_concurrency must be positive")
+
+    if retries < 0:
+      raise ValueError("retries must be non-negative")
+
+    self.__url = url
+    self.__max_concurrency = max_concurrency
+    self.__connect_timeout = connect_timeout
+    self.__read_timeout = read_timeout
+    self.__retries = retries
+    self.__retry_backoff = retry_backoff
+    self.__compression = compression
+    self.__session = None
+    self.__semaphore = None
+    self.__loop = None
+
+  @property
+  def url(self) -> str:
+    return self.__url
+
+  @property
+  def max_concurrency(self) -> int:
+    return self.__max_concurrency
+
+  @override
+  async def persist(self, obj: User) -> int:
+    if obj.id < 0:
+      await self.__register(obj)
+    else:
+      await self.__update(obj)
+
+    return obj.id
+
+  async def __register(self, user: User):
+    status, json = await self.__request("POST", f"{self.url}/users", json=user.toDict())
+
+    if status != 200:
+      if isinstance(json, dict) and isinstance(json.get("error"), str):
+        raise RuntimeError(json["error"])
+
+      raise BadStatusCodeError(status)
+
+    json = cast(ResultSchema, validate_json(json, cast(Any, ResultSchema)))
+    error = json.get("error")
+
+    if error is not None:
+      raise RuntimeError(error)
+
+    user._id = cast(SuccessSchema, json)["id"]
+
+  async def __update(self, user: User):
+    status, json = await self.__request("PATCH", f"{self.url}/users/{user.id}", json=user.toDict())
+
+    if status != 200:
+      raise BadStatusCodeError(status)
+
+    json = validate_json(json, UpdateSchema)
+    error = json.get("error")
+
+    if error is not None:
+      raise RuntimeError(error)
+
+  @override
+  async def persist_many(self, objs: Iterable[User]) -> list[int]:
+    # Creations (POST) and updates (PATCH) are sent concurrently
+
+    async def persist_batch(method: str, users: list[User]) -> list[str]:
+      if len(users) == 0:
+        return []
+
+      status, json = await self.__request(method, f"{self.url}/users/batch", json=[user.toDict() for user in users])
+
+      if status != 200:
+        raise BadStatusCodeError(status)
+
+      return apply_batch_results(users, json)
+
+    users = list(objs)
+    new_users = [user for user in users if user.id < 0]
+    old_users = [user for user in users if user.id >= 0]
+    new_errors, old_errors = await asyncio.gather(persist_batch("POST", new_users), persist_batch("PATCH", old_users))
+    errors = new_errors + old_errors
+
+    if len(errors) > 0:
+      raise RuntimeError("; ".join(errors))
+
+    return [user.id for user in users]
+
+  @override
+  async def load(self, obj_id: int) -> User | None:
+    status, json = await self.__request("GET", f"{self.url}/users/{obj_id}")
+
+    if status == 404:
+      return None
+
+    if status != 200:
+      raise BadStatusCodeError(status)
+
+    return json_to_user(validate_json(json, cast(Any, AnyUserSchema)))
+
+  @override
+  async def load_many(self, obj_ids: Iterable[int]) -> list[User]:
+    # Chunks are requested concurrently,
+    # but users are returned in the requested order
+
+    async def load_chunk(ids: str) -> list[User]:
+      status, json = await self.__request("GET", f"{self.url}/users", params={"ids": ids})
+
+      if status != 200:
+        raise BadStatusCodeError(status)
+
+      return list(map(json_to_user, validate_json(json, list[AnyUserSchema])))
+
+    chunks = await asyncio.gather(*map(load_chunk, chunk_ids(obj_ids, AsyncRestUserStorage.IDS_PER_REQUEST)))
+
+    return [user for chunk in chunks for user in chunk]
+
+  @override
+  async def load_page(self, after_id: int | None = None, limit: int | None = None) -> list[User]:
+    params = dict[str, Any](sort="id")
+
+    if after_id is not None:
+      params["after_id"] = after_id
+
+    if limit is not None:
+      params["limit"] = limit
+
+    status, json = await self.__request("GET", f"{self.url}/users", params=params)
+
+    if status != 200:
+      raise BadStatusCodeError(status)
+
+    return list(map(json_to_user, validate_json(json, list[AnyUserSchema])))
+
+  @override
+  async def load_all(self) -> list[User]:
+    validate_user = compile_json_validator(cast(Any, AnyUserSchema))
+    session = await self.__get_session()
+    url: str | None = f"{self.url}/users"
+    params: dict[str, Any] | None = {"limit": AsyncRestUserStorage.USERS_PER_PAGE}
+    users = list[User]()
+
+    # Pages are chained through their next links,
+    # so they can only be fetched one after another
+
+    while url is not None:
+      async with self.__get_semaphore():
+        async with session.get(url, params=params, headers={"Accept": "application/x-ndjson"}) as res:
+          if res.status != 200:
+            raise BadStatusCodeError(res.status)
+
+          async for line in res.content:
+            if line.strip():
+              users.append(json_to_user(validate_user(loads(line))))
+
+          next_link = res.links.get("next")
+          url = None if next_link is None else str(res.url.join(cast(Any, next_link["url"])))
+          params = None
+
+    return users
+
+  @override
+  async def load_all_ids(self) -> list[int]:
+    status, json = await self.__request("GET", f"{self.url}/users/ids")
+
+    if status != 200:
+      raise BadStatusCodeError(status)
+
+    return validate_json(json, list[int])
+
+  @override
+  async def count(self) -> int:
+    status, json = await self.__request("GET", f"{self.url}/users/count")
+
+    if status != 200:
+      raise BadStatusCodeError(status)
+
+    return validate_json(json, int)
+
+  @override
+  async def delete(self, obj_id: int) -> bool:
+    status, json = await self.__request("DELETE", f"{self.url}/users/{obj_id}")
+
+    if status == 404:
+      return False
+
+    if status != 200:
+      raise BadStatusCodeError(status)
+
+    return validate_json(json, DeletedSchema)["deleted"]
+
+  @override
+  async def delete_many(self, obj_ids: Iterable[int]) -> int:
+    async def delete_chunk(ids: str) -> int:
+      status, json = await self.__request("DELETE", f"{self.url}/users", params={"ids": ids})
+
+      if status != 200:
+        raise BadStatusCodeError(status)
+
+      return validate_json(json, DeletedCountSchema)["deleted"]
+
+    return sum(await asyncio.gather(*map(delete_chunk, chunk_ids(obj_ids, AsyncRestUserStorage.IDS_PER_REQUEST))))
+
+  @override
+  async def delete_all(self) -> int:
+    status, json = await self.__request("DELETE", f"{self.url}/users")
+
+    if status != 200:
+      raise BadStatusCodeError(status)
+
+    return validate_json(json, DeletedCountSchema)["deleted"]
+
+  @override
+  async def close(self):
+    if self.__session is not None:
+      await self.__session.close()
+
+    self.__session = None
+    self.__semaphore = None
+    self.__loop = None
+
+  async def __request(self, method: str, url: str, **kwargs: Any) -> tuple[int, Any]:
+    session = await self.__get_session()
+    retries = self.__retries if method in RestUserStorage.RETRIED_METHODS else 0
+
+    # Every attempt takes a slot of its own, so requests
+    # waiting out a backoff don't hold back the others
+
+    for attempt in range(retries + 1):
+      async with self.__get_semaphore():
+        try:
+          async with session.request(method, url, **kwargs) as res:
+            if res.status not in RestUserStorage.RETRIED_STATUSES or attempt == retries:
+              try:
+                return res.status, await res.json(content_type=None)
+              except ValueError:
+                return res.status, None
+        except (TimeoutError, aiohttp.ClientConnectionError):
+          if attempt == retries:
+            raise
+
+      await asyncio.sleep(self.__retry_backoff * 2**attempt)
+
+    raise AssertionError("unreachable")
+
+  async def __get_session(self) -> aiohttp.ClientSession:
+    # Sessions are bound to the event loop they were created in,
+    # the one of a previous loop is closed before it's replaced.
+    # Its transports can't be closed anymore if that loop is
+
+    loop = asyncio.get_running_loop()
+
+    if self.__session is None or self.__session.closed or self.__loop is not loop:
+      if self.__session is not None and not self.__session.closed:
+        with suppress(RuntimeError):
+          await self.__session.close()
+
+      headers = None if self.__compression else {"Accept-Encoding": "identity"}
+      timeout = aiohttp.ClientTimeout(sock_connect=self.__connect_timeout, sock_read=self.__read_timeout)
+      connector = aiohttp.TCPConnector(limit=self.__max_concurrency)
+
+      self.__session = aiohttp.ClientSession(headers=headers, timeout=timeout, connector=connector)
+      self.__semaphore = asyncio.Semaphore(self.__max_concurrency)
+      self.__loop = loop
+
+    return self.__session
+
+  def __get_semaphore(self) -> asyncio.Semaphore:
+    if self.__semaphore is None:
+      self.__semaphore = asyncio.Semaphore(self.__max_concurrency)
+
+    return self.__semaphore
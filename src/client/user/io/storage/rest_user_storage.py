@@ -1,26 +1,112 @@
+from collections import OrderedDict
 from collections.abc import Iterable
-from typing import Any, Literal, TypedDict, cast, override
+from json import loads
+from typing import Any, Final, cast, override
+from urllib.parse import urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from client.error import BadStatusCodeError
-from client.util import validate_json
+from client.util import compile_json_validator, validate_json
 from common.io.storage import Storage
-from common.user import Admin, Moderator, User
+from common.user import User
+
+from .user_json import (
+  AnyUserSchema,
+  DeletedCountSchema,
+  DeletedSchema,
+  ResultSchema,
+  SuccessSchema,
+  UpdateSchema,
+  apply_batch_results,
+  chunk_ids,
+  json_to_user,
+)
 
 __all__ = ["RestUserStorage"]
 
 
 class RestUserStorage(Storage[User]):
+  IDS_PER_REQUEST = 500
+  USERS_PER_PAGE = 10000
+  MAX_CACHED_BYTES = 16 << 20
+
+  # Only methods which can be safely repeated are retried,
+  # POST requests could register the same user twice
+
+  RETRIED_METHODS: Final = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+  RETRIED_STATUSES: Final = frozenset([502, 503, 504])
+
+  # With conditional requests the last response of every GET is kept
+  # with its ETag and reused when the server answers 304 Not Modified.
+  # The least recently used ones are dropped once their bodies take more
+  # than MAX_CACHED_BYTES, streamed pages of load_all aren't kept at all
+
   __url: str
+  __session: requests.Session
+  __timeout: tuple[float, float]
+  __conditional_requests: bool
+  __responses: OrderedDict[str, tuple[str, Any, int]]
+  __cached_bytes: int
+
+  def __init__(
+    self,
+    url: str = "http://localhost:8000/api",
+    pool_size: int = 10,
+    connect_timeout: float = 3.05,
+    read_timeout: float = 30.0,
+    retries: int = 3,
+    retry_backoff: float = 0.3,
+    compression: bool = True,
+    conditional_requests: bool = True,
+  ):
+    if pool_size < 1:
+      raise ValueError("pool_size must be positive")
+
+    if retries < 0:
+      raise ValueError("retries must be non-negative")
 
-  def __init__(self, url: str = "http://localhost:8000/api"):
     self.__url = url
+    self.__timeout = (connect_timeout, read_timeout)
+    self.__conditional_requests = conditional_requests
+    self.__responses = OrderedDict()
+    self.__cached_bytes = 0
+
+    retry = Retry(
+      total=retries,
+      backoff_factor=retry_backoff,
+      allowed_methods=RestUserStorage.RETRIED_METHODS,
+      status_forcelist=RestUserStorage.RETRIED_STATUSES,
+      raise_on_status=False,
+    )
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    self.__session = requests.Session()
+    self.__session.mount("http://", adapter)
+    self.__session.mount("https://", adapter)
+
+    if not compression:
+      self.__session.headers["Accept-Encoding"] = "identity"
 
   @property
   def url(self) -> str:
     return self.__url
 
+  @property
+  def session(self) -> requests.Session:
+    return self.__session
+
+  @property
+  def conditional_requests(self) -> bool:
+    return self.__conditional_requests
+
+  def close(self):
+    self.__session.close()
+    self.__forget_responses()
+
   @override
   def persist(self, obj: User) -> int:
     if obj.id < 0:
@@ -32,7 +118,7 @@ class RestUserStorage(Storage[User]):
 
   def __register(self, user: User):
     url = f"{self.url}/users"
-    res = requests.post(url, json=user.toDict())
+    res = self.__request("POST", url, json=user.toDict())
 
     if res.status_code != 200:
       try:
@@ -46,139 +132,145 @@ class RestUserStorage(Storage[User]):
 
       raise BadStatusCodeError(res.status_code)
 
-    class ErrorSchema(TypedDict):
-      error: str
-
-    class SuccessSchema(TypedDict):
-      id: int
-
-    Schema = ErrorSchema | SuccessSchema
-
     # Python typing system works strange
     # when generics meat union typings
     # so some casts are needed
     json = res.json()
-    json = cast(ErrorSchema | SuccessSchema, validate_json(json, cast(Any, Schema)))
+    json = cast(ResultSchema, validate_json(json, cast(Any, ResultSchema)))
     error = json.get("error")
 
     if error is not None:
       raise RuntimeError(error)
 
-    user._id = json["id"]
+    user._id = cast(SuccessSchema, json)["id"]
 
   def __update(self, user: User):
     url = f"{self.url}/users/{user.id}"
-    res = requests.patch(url, json=user.toDict())
+    res = self.__request("PATCH", url, json=user.toDict())
 
     if res.status_code != 200:
       raise BadStatusCodeError(res.status_code)
 
-    class Schema(TypedDict):
-      error: str | None
-
     json = res.json()
-    json = validate_json(json, Schema)
+    json = validate_json(json, UpdateSchema)
     error = json.get("error")
 
     if error is not None:
       raise RuntimeError(error)
 
-  class __UserSchema(TypedDict):
-    role: Literal["user"]
-    id: int
-    login: str
-    name: str | None
-
-  class __ModeratorSchema(TypedDict):
-    role: Literal["moderator"]
-    id: int
-    login: str
-    name: str | None
-    verified_users: list[str]
-
-  class __AdminSchema(TypedDict):
-    role: Literal["admin"]
-    id: int
-    login: str
-    name: str | None
-    verified_users: list[str]
-    created_pages: list[str]
-
-  __AnyUserSchema = __UserSchema | __ModeratorSchema | __AdminSchema
-
   @override
-  def load_all(self) -> Iterable[User]:
-    res = requests.get(f"{self.url}/users")
+  def persist_many(self, objs: Iterable[User]) -> list[int]:
+    # New users are created with POST and existing ones updated
+    # with PATCH, one request each whatever the batch size
+
+    users = list(objs)
+    new_users = [user for user in users if user.id < 0]
+    old_users = [user for user in users if user.id >= 0]
+    errors = list[str]()
+
+    if len(new_users) > 0:
+      errors += self.__persist_batch("POST", new_users)
+
+    if len(old_users) > 0:
+      errors += self.__persist_batch("PATCH", old_users)
+
+    if len(errors) > 0:
+      raise RuntimeError("; ".join(errors))
+
+    return [user.id for user in users]
+
+  def __persist_batch(self, method: str, users: list[User]) -> list[str]:
+    res = self.__request(method, f"{self.url}/users/batch", json=[user.toDict() for user in users])
 
     if res.status_code != 200:
       raise BadStatusCodeError(res.status_code)
 
-    json = res.json()
-    json = validate_json(json, list[RestUserStorage.__AnyUserSchema])
+    return apply_batch_results(users, res.json())
+
+  @override
+  def load_all(self) -> Iterable[User]:
+    url: str | None = f"{self.url}/users"
+    params: dict[str, Any] | None = {"limit": RestUserStorage.USERS_PER_PAGE}
+
+    validate_user = compile_json_validator(cast(Any, AnyUserSchema))
+
+    while url is not None:
+      # Users are requested as NDJSON and parsed line by line
+      # while the page is still being received
+
+      with self.__request("GET", url, params=params, headers={"Accept": "application/x-ndjson"}, stream=True) as res:
+        if res.status_code != 200:
+          raise BadStatusCodeError(res.status_code)
 
-    return map(RestUserStorage.__json_to_user, json)
+        for line in res.iter_lines():
+          if not line:
+            continue
+
+          json = validate_user(loads(line))
+
+          yield json_to_user(json)
+
+        # Next page link already carries all the query parameters
+
+        next_link = res.links.get("next")
+        url = None if next_link is None else urljoin(res.url, next_link["url"])
+        params = None
 
   @override
-  def load(self, user_id: int) -> User | None:
-    res = requests.get(f"{self.url}/users/{user_id}")
+  def load_page(self, after_id: int | None = None, limit: int | None = None) -> list[User]:
+    params = dict[str, Any](sort="id")
 
-    if res.status_code == 404:
-      return None
+    if after_id is not None:
+      params["after_id"] = after_id
 
-    if res.status_code != 200:
-      raise BadStatusCodeError(res.status_code)
+    if limit is not None:
+      params["limit"] = limit
 
-    json = res.json()
-    json = validate_json(json, cast(Any, RestUserStorage.__AnyUserSchema))
+    json = self.__get_json(f"{self.url}/users", params=params)
+    json = validate_json(json, list[AnyUserSchema])
 
-    return RestUserStorage.__json_to_user(json)
+    return list(map(json_to_user, json))
 
-  @staticmethod
-  def __json_to_user(json: __AnyUserSchema) -> User:
-    role = json["role"]
+  @override
+  def load(self, user_id: int) -> User | None:
+    try:
+      json = self.__get_json(f"{self.url}/users/{user_id}")
+    except BadStatusCodeError as e:
+      if e.received_status_code == 404:
+        return None
 
-    if role == "user":
-      user = User()
-    elif role == "moderator":
-      user = Moderator()
-    elif role == "admin":
-      user = Admin()
-    else:
-      raise ValueError(f"Bad role: {repr(role)}")
+      raise
 
-    user._id = json["id"]
-    user.login = json["login"]
-    user.name = json["name"]
+    json = validate_json(json, cast(Any, AnyUserSchema))
 
-    if isinstance(user, Moderator):
-      user.verified_users = cast(Any, json)["verified_users"]
+    return json_to_user(json)
 
-    if isinstance(user, Admin):
-      user.created_pages = cast(Any, json)["created_pages"]
+  @override
+  def load_many(self, obj_ids: Iterable[int]) -> Iterable[User]:
+    for ids in chunk_ids(obj_ids, RestUserStorage.IDS_PER_REQUEST):
+      json = self.__get_json(f"{self.url}/users", params={"ids": ids})
+      json = validate_json(json, list[AnyUserSchema])
 
-    return user
+      yield from map(json_to_user, json)
 
   @override
   def load_all_ids(self) -> Iterable[int]:
-    res = requests.get(f"{self.url}/users/ids")
-
-    if res.status_code != 200:
-      raise BadStatusCodeError(res.status_code)
+    json = self.__get_json(f"{self.url}/users/ids")
 
-    return validate_json(res.json(), list[int])
+    return validate_json(json, list[int])
 
   @override
   def count(self) -> int:
-    res = requests.get(f"{self.url}/users/count")
+    json = self.__get_json(f"{self.url}/users/count")
 
-    if res.status_code != 200:
-      raise BadStatusCodeError(res.status_code)
-
-    return validate_json(res.json(), int)
+    return validate_json(json, int)
 
   @override
   def delete(self, user_id: int) -> bool:
-    res = requests.delete(f"{self.url}/users/{user_id}")
+    url = f"{self.url}/users/{user_id}"
+    res = self.__request("DELETE", url)
+
+    self.__forget_response(self.__response_key(url))
 
     if res.status_code == 404:
       return False
@@ -186,25 +278,96 @@ class RestUserStorage(Storage[User]):
     if res.status_code != 200:
       raise BadStatusCodeError(res.status_code)
 
-    class Schema(TypedDict):
-      deleted: bool
-
     json = res.json()
-    json = validate_json(json, Schema)
+    json = validate_json(json, DeletedSchema)
 
     return json["deleted"]
 
+  @override
+  def delete_many(self, obj_ids: Iterable[int]) -> int:
+    deleted = 0
+
+    for ids in chunk_ids(obj_ids, RestUserStorage.IDS_PER_REQUEST):
+      res = self.__request("DELETE", f"{self.url}/users", params={"ids": ids})
+
+      if res.status_code != 200:
+        raise BadStatusCodeError(res.status_code)
+
+      json = res.json()
+      json = validate_json(json, DeletedCountSchema)
+
+      deleted += json["deleted"]
+
+    return deleted
+
   @override
   def delete_all(self) -> int:
-    res = requests.delete(f"{self.url}/users")
+    res = self.__request("DELETE", f"{self.url}/users")
+
+    self.__forget_responses()
 
     if res.status_code != 200:
       raise BadStatusCodeError(res.status_code)
 
-    class Schema(TypedDict):
-      deleted: int
-
     json = res.json()
-    json = validate_json(json, Schema)
+    json = validate_json(json, DeletedCountSchema)
 
     return json["deleted"]
+
+  def __get_json(self, url: str, params: dict[str, Any] | None = None) -> Any:
+    key = self.__response_key(url, params)
+    res = self.__request("GET", url, params=params, headers=self.__conditional_headers(key))
+
+    if res.status_code == 304:
+      self.__responses.move_to_end(key)
+      return self.__responses[key][1]
+
+    if res.status_code != 200:
+      self.__forget_response(key)
+      raise BadStatusCodeError(res.status_code)
+
+    json = res.json()
+
+    self.__remember_response(key, res, json)
+
+    return json
+
+  def __response_key(self, url: str, params: dict[str, Any] | None = None) -> str:
+    return cast(str, requests.Request("GET", url, params=params).prepare().url)
+
+  def __conditional_headers(self, key: str) -> dict[str, str]:
+    # A 304 can only come back for a tag sent in If-None-Match,
+    # so it's always answered with a remembered response
+
+    response = self.__responses.get(key)
+
+    return {} if response is None else {"If-None-Match": response[0]}
+
+  def __remember_response(self, key: str, res: requests.Response, value: Any):
+    etag = res.headers.get("ETag")
+    size = len(res.content)
+
+    self.__forget_response(key)
+
+    if not self.__conditional_requests or etag is None or size > RestUserStorage.MAX_CACHED_BYTES:
+      return
+
+    self.__responses[key] = (etag, value, size)
+    self.__cached_bytes += size
+
+    while self.__cached_bytes > RestUserStorage.MAX_CACHED_BYTES:
+      _, (_, _, evicted_size) = self.__responses.popitem(last=False)
+      self.__cached_bytes -= evicted_size
+
+  def __forget_response(self, key: str):
+    response = self.__responses.pop(key, None)
+
+    if response is not None:
+      self.__cached_bytes -= response[2]
+
+  def __forget_responses(self):
+    self.__responses.clear()
+    self.__cached_bytes = 0
+
+  def __request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+    return self.__session.request(method, url, timeout=self.__timeout, **kwargs)
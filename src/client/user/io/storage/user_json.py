@@ -0,0 +1,126 @@
+from collections.abc import Iterable
+from typing import Any, Literal, TypedDict, cast
+
+from client.error import BadJsonSchemaError
+from client.util import validate_json
+from common.user import Admin, Moderator, User
+
+__all__ = [
+  "ErrorSchema",
+  "SuccessSchema",
+  "ResultSchema",
+  "UpdateSchema",
+  "DeletedSchema",
+  "DeletedCountSchema",
+  "UserSchema",
+  "ModeratorSchema",
+  "AdminSchema",
+  "AnyUserSchema",
+  "json_to_user",
+  "apply_batch_results",
+  "chunk_ids",
+]
+
+
+class ErrorSchema(TypedDict):
+  error: str
+
+
+class SuccessSchema(TypedDict):
+  id: int
+
+
+ResultSchema = ErrorSchema | SuccessSchema
+
+
+class UpdateSchema(TypedDict):
+  error: str | None
+
+
+class DeletedSchema(TypedDict):
+  deleted: bool
+
+
+class DeletedCountSchema(TypedDict):
+  deleted: int
+
+
+class UserSchema(TypedDict):
+  role: Literal["user"]
+  id: int
+  login: str
+  name: str | None
+
+
+class ModeratorSchema(TypedDict):
+  role: Literal["moderator"]
+  id: int
+  login: str
+  name: str | None
+  verified_users: list[str]
+
+
+class AdminSchema(TypedDict):
+  role: Literal["admin"]
+  id: int
+  login: str
+  name: str | None
+  verified_users: list[str]
+  created_pages: list[str]
+
+
+AnyUserSchema = UserSchema | ModeratorSchema | AdminSchema
+
+
+def json_to_user(json: AnyUserSchema) -> User:
+  role = json["role"]
+
+  if role == "user":
+    user = User()
+  elif role == "moderator":
+    user = Moderator()
+  elif role == "admin":
+    user = Admin()
+  else:
+    raise ValueError(f"Bad role: {repr(role)}")
+
+  user._id = json["id"]
+  user.login = json["login"]
+  user.name = json["name"]
+
+  if isinstance(user, Moderator):
+    user.verified_users = cast(Any, json)["verified_users"]
+
+  if isinstance(user, Admin):
+    user.created_pages = cast(Any, json)["created_pages"]
+
+  return user
+
+
+def apply_batch_results(users: list[User], json: Any) -> list[str]:
+  # Python typing system works strange
+  # when generics meat union typings
+  # so some casts are needed
+  json = cast(list[ResultSchema], validate_json(json, cast(Any, list[ResultSchema])))
+
+  if len(json) != len(users):
+    raise BadJsonSchemaError()
+
+  errors = list[str]()
+
+  for user, result in zip(users, json, strict=True):
+    error = result.get("error")
+
+    if error is not None:
+      errors.append(f"{user.login}: {error}")
+    else:
+      user._id = cast(SuccessSchema, result)["id"]
+
+  return errors
+
+
+def chunk_ids(obj_ids: Iterable[int], chunk_size: int) -> Iterable[str]:
+  ids = list(map(str, obj_ids))
+
+  for i in range(0, len(ids), chunk_size):
+    yield ",".join(ids[i : i + chunk_size])
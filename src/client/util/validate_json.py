@@ -1,15 +1,35 @@
+from collections.abc import Callable
+from functools import lru_cache
 from types import NoneType, UnionType
 from typing import Any, Literal, TypeVar, Union, cast, get_args, get_origin, get_type_hints
 
 from client.error import BadJsonSchemaError
 
-__all__ = ["validate_json"]
+__all__ = [
+  "validate_json",
+  "compile_json_validator",
+]
 
 
 T = TypeVar("T")
 
+Validator = Callable[[Any], Any]
+
 
 def validate_json(json: Any, schema: type[T]) -> T:
+  return cast(T, _compile(schema)(json))
+
+
+def compile_json_validator(schema: type[T]) -> Callable[[Any], T]:
+  return cast(Callable[[Any], T], _compile(schema))
+
+
+# Schemas are walked with get_origin/get_args/get_type_hints only once,
+# validating a value then is just a chain of closure calls
+
+
+@lru_cache(maxsize=256)
+def _compile(schema: Any) -> Validator:
   if schema is None:
     schema = NoneType
 
@@ -17,91 +37,211 @@ def validate_json(json: Any, schema: type[T]) -> T:
 
   for nongeneric_type in [NoneType, bool, int, float, str, list, set, frozenset]:
     if schema is nongeneric_type:
-      if not isinstance(json, nongeneric_type):
-        raise BadJsonSchemaError()
-
-      return cast(T, json)
+      return _compile_instance_check(nongeneric_type)
 
   origin = get_origin(schema)
 
   # Union
 
   if origin is UnionType or origin is Union:
-    for type_variant in get_args(schema):
-      try:
-        return validate_json(json, type_variant)
-      except Exception:
-        ...
-
-    raise BadJsonSchemaError()
+    return _compile_union(get_args(schema))
 
   # Literal
 
   if origin is Literal:
-    literals = get_args(schema)
+    return _compile_literal(get_args(schema))
+
+  # Collections
+
+  for collection_type in [list, set, frozenset]:
+    if origin is collection_type:
+      return _compile_collection(collection_type, _compile(get_args(schema)[0]))
+
+  # Dict
+
+  if origin is dict:
+    key_type, value_type = get_args(schema)
+
+    return _compile_dict(_compile(key_type), _compile(value_type))
 
+  # Tuple
+
+  if origin is tuple:
+    return _compile_tuple(get_args(schema))
+
+  # TypedDict
+
+  if origin is not None or not isinstance(schema, type) or not issubclass(schema, dict):
+    raise ValueError("Bad schema value")
+
+  return _compile_typed_dict(schema)
+
+
+def _compile_instance_check(instance_type: type) -> Validator:
+  def validate(json: Any) -> Any:
+    if not isinstance(json, instance_type):
+      raise BadJsonSchemaError()
+
+    return json
+
+  return validate
+
+
+def _compile_literal(literals: tuple[Any, ...]) -> Validator:
+  def validate(json: Any) -> Any:
     if json not in literals:
       raise BadJsonSchemaError()
 
-    return cast(T, json)
+    return json
 
-  # Collections
+  return validate
 
-  for collection_type in [list, set, frozenset]:
-    if origin is collection_type:
-      if not isinstance(json, collection_type):
-        raise BadJsonSchemaError()
 
-      item_type = get_args(schema)[0]
+def _compile_collection(collection_type: type, validate_item: Validator) -> Validator:
+  def validate(json: Any) -> Any:
+    if not isinstance(json, collection_type):
+      raise BadJsonSchemaError()
 
-      for item in json:
-        validate_json(item, item_type)
+    for item in json:
+      validate_item(item)
 
-    return cast(T, json)
+    return json
 
-  # Dict
+  return validate
 
-  if origin is dict:
+
+def _compile_dict(validate_key: Validator, validate_value: Validator) -> Validator:
+  def validate(json: Any) -> Any:
     if not isinstance(json, dict):
       raise BadJsonSchemaError()
 
-    key_type, value_type = get_args(schema)
-
     for key, value in json.items():
-      validate_json(key, key_type)
-      validate_json(value, value_type)
+      validate_key(key)
+      validate_value(value)
 
-    return cast(T, json)
+    return json
 
-  # Tuple
+  return validate
 
-  if origin is tuple:
+
+def _compile_tuple(item_types: tuple[Any, ...]) -> Validator:
+  if len(item_types) == 2 and item_types[1] is Ellipsis:
+    validate_item = _compile(item_types[0])
+
+    def validate_variadic(json: Any) -> Any:
+      if not isinstance(json, tuple) and not isinstance(json, list):
+        raise BadJsonSchemaError()
+
+      for item in json:
+        validate_item(item)
+
+      return json
+
+    return validate_variadic
+
+  item_validators = tuple(map(_compile, item_types))
+
+  def validate(json: Any) -> Any:
     if not isinstance(json, tuple) and not isinstance(json, list):
       raise BadJsonSchemaError()
 
-    item_types = get_args(schema)
+    if len(item_validators) != len(json):
+      raise BadJsonSchemaError()
+
+    for item, validate_item in zip(json, item_validators, strict=True):
+      validate_item(item)
+
+    return json
+
+  return validate
+
 
-    if len(item_types) != len(json):
+def _compile_typed_dict(schema: type) -> Validator:
+  # Missing keys are validated as None
+
+  fields = tuple((name, _compile(item_type)) for name, item_type in get_type_hints(schema).items())
+
+  def validate(json: Any) -> Any:
+    if not isinstance(json, dict):
       raise BadJsonSchemaError()
 
-    for item, item_type in zip(json, item_types, strict=True):
-      validate_json(item, item_type)
+    get = json.get
 
-    return cast(T, json)
+    for name, validate_item in fields:
+      validate_item(get(name))
 
-  # TypedDict
+    return json
+
+  return validate
 
-  if not issubclass(schema, dict):
-    raise ValueError("Bad schema value")
 
-  if not isinstance(json, dict):
+def _compile_union(variants: tuple[Any, ...]) -> Validator:
+  discriminated = _compile_discriminated_union(variants)
+
+  if discriminated is not None:
+    return discriminated
+
+  validators = tuple(map(_compile, variants))
+
+  def validate(json: Any) -> Any:
+    for validate_variant in validators:
+      try:
+        return validate_variant(json)
+      except BadJsonSchemaError:
+        ...
+
     raise BadJsonSchemaError()
 
-  hints = get_type_hints(schema)
+  return validate
+
+
+def _compile_discriminated_union(variants: tuple[Any, ...]) -> Validator | None:
+  # A union of TypedDicts which all have a literal field
+  # with distinct values (e.g. role) is dispatched on that field
+  # instead of trying every variant
+
+  if not all(isinstance(variant, type) and issubclass(variant, dict) for variant in variants):
+    return None
+
+  variants_hints = [get_type_hints(variant) for variant in variants]
+
+  for key in variants_hints[0].keys():
+    validators_by_value = dict[Any, Validator]()
+
+    for variant, hints in zip(variants, variants_hints, strict=True):
+      variant_key_type = hints.get(key)
 
-  for item_name, item_type in hints.items():
-    item = json.get(item_name)
+      if get_origin(variant_key_type) is not Literal:
+        break
+
+      values = get_args(variant_key_type)
+
+      if any(value in validators_by_value for value in values):
+        break
+
+      for value in values:
+        validators_by_value[value] = _compile(variant)
+    else:
+      return _compile_dispatch(key, validators_by_value)
+
+  return None
+
+
+def _compile_dispatch(key: str, validators_by_value: dict[Any, Validator]) -> Validator:
+  def validate(json: Any) -> Any:
+    if not isinstance(json, dict):
+      raise BadJsonSchemaError()
+
+    value = json.get(key)
+
+    try:
+      validate_variant = validators_by_value.get(value)
+    except TypeError:
+      raise BadJsonSchemaError() from None
+
+    if validate_variant is None:
+      raise BadJsonSchemaError()
 
-    validate_json(item, item_type)
+    return validate_variant(json)
 
-  return cast(T, json)
+  return validate
@@ -1,2 +1,5 @@
+from .async_storage import *
+from .caching_storage import *
 from .identifiable import *
 from .storage import *
+from .sync_storage_adapter import *
@@ -0,0 +1,62 @@
+import asyncio
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from typing import Generic, TypeVar
+
+from .identifiable import Identifiable
+
+__all__ = ["AsyncStorage"]
+
+
+T = TypeVar("T", bound=Identifiable)
+
+
+class AsyncStorage(ABC, Generic[T]):
+  @abstractmethod
+  async def persist(self, obj: T) -> int: ...
+
+  @abstractmethod
+  async def load(self, obj_id: int) -> T | None: ...
+
+  @abstractmethod
+  async def load_all_ids(self) -> list[int]: ...
+
+  @abstractmethod
+  async def delete(self, obj_id: int) -> bool: ...
+
+  # Bulk defaults run all single-object calls concurrently,
+  # implementations are expected to bound the concurrency themselves
+
+  async def persist_many(self, objs: Iterable[T]) -> list[int]:
+    return list(await asyncio.gather(*map(self.persist, objs)))
+
+  async def load_many(self, obj_ids: Iterable[int]) -> list[T]:
+    objs = await asyncio.gather(*map(self.load, obj_ids))
+
+    return [obj for obj in objs if obj is not None]
+
+  async def load_page(self, after_id: int | None = None, limit: int | None = None) -> list[T]:
+    ids = sorted(obj_id for obj_id in await self.load_all_ids() if after_id is None or obj_id > after_id)
+
+    if limit is not None:
+      ids = ids[:limit]
+
+    return await self.load_many(ids)
+
+  async def delete_many(self, obj_ids: Iterable[int]) -> int:
+    return sum(await asyncio.gather(*map(self.delete, obj_ids)))
+
+  @property
+  def stats(self) -> dict[str, int | float]:
+    return {}
+
+  async def count(self) -> int:
+    return len(await self.load_all_ids())
+
+  async def load_all(self) -> list[T]:
+    return await self.load_many(await self.load_all_ids())
+
+  async def delete_all(self) -> int:
+    return await self.delete_many(await self.load_all_ids())
+
+  async def close(self): ...
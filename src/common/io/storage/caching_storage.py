@@ -0,0 +1,315 @@
+import pickle
+import sys
+from collections import OrderedDict
+from collections.abc import Iterable
+from threading import Lock
+from time import monotonic
+from typing import Any, Final, TypeVar, override
+
+from .identifiable import Identifiable
+from .storage import Storage
+
+__all__ = ["CachingStorage"]
+
+
+T = TypeVar("T", bound=Identifiable)
+
+
+class CachingStorage(Storage[T]):
+  # Objects are cached pickled, so every load returns a fresh copy
+  # and callers changing it in place never touch the cache.
+  # Results of load, count and load_all_ids are evicted in LRU order
+  # once max_entries or max_bytes is exceeded and expire after ttl.
+  # Writes made through this wrapper invalidate what they change,
+  # writes made elsewhere are seen once they're reported by
+  # poll_changes of the wrapped storage or entries expire
+
+  COUNT_KEY: Final = "count"
+  IDS_KEY: Final = "ids"
+
+  __storage: Storage[T]
+  __max_entries: int | None
+  __max_bytes: int | None
+  __ttl: float | None
+  __entries: OrderedDict[Any, tuple[Any, int, float | None]]
+  __bytes: int
+  __hits: int
+  __misses: int
+  __evictions: int
+  __generation: int
+  __lock: Lock
+
+  def __init__(
+    self,
+    storage: Storage[T],
+    max_entries: int | None = 1024,
+    max_bytes: int | None = None,
+    ttl: float | None = None,
+  ):
+    super().__init__()
+
+    if max_entries is not None and max_entries <= 0:
+      raise ValueError("max_entries must be positive")
+
+    if max_bytes is not None and max_bytes <= 0:
+      raise ValueError("max_bytes must be positive")
+
+    if ttl is not None and ttl <= 0:
+      raise ValueError("ttl must be positive")
+
+    self.__storage = storage
+    self.__max_entries = max_entries
+    self.__max_bytes = max_bytes
+    self.__ttl = ttl
+    self.__entries = OrderedDict()
+    self.__bytes = 0
+    self.__hits = 0
+    self.__misses = 0
+    self.__evictions = 0
+    self.__generation = 0
+    self.__lock = Lock()
+
+  @property
+  def storage(self) -> Storage[T]:
+    return self.__storage
+
+  @override
+  def persist(self, obj: T) -> int:
+    new = obj.id < 0
+    obj_id = self.__storage.persist(obj)
+
+    self.__invalidate_written([obj_id], new)
+
+    return obj_id
+
+  @override
+  def persist_many(self, objs: Iterable[T]) -> list[int]:
+    objs = list(objs)
+    new = any(obj.id < 0 for obj in objs)
+    obj_ids = self.__storage.persist_many(objs)
+
+    self.__invalidate_written(obj_ids, new)
+
+    return obj_ids
+
+  @override
+  def load(self, obj_id: int) -> T | None:
+    found, payload = self.__get(obj_id)
+
+    if found:
+      return None if payload is None else pickle.loads(payload)
+
+    generation = self.__generation
+    obj = self.__storage.load(obj_id)
+    self.__put_obj(obj_id, obj, generation)
+
+    return obj
+
+  @override
+  def load_many(self, obj_ids: Iterable[int]) -> Iterable[T]:
+    obj_ids = list(obj_ids)
+    objs_by_id = dict[int, T | None]()
+    missing_ids = list[int]()
+
+    for obj_id in obj_ids:
+      found, payload = self.__get(obj_id)
+
+      if not found:
+        missing_ids.append(obj_id)
+      elif payload is not None:
+        objs_by_id[obj_id] = pickle.loads(payload)
+
+    if len(missing_ids) > 0:
+      generation = self.__generation
+
+      for obj in self.__storage.load_many(missing_ids):
+        objs_by_id[obj.id] = obj
+
+      for obj_id in missing_ids:
+        self.__put_obj(obj_id, objs_by_id.get(obj_id), generation)
+
+    objs = map(objs_by_id.get, obj_ids)
+
+    return [obj for obj in objs if obj is not None]
+
+  @override
+  def load_page(self, after_id: int | None = None, limit: int | None = None) -> list[T]:
+    return self.__storage.load_page(after_id, limit)
+
+  @override
+  def load_all_ids(self) -> Iterable[int]:
+    found, ids = self.__get(CachingStorage.IDS_KEY)
+
+    if found:
+      return ids
+
+    generation = self.__generation
+    ids = tuple(self.__storage.load_all_ids())
+    self.__put(CachingStorage.IDS_KEY, ids, sys.getsizeof(ids), generation)
+
+    return ids
+
+  @override
+  def load_all(self) -> Iterable[T]:
+    return self.__storage.load_all()
+
+  @override
+  def load_by_login(self, login: str) -> T | None:
+    return self.__storage.load_by_login(login)
+
+  @override
+  def count(self) -> int:
+    found, count = self.__get(CachingStorage.COUNT_KEY)
+
+    if found:
+      return count
+
+    generation = self.__generation
+    count = self.__storage.count()
+    self.__put(CachingStorage.COUNT_KEY, count, sys.getsizeof(count), generation)
+
+    return count
+
+  @override
+  def delete(self, obj_id: int) -> bool:
+    deleted = self.__storage.delete(obj_id)
+
+    self.__invalidate([obj_id, CachingStorage.COUNT_KEY, CachingStorage.IDS_KEY])
+
+    return deleted
+
+  @override
+  def delete_many(self, obj_ids: Iterable[int]) -> int:
+    obj_ids = list(obj_ids)
+    deleted = self.__storage.delete_many(obj_ids)
+
+    self.__invalidate([*obj_ids, CachingStorage.COUNT_KEY, CachingStorage.IDS_KEY])
+
+    return deleted
+
+  @override
+  def delete_all(self) -> int:
+    deleted = self.__storage.delete_all()
+
+    self.clear()
+
+    return deleted
+
+  @override
+  def poll_changes(self) -> list[int] | None:
+    obj_ids = self.__storage.poll_changes()
+
+    if obj_ids is None:
+      self.clear()
+    elif len(obj_ids) > 0:
+      self.__invalidate([*obj_ids, CachingStorage.COUNT_KEY, CachingStorage.IDS_KEY])
+
+    return obj_ids
+
+  @property
+  @override
+  def stats(self) -> dict[str, int | float]:
+    with self.__lock:
+      cache_stats = {
+        "cache_entries": len(self.__entries),
+        "cache_bytes": self.__bytes,
+        "cache_hits": self.__hits,
+        "cache_misses": self.__misses,
+        "cache_evictions": self.__evictions,
+      }
+
+    return {**self.__storage.stats, **cache_stats}
+
+  def clear(self):
+    with self.__lock:
+      self.__entries.clear()
+      self.__bytes = 0
+      self.__generation += 1
+
+  def __getattr__(self, name: str) -> Any:
+    # Backend specific members (close(), session, ...)
+    # are reached through the wrapper
+
+    if name.startswith("_"):
+      raise AttributeError(name)
+
+    return getattr(self.__storage, name)
+
+  def __invalidate_written(self, obj_ids: list[int], new: bool):
+    # Updates keep count and ids valid as long as
+    # the cached ids already contain every written one
+
+    keys = list[Any](obj_ids)
+
+    if not new:
+      found, ids = self.__get(CachingStorage.IDS_KEY, track=False)
+      new = not found or not set(obj_ids).issubset(ids)
+
+    if new:
+      keys += [CachingStorage.COUNT_KEY, CachingStorage.IDS_KEY]
+
+    self.__invalidate(keys)
+
+  def __invalidate(self, keys: Iterable[Any]):
+    with self.__lock:
+      self.__generation += 1
+
+      for key in keys:
+        entry = self.__entries.pop(key, None)
+
+        if entry is not None:
+          self.__bytes -= entry[1]
+
+  def __get(self, key: Any, track: bool = True) -> tuple[bool, Any]:
+    with self.__lock:
+      entry = self.__entries.get(key)
+
+      if entry is not None and entry[2] is not None and entry[2] <= monotonic():
+        del self.__entries[key]
+        self.__bytes -= entry[1]
+        entry = None
+
+      if entry is None:
+        self.__misses += track
+        return False, None
+
+      self.__entries.move_to_end(key)
+      self.__hits += track
+
+      return True, entry[0]
+
+  def __put_obj(self, obj_id: int, obj: T | None, generation: int):
+    if obj is None:
+      self.__put(obj_id, None, 0, generation)
+      return
+
+    payload = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    self.__put(obj_id, payload, len(payload), generation)
+
+  def __put(self, key: Any, value: Any, size: int, generation: int):
+    # A result read before a concurrent write
+    # invalidated the cache is not stored
+
+    if self.__max_bytes is not None and size > self.__max_bytes:
+      return
+
+    expires_at = None if self.__ttl is None else monotonic() + self.__ttl
+
+    with self.__lock:
+      if generation != self.__generation:
+        return
+
+      old_entry = self.__entries.pop(key, None)
+
+      if old_entry is not None:
+        self.__bytes -= old_entry[1]
+
+      self.__entries[key] = (value, size, expires_at)
+      self.__bytes += size
+
+      while (self.__max_entries is not None and len(self.__entries) > self.__max_entries) or (
+        self.__max_bytes is not None and self.__bytes > self.__max_bytes
+      ):
+        _, (_, evicted_size, _) = self.__entries.popitem(last=False)
+        self.__bytes -= evicted_size
+        self.__evictions += 1
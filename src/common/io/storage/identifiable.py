@@ -4,6 +4,8 @@ __all__ = ["Identifiable"]
 
 
 class Identifiable(ABC):
+  __slots__ = ("_id",)
+
   _id: int
 
   def __init__(self, id: int = -1):
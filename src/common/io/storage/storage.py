@@ -23,6 +23,50 @@ class Storage(ABC, Generic[T]):
   @abstractmethod
   def delete(self, obj_id: int) -> bool: ...
 
+  def persist_many(self, objs: Iterable[T]) -> list[int]:
+    return [self.persist(obj) for obj in objs]
+
+  def load_many(self, obj_ids: Iterable[int]) -> Iterable[T]:
+    for obj_id in obj_ids:
+      obj = self.load(obj_id)
+
+      if obj is not None:
+        yield obj
+
+  def load_page(self, after_id: int | None = None, limit: int | None = None) -> list[T]:
+    ids = sorted(obj_id for obj_id in self.load_all_ids() if after_id is None or obj_id > after_id)
+
+    if limit is not None:
+      ids = ids[:limit]
+
+    return list(self.load_many(ids))
+
+  def delete_many(self, obj_ids: Iterable[int]) -> int:
+    deleted = 0
+
+    for obj_id in obj_ids:
+      deleted += self.delete(obj_id)
+
+    return deleted
+
+  @property
+  def stats(self) -> dict[str, int | float]:
+    return {}
+
+  def poll_changes(self) -> list[int] | None:
+    # Returns ids of objects changed since the previous call,
+    # possibly by other processes, or None if they can't be told.
+    # The first call only starts tracking changes. Storages which
+    # can't track changes report none
+
+    return []
+
+  def load_by_login(self, login: str) -> T | None:
+    # Storages of objects with an indexed login should
+    # look them up directly instead of scanning all of them
+
+    return next((obj for obj in self.load_all() if getattr(obj, "login", None) == login), None)
+
   def count(self) -> int:
     return len(list(self.load_all_ids()))
 
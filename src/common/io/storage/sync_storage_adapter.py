@@ -0,0 +1,92 @@
+import asyncio
+from collections.abc import Coroutine, Iterable
+from threading import Lock
+from typing import Any, TypeVar, override
+
+from .async_storage import AsyncStorage
+from .identifiable import Identifiable
+from .storage import Storage
+
+__all__ = ["SyncStorageAdapter"]
+
+
+T = TypeVar("T", bound=Identifiable)
+R = TypeVar("R")
+
+
+class SyncStorageAdapter(Storage[T]):
+  __storage: AsyncStorage[T]
+  __runner: asyncio.Runner
+  __lock: Lock
+
+  def __init__(self, storage: AsyncStorage[T]):
+    super().__init__()
+
+    self.__storage = storage
+    self.__runner = asyncio.Runner()
+    self.__lock = Lock()
+
+  @property
+  def storage(self) -> AsyncStorage[T]:
+    return self.__storage
+
+  @override
+  def persist(self, obj: T) -> int:
+    return self.__run(self.__storage.persist(obj))
+
+  @override
+  def persist_many(self, objs: Iterable[T]) -> list[int]:
+    return self.__run(self.__storage.persist_many(objs))
+
+  @override
+  def load(self, obj_id: int) -> T | None:
+    return self.__run(self.__storage.load(obj_id))
+
+  @override
+  def load_many(self, obj_ids: Iterable[int]) -> Iterable[T]:
+    return self.__run(self.__storage.load_many(obj_ids))
+
+  @override
+  def load_page(self, after_id: int | None = None, limit: int | None = None) -> list[T]:
+    return self.__run(self.__storage.load_page(after_id, limit))
+
+  @override
+  def load_all_ids(self) -> Iterable[int]:
+    return self.__run(self.__storage.load_all_ids())
+
+  @override
+  def load_all(self) -> Iterable[T]:
+    return self.__run(self.__storage.load_all())
+
+  @override
+  def count(self) -> int:
+    return self.__run(self.__storage.count())
+
+  @override
+  def delete(self, obj_id: int) -> bool:
+    return self.__run(self.__storage.delete(obj_id))
+
+  @override
+  def delete_many(self, obj_ids: Iterable[int]) -> int:
+    return self.__run(self.__storage.delete_many(obj_ids))
+
+  @override
+  def delete_all(self) -> int:
+    return self.__run(self.__storage.delete_all())
+
+  @property
+  @override
+  def stats(self) -> dict[str, int | float]:
+    return self.__storage.stats
+
+  def close(self):
+    with self.__lock:
+      self.__runner.run(self.__storage.close())
+      self.__runner.close()
+
+  def __run(self, coro: Coroutine[Any, Any, R]) -> R:
+    # All calls share one event loop, so loop-bound resources
+    # of the async storage (e.g. HTTP sessions) are reused
+
+    with self.__lock:
+      return self.__runner.run(coro)
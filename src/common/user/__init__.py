@@ -2,3 +2,5 @@ from .admin import *
 from .moderator import *
 from .user import *
 from .user_manager import *
+from .user_query import *
+from .user_versions import *
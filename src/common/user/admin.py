@@ -2,11 +2,14 @@ from collections.abc import Iterable
 from typing import Any, override
 
 from .moderator import Moderator
+from .user import User
 
 __all__ = ["Admin"]
 
 
 class Admin(Moderator):
+  __slots__ = ("_created_pages",)
+
   role = "admin"
 
   _created_pages: frozenset[str]
@@ -20,7 +23,8 @@ class Admin(Moderator):
   ):
     super().__init__(login, name, verified_users)
 
-    self._created_pages = frozenset(created_pages)
+    self._created_pages = User._compact_set(created_pages)
+    self.mark_dirty("created_pages")
 
   @override
   def toDict(self) -> dict[str, Any]:
@@ -34,7 +38,23 @@ class Admin(Moderator):
 
   @created_pages.setter
   def created_pages(self, new_created_pages: Iterable[str]):
-    self._created_pages = frozenset(filter(lambda p: len(p) > 0, map(str.strip, new_created_pages)))
+    created_pages = User._compact_set(filter(lambda p: len(p) > 0, map(str.strip, new_created_pages)))
+
+    if created_pages != self._created_pages:
+      self._created_pages = created_pages
+      self.mark_dirty("created_pages")
+
+  @override
+  def __getstate__(self) -> dict[str, Any]:
+    state = super().__getstate__()
+    state["_created_pages"] = self._created_pages
+    return state
+
+  @override
+  def __setstate__(self, state: dict[str, Any]):
+    super().__setstate__(state)
+
+    self._created_pages = User._compact_set(state["_created_pages"])
 
   def __repr__(self) -> str:
     return (
@@ -1,3 +1,4 @@
+import sys
 from collections.abc import Iterable
 from typing import Any, override
 
@@ -7,6 +8,8 @@ __all__ = ["Moderator"]
 
 
 class Moderator(User):
+  __slots__ = ("_verified_users",)
+
   role = "moderator"
 
   _verified_users: frozenset[str]
@@ -19,7 +22,8 @@ class Moderator(User):
   ):
     super().__init__(login, name)
 
-    self._verified_users = frozenset(verified_users)
+    self._verified_users = User._compact_set(map(sys.intern, verified_users))
+    self.mark_dirty("verified_users")
 
   @override
   def toDict(self) -> dict[str, Any]:
@@ -36,9 +40,25 @@ class Moderator(User):
     def normalize_and_check_login(login: str) -> str:
       login = User.normalize_login(login)
       User.check_normalized_login(login)
-      return login
+      return sys.intern(login)
+
+    verified_users = User._compact_set(map(normalize_and_check_login, new_verified_users))
+
+    if verified_users != self._verified_users:
+      self._verified_users = verified_users
+      self.mark_dirty("verified_users")
+
+  @override
+  def __getstate__(self) -> dict[str, Any]:
+    state = super().__getstate__()
+    state["_verified_users"] = self._verified_users
+    return state
+
+  @override
+  def __setstate__(self, state: dict[str, Any]):
+    super().__setstate__(state)
 
-    self._verified_users = frozenset(map(normalize_and_check_login, new_verified_users))
+    self._verified_users = User._compact_set(map(sys.intern, state["_verified_users"]))
 
   def __repr__(self) -> str:
     return (
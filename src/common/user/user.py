@@ -1,4 +1,5 @@
 import re
+from collections.abc import Iterable
 from typing import Any, Final, override
 
 from common.io.storage import Identifiable
@@ -52,14 +53,36 @@ class User(Identifiable, ToDictConvertible):
   def normalize_name(name: str | None) -> str | None:
     return None if name is None else re.sub("\\s+", " ", name.strip())
 
+  # Every enabled storage keeps all of its users in memory,
+  # so users have no __dict__, logins referenced by moderators
+  # are interned and all empty sets are the same object
+
+  __slots__ = ("_login", "_name", "_dirty_fields")
+
+  EMPTY_SET = frozenset[str]()
+
+  @staticmethod
+  def _compact_set(items: Iterable[str]) -> frozenset[str]:
+    items = frozenset(items)
+
+    return User.EMPTY_SET if len(items) == 0 else items
+
   role = "user"
 
   _login: str
   _name: str | None
+  _dirty_fields: frozenset[str]
 
   def __init__(self, login: str = "user", name: str | None = None):
     super().__init__()
 
+    # Slots are filled up front, setters
+    # then don't have to check for unset ones
+
+    self._login = ""
+    self._name = None
+    self._dirty_fields = User.EMPTY_SET
+
     self.login = login
     self.name = name
 
@@ -72,6 +95,35 @@ class User(Identifiable, ToDictConvertible):
       "name": self.name,
     }
 
+  @property
+  def is_dirty(self) -> bool:
+    return len(self._dirty_fields) > 0
+
+  def get_dirty_fields(self) -> frozenset[str]:
+    return self._dirty_fields
+
+  def mark_dirty(self, field: str):
+    self._dirty_fields = self._dirty_fields | {field}
+
+  def mark_clean(self):
+    self._dirty_fields = User.EMPTY_SET
+
+  # The state is the same dict dict-backed users were pickled with,
+  # so pickles written before __slots__ were added still load
+
+  def __getstate__(self) -> dict[str, Any]:
+    return {
+      "_id": self._id,
+      "_login": self._login,
+      "_name": self._name,
+    }
+
+  def __setstate__(self, state: dict[str, Any]):
+    self._id = state["_id"]
+    self._login = state["_login"]
+    self._name = state["_name"]
+    self._dirty_fields = User.EMPTY_SET
+
   @property
   def login(self) -> str:
     return self._login
@@ -80,7 +132,10 @@ class User(Identifiable, ToDictConvertible):
   def login(self, new_login: str):
     new_login = User.normalize_login(new_login)
     User.check_normalized_login(new_login)
-    self._login = new_login
+
+    if new_login != self._login:
+      self._login = new_login
+      self.mark_dirty("login")
 
   @property
   def name(self) -> str | None:
@@ -90,7 +145,10 @@ class User(Identifiable, ToDictConvertible):
   def name(self, new_name: str | None):
     new_name = User.normalize_name(new_name)
     User.check_normalized_name(new_name)
-    self._name = new_name
+
+    if new_name != self._name:
+      self._name = new_name
+      self.mark_dirty("name")
 
   def __repr__(self) -> str:
     return f"User(login={repr(self.login)},\n" + f"     name={repr(self.name)})"
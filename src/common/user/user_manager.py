@@ -1,31 +1,104 @@
-from typing import Any
+from collections import OrderedDict
+from collections.abc import Iterable
+from contextlib import suppress
+from threading import Lock
+from time import monotonic
+from typing import Any, cast
 
 from common.io.dialog import Dialog
 from common.io.storage import Storage
 
 from .user import User
+from .user_query import UserQuery
+from .user_versions import UserVersions
 
 __all__ = ["UserManager"]
 
 
 class UserManager:
+  # With a cache_size users aren't loaded up front, the manager
+  # keeps only the most recently used ones and asks the storage
+  # for the rest. Login lookups of users which aren't
+  # loaded use the storage's load_by_login.
+  # Changes made through the manager and its views
+  # are counted by the shared versions.
+  # With a refresh_interval users changed by other processes
+  # are reloaded (or dropped from the cache if lazy) on refresh
+
   storage: Storage[User]
   dialog: Dialog | None
+  flush_interval: float | None
+  cache_size: int | None
+  refresh_interval: float | None
+  versions: UserVersions
 
   __users: dict[int, User]
+  __ids_by_login: dict[str, int]
+  __logins_by_id: dict[int, str]
+  __deleted_ids: set[int]
+  __flush_lock: Lock
+  __last_flush: float
+  __refresh_lock: Lock
+  __last_refresh: float
+
+  def __init__(
+    self,
+    storage: Storage[User],
+    dialog: Dialog | None = None,
+    load_users: bool = True,
+    flush_interval: float | None = None,
+    cache_size: int | None = None,
+    versions: UserVersions | None = None,
+    refresh_interval: float | None = None,
+  ):
+    if cache_size is not None and cache_size <= 0:
+      raise ValueError("cache_size must be positive")
 
-  def __init__(self, storage: Storage[User], dialog: Dialog | None = None, load_users: bool = True):
     self.storage = storage
     self.dialog = dialog
-
-    if load_users:
+    self.flush_interval = flush_interval
+    self.cache_size = cache_size
+    self.refresh_interval = refresh_interval
+    self.versions = UserVersions() if versions is None else versions
+
+    self.__flush_lock = Lock()
+    self.__last_flush = monotonic()
+    self.__refresh_lock = Lock()
+    self.__last_refresh = monotonic()
+    self.__users = {} if cache_size is None else OrderedDict()
+    self.__ids_by_login = {}
+    self.__logins_by_id = {}
+    self.__deleted_ids = set()
+
+    # Changes are tracked from before the users are loaded,
+    # so nothing written in between is missed
+
+    if load_users and refresh_interval is not None:
+      storage.poll_changes()
+
+    if load_users and not self.lazy:
       self.load_all_users()
-    else:
-      self.__users = {}
+
+  @property
+  def lazy(self) -> bool:
+    return self.cache_size is not None
+
+  @property
+  def versioned(self) -> bool:
+    # Lazy managers load users straight from the storage, so without
+    # refreshes versions miss changes made by other processes
+
+    return not self.lazy or self.refresh_interval is not None
 
   def show_all_users(self) -> Any:
     dialog = self.get_dialog()
-    users = self.__users.values()
+    users = self.get_all_users()
+
+    return dialog.show_many(users)
+
+  def show_users(self, user_ids: Iterable[int]) -> Any:
+    dialog = self.get_dialog()
+    users = self.get_users(user_ids)
 
     return dialog.show_many(users)
 
@@ -38,8 +111,17 @@ class UserManager:
   def prompt_user(self, user: User):
     dialog = self.get_dialog()
 
-    dialog.prompt_all_attrs(user)
-    self.add_user(user)
+    try:
+      dialog.prompt_all_attrs(user)
+      self.add_user(user)
+    except ValueError:
+      # Attributes prompted before the failure
+      # have already changed the managed user
+
+      if self.__users.get(user.id) is user:
+        self.versions.touch([user.id])
+
+      raise
 
   def get_dialog(self) -> Dialog:
     if self.dialog is None:
@@ -48,40 +130,158 @@ class UserManager:
     return self.dialog
 
   def add_user(self, user: User):
-    old_user = self.__users.get(user.id)
+    self.check_user_login(user)
 
-    if old_user is None or user is not old_user:
-      if self.exists_user_with_login(user.login):
+    if not self.__can_defer_persist(user):
+      self.storage.persist(user)
+      user.mark_clean()
+
+    self.__index_user(user)
+    self.versions.touch([user.id])
+
+  def add_users(self, users: Iterable[User]):
+    users = list(users)
+    new_logins = set[str]()
+
+    for user in users:
+      if user.login in new_logins:
         raise ValueError(f'User with login "{user.login}" already exists')
 
-      self.storage.persist(user)
-      self.__users[user.id] = user
-    else:
-      self.storage.persist(user)
+      self.check_user_login(user)
+      new_logins.add(user.login)
+
+    users_to_persist = [user for user in users if not self.__can_defer_persist(user)]
+
+    self.storage.persist_many(users_to_persist)
+
+    for user in users_to_persist:
+      user.mark_clean()
+
+    for user in users:
+      self.__index_user(user)
+
+    if len(users) > 0:
+      self.versions.touch(user.id for user in users)
 
   @property
   def user_count(self) -> int:
-    return len(self.__users)
+    return self.storage.count() if self.lazy else len(self.__users)
 
   def get_user(self, user_id: int) -> User | None:
-    return self.__users.get(user_id)
+    user = self.__users.get(user_id)
+
+    if not self.lazy:
+      return user
+
+    if user is None:
+      return self.load_user(user_id)
+
+    self.__touch(user_id)
+
+    return user
+
+  def get_user_by_login(self, user_login: str) -> User | None:
+    user_id = self.__ids_by_login.get(user_login)
+
+    if user_id is not None or not self.lazy:
+      return None if user_id is None else self.get_user(user_id)
+
+    user = self.storage.load_by_login(user_login)
+
+    if user is None:
+      return None
+
+    user = self.__cache([user])[0]
+
+    # The cached user may have been renamed
+    # without being persisted yet
+
+    return user if user.login == user_login else None
+
+  def get_users(self, user_ids: Iterable[int]) -> list[User]:
+    if not self.lazy:
+      users = map(self.__users.get, user_ids)
+
+      return [user for user in users if user is not None]
+
+    # Loaded users are collected apart from the cache,
+    # which may evict some of them right away
+
+    user_ids = list(user_ids)
+    users_by_id = {user_id: self.__users[user_id] for user_id in user_ids if user_id in self.__users}
+    missing_ids = [user_id for user_id in user_ids if user_id not in users_by_id]
+
+    if len(missing_ids) > 0:
+      for user in self.__cache(self.storage.load_many(missing_ids)):
+        users_by_id[user.id] = user
+
+    users = map(users_by_id.get, user_ids)
+
+    return [user for user in users if user is not None]
+
+  def query_users(self, query: UserQuery) -> list[User]:
+    if not self.lazy:
+      return query.apply(self.__users.values())
+
+    # Pages of unfiltered users in id order are read
+    # straight from the storage, other queries scan it
+
+    if query.sort == "id" and not query.descending and not query.filtered and query.offset == 0:
+      return self.__merge(self.storage.load_page(query.after_id, query.limit))
+
+    return query.apply(self.get_all_users())
 
   def get_all_users(self) -> list[User]:
+    if self.lazy:
+      return self.__merge(self.storage.load_all())
+
     return list(self.__users.values())
 
   def delete_user(self, user_id: int) -> bool:
-    try:
-      self.__users.pop(user_id)
-      self.storage.delete(user_id)
-      return True
-    except KeyError:
-      return False
+    if self.lazy:
+      self.__unindex_user(user_id)
+      self.__track_deleted([user_id])
+      deleted = self.storage.delete(user_id)
+    else:
+      deleted = self.__unindex_user(user_id) is not None
+
+      if deleted:
+        self.storage.delete(user_id)
+
+    if deleted:
+      self.versions.remove([user_id])
+
+    return deleted
+
+  def delete_users(self, user_ids: Iterable[int]) -> int:
+    if self.lazy:
+      user_ids = list(user_ids)
+
+      for user_id in user_ids:
+        self.__unindex_user(user_id)
+
+      self.__track_deleted(user_ids)
+      deleted = self.storage.delete_many(user_ids)
+      deleted_ids = user_ids
+    else:
+      deleted_ids = [user_id for user_id in user_ids if self.__unindex_user(user_id) is not None]
+      deleted = len(deleted_ids)
+
+      self.storage.delete_many(deleted_ids)
+
+    if deleted > 0:
+      self.versions.remove(deleted_ids)
+
+    return deleted
 
   def delete_all_users(self) -> int:
     count = self.user_count
 
     self.__users.clear()
+    self.__ids_by_login.clear()
+    self.__logins_by_id.clear()
     self.storage.delete_all()
+    self.versions.touch_all()
 
     return count
 
@@ -91,13 +291,29 @@ class UserManager:
     if user is None:
       return None
 
-    self.__users[user.id] = user
+    user.mark_clean()
+    self.__index_user(user)
 
     return user
 
   def load_all_users(self) -> list[User]:
-    self.__users = {user.id: user for user in self.storage.load_all()}
-    return self.get_all_users()
+    users = list(self.storage.load_all())
+
+    for user in users:
+      user.mark_clean()
+
+    # Cleared in place since views share these dicts
+
+    self.__users.clear()
+    self.__ids_by_login.clear()
+    self.__logins_by_id.clear()
+
+    for user in users:
+      self.__index_user(user)
+
+    self.versions.touch_all()
+
+    return users
 
   def persist_user(self, user_id: int) -> bool:
     user = self.get_user(user_id)
@@ -105,22 +321,83 @@ class UserManager:
     if user is None:
       return False
 
+    self.check_user_login(user)
     self.storage.persist(user)
+    user.mark_clean()
+    self.__index_user(user)
+    self.versions.touch([user_id])
 
     return True
 
   def persist_all_users(self):
-    for user in self.__users.values():
-      self.storage.persist(user)
+    self.__persist_users(list(self.__users.values()))
+
+  def persist_dirty_users(self) -> int:
+    return self.__persist_users([user for user in list(self.__users.values()) if user.is_dirty])
+
+  def flush(self, force: bool = False) -> int:
+    if not force and self.flush_interval is not None and monotonic() - self.__last_flush < self.flush_interval:
+      return 0
+
+    with self.__flush_lock:
+      self.__last_flush = monotonic()
+      return self.persist_dirty_users()
+
+  def refresh(self, force: bool = False) -> int:
+    if self.refresh_interval is None:
+      return 0
+
+    if not force and monotonic() - self.__last_refresh < self.refresh_interval:
+      return 0
+
+    # Requests coming while another thread
+    # is refreshing are served without waiting
+
+    if not self.__refresh_lock.acquire(blocking=False):
+      return 0
+
+    try:
+      self.__last_refresh = monotonic()
+      user_ids = self.storage.poll_changes()
+
+      if user_ids is None:
+        return self.__refresh_all_users()
+
+      return self.__refresh_users(user_ids)
+    finally:
+      self.__refresh_lock.release()
 
   def exists_user_with_login(self, user_login: str) -> bool:
-    for user in self.__users.values():
-      if user.login == user_login:
-        return True
+    if self.lazy:
+      return self.get_user_by_login(user_login) is not None
+
+    return user_login in self.__ids_by_login
+
+  def check_user_login(self, user: User):
+    if self.lazy:
+      owner = self.get_user_by_login(user.login)
+      owner_id = None if owner is None else owner.id
+    else:
+      owner_id = self.__ids_by_login.get(user.login)
 
-    return False
+    if owner_id is None or owner_id == user.id:
+      return
+
+    login = user.login
+    old_login = self.__logins_by_id.get(user.id)
+
+    # The login of a managed user has been changed in place
+    # to an already taken one, so the rename is rolled back
+
+    if old_login is not None and self.__users.get(user.id) is user:
+      user.login = old_login
+
+    raise ValueError(f'User with login "{login}" already exists')
 
   def exists_user_with_id(self, user_id: int) -> bool:
+    if self.lazy:
+      return self.get_user(user_id) is not None
+
     return user_id in self.__users
 
   def view(self, **kwargs: Dialog | Storage | None) -> "UserManager":
@@ -134,8 +411,222 @@ class UserManager:
     if dialog is not None and not isinstance(dialog, Dialog):
       raise ValueError("dialog kwarg must be of None of Dialog type")
 
-    manager = UserManager(storage, dialog, load_users=False)
+    manager = UserManager(
+      storage,
+      dialog,
+      load_users=False,
+      flush_interval=self.flush_interval,
+      cache_size=self.cache_size,
+      versions=self.versions,
+      refresh_interval=self.refresh_interval,
+    )
 
     manager.__users = self.__users
+    manager.__ids_by_login = self.__ids_by_login
+    manager.__logins_by_id = self.__logins_by_id
+    manager.__deleted_ids = self.__deleted_ids
 
     return manager
+
+  def __can_defer_persist(self, user: User) -> bool:
+    # Write-behind only applies to updates of managed users,
+    # new ones have to be persisted right away to get an id
+
+    return self.flush_interval is not None and user.id >= 0 and self.__users.get(user.id) is user
+
+  def __persist_users(self, users: list[User]) -> int:
+    if len(users) == 0:
+      return 0
+
+    for user in users:
+      with suppress(ValueError):
+        self.check_user_login(user)
+
+    self.storage.persist_many(users)
+
+    for user in users:
+      user.mark_clean()
+      self.__index_user(user)
+
+    self.versions.touch(user.id for user in users)
+
+    return len(users)
+
+  def __refresh_users(self, user_ids: Iterable[int]) -> int:
+    # Users with deferred updates are kept as they are,
+    # their changes win once flushed
+
+    user_ids = [user_id for user_id in dict.fromkeys(user_ids) if not self.__is_dirty(user_id)]
+
+    if len(user_ids) == 0:
+      return 0
+
+    if self.lazy:
+      return self.__refresh_cached_users(user_ids)
+
+    users_by_id = {user.id: user for user in self.storage.load_many(user_ids)}
+    changed_ids = list[int]()
+    deleted_ids = list[int]()
+
+    # Changes made by this process are reported too,
+    # those are found equal to the managed users and skipped
+
+    for user_id in user_ids:
+      user = users_by_id.get(user_id)
+      managed_user = self.__users.get(user_id)
+
+      if user is None:
+        if self.__unindex_user(user_id) is not None:
+          deleted_ids.append(user_id)
+      elif managed_user is None or managed_user.toDict() != user.toDict():
+        user.mark_clean()
+        self.__index_user(user)
+        changed_ids.append(user_id)
+
+    if len(changed_ids) > 0:
+      self.versions.touch(changed_ids)
+
+    if len(deleted_ids) > 0:
+      self.versions.remove(deleted_ids)
+
+    return len(changed_ids) + len(deleted_ids)
+
+  def __refresh_cached_users(self, user_ids: list[int]) -> int:
+    # Changes made by this process are reported too, those are found
+    # equal to the cached users or among the deleted ones and skipped.
+    # Changed users which aren't cached may have been served
+    # with the floor version, so it's raised past theirs
+
+    users_by_id = {user.id: user for user in self.storage.load_many(user_ids)}
+    changed_ids = list[int]()
+
+    for user_id in user_ids:
+      user = users_by_id.get(user_id)
+      cached_user = self.__users.get(user_id)
+      deleted = user_id in self.__deleted_ids
+
+      self.__deleted_ids.discard(user_id)
+
+      if user is None and cached_user is None and deleted:
+        continue
+
+      if user is not None and cached_user is not None and user.toDict() == cached_user.toDict():
+        continue
+
+      changed_ids.append(user_id)
+
+    if len(changed_ids) == 0:
+      return 0
+
+    self.versions.touch(changed_ids)
+
+    for user_id in changed_ids:
+      if self.__unindex_user(user_id) is None:
+        self.versions.forget(user_id)
+
+    return len(changed_ids)
+
+  def __refresh_all_users(self) -> int:
+    self.__deleted_ids.clear()
+
+    if not self.lazy:
+      return self.__refresh_users({*self.__users, *self.storage.load_all_ids()})
+
+    user_ids = [user_id for user_id in list(self.__users) if not self.__is_dirty(user_id)]
+
+    for user_id in user_ids:
+      self.__unindex_user(user_id)
+
+    self.versions.touch_all()
+
+    return len(user_ids)
+
+  def __track_deleted(self, user_ids: Iterable[int]):
+    # Deletions are only told apart from other processes' ones on refresh
+
+    if self.refresh_interval is not None:
+      self.__deleted_ids.update(user_ids)
+
+  def __is_dirty(self, user_id: int) -> bool:
+    user = self.__users.get(user_id)
+
+    return user is not None and user.is_dirty
+
+  def __index_user(self, user: User):
+    old_login = self.__logins_by_id.get(user.id)
+
+    if old_login is not None and self.__ids_by_login.get(old_login) == user.id:
+      del self.__ids_by_login[old_login]
+
+    self.__users[user.id] = user
+    self.__ids_by_login[user.login] = user.id
+    self.__logins_by_id[user.id] = user.login
+
+    if self.lazy:
+      self.__touch(user.id)
+      self.__evict()
+
+  def __touch(self, user_id: int):
+    if self.lazy:
+      with suppress(KeyError):
+        cast(OrderedDict[int, User], self.__users).move_to_end(user_id)
+
+  def __evict(self):
+    # Users with deferred updates are persisted
+    # before they're dropped from the cache
+
+    while len(self.__users) > cast(int, self.cache_size):
+      try:
+        user_id = next(iter(self.__users))
+      except (StopIteration, RuntimeError):
+        return
+
+      user = self.__unindex_user(user_id)
+      self.versions.forget(user_id)
+
+      if user is not None and user.is_dirty:
+        self.storage.persist(user)
+        user.mark_clean()
+
+  def __cache(self, users: Iterable[User]) -> list[User]:
+    cached = list[User]()
+
+    for user in users:
+      cached_user = self.__users.get(user.id)
+
+      if cached_user is None:
+        user.mark_clean()
+        self.__index_user(user)
+        cached_user = user
+      else:
+        self.__touch(user.id)
+
+      cached.append(cached_user)
+
+    return cached
+
+  def __merge(self, users: Iterable[User]) -> list[User]:
+    # Loaded users are replaced with cached ones, which
+    # may hold updates that aren't persisted yet
+
+    merged = list[User]()
+
+    for user in users:
+      cached_user = self.__users.get(user.id)
+
+      if cached_user is None:
+        user.mark_clean()
+        merged.append(user)
+      else:
+        merged.append(cached_user)
+
+    return merged
+
+  def __unindex_user(self, user_id: int) -> User | None:
+    user = self.__users.pop(user_id, None)
+    login = self.__logins_by_id.pop(user_id, None)
+
+    if login is not None and self.__ids_by_login.get(login) == user_id:
+      del self.__ids_by_login[login]
+
+    return user
@@ -0,0 +1,97 @@
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from heapq import nlargest, nsmallest
+from typing import Any, ClassVar
+
+from .user import User
+
+__all__ = ["UserQuery"]
+
+
+@dataclass
+class UserQuery:
+  SORT_KEYS: ClassVar[tuple[str, ...]] = ("id", "login", "name", "role")
+
+  role: str | None = None
+  login_prefix: str | None = None
+  sort: str = "id"
+  descending: bool = False
+  after_id: int | None = None
+  offset: int = 0
+  limit: int | None = None
+
+  def __post_init__(self):
+    if self.sort not in UserQuery.SORT_KEYS:
+      raise ValueError(f"Bad sort key: {repr(self.sort)}")
+
+    if self.after_id is not None and self.sort != "id":
+      raise ValueError("after_id can only be used when sorting by id")
+
+    if self.offset < 0:
+      raise ValueError("offset must be non-negative")
+
+    if self.limit is not None and self.limit < 0:
+      raise ValueError("limit must be non-negative")
+
+  @property
+  def filtered(self) -> bool:
+    return self.role is not None or self.login_prefix is not None
+
+  def matches(self, user: User) -> bool:
+    if self.role is not None and user.role != self.role:
+      return False
+
+    if self.login_prefix is not None and not user.login.startswith(self.login_prefix):
+      return False
+
+    if self.after_id is not None:
+      return user.id < self.after_id if self.descending else user.id > self.after_id
+
+    return True
+
+  def apply(self, users: Iterable[User]) -> list[User]:
+    users = filter(self.matches, users)
+    key = self.__sort_key()
+
+    if self.limit is None:
+      return sorted(users, key=key, reverse=self.descending)[self.offset :]
+
+    # Only offset + limit users have to be ordered,
+    # so the whole collection is never sorted
+
+    select = nlargest if self.descending else nsmallest
+
+    return select(self.offset + self.limit, users, key=key)[self.offset :]
+
+  def next_page(self, page: list[User]) -> "UserQuery | None":
+    if self.limit is None or len(page) < self.limit or self.limit == 0:
+      return None
+
+    if self.sort == "id":
+      return UserQuery(
+        role=self.role,
+        login_prefix=self.login_prefix,
+        descending=self.descending,
+        after_id=page[-1].id,
+        limit=self.limit,
+      )
+
+    return UserQuery(
+      role=self.role,
+      login_prefix=self.login_prefix,
+      sort=self.sort,
+      descending=self.descending,
+      offset=self.offset + self.limit,
+      limit=self.limit,
+    )
+
+  def __sort_key(self) -> Callable[[User], Any]:
+    match self.sort:
+      case "login":
+        return lambda user: (user.login, user.id)
+      case "name":
+        return lambda user: (user.name is None, user.name or "", user.id)
+      case "role":
+        return lambda user: (user.role, user.id)
+      case _:
+        return lambda user: user.id
@@ -0,0 +1,79 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+from secrets import token_hex
+from threading import Lock
+
+__all__ = ["UserVersion", "UserVersions"]
+
+
+@dataclass(frozen=True)
+class UserVersion:
+  epoch: str
+  number: int
+
+  @property
+  def tag(self) -> str:
+    return f"{self.epoch}-{self.number}"
+
+
+class UserVersions:
+  # Every change takes the next number of a single counter, which
+  # the changed users keep as their own version. Users unchanged since
+  # the counters were created, or whose versions have been forgotten,
+  # share the floor version. Forgetting a user raises the floor to its
+  # version, so versions never go back. The random epoch tells apart
+  # counters of different processes
+
+  __epoch: str
+  __number: int
+  __floor: int
+  __users: dict[int, int]
+  __lock: Lock
+
+  def __init__(self):
+    self.__epoch = token_hex(4)
+    self.__number = 0
+    self.__floor = 0
+    self.__users = {}
+    self.__lock = Lock()
+
+  @property
+  def epoch(self) -> str:
+    return self.__epoch
+
+  @property
+  def collection(self) -> UserVersion:
+    with self.__lock:
+      return UserVersion(self.__epoch, self.__number)
+
+  def get_user(self, user_id: int) -> UserVersion:
+    with self.__lock:
+      number = self.__users.get(user_id, self.__floor)
+
+    return UserVersion(self.__epoch, number)
+
+  def touch(self, user_ids: Iterable[int] = ()):
+    with self.__lock:
+      self.__number += 1
+
+      for user_id in user_ids:
+        self.__users[user_id] = self.__number
+
+  def touch_all(self):
+    with self.__lock:
+      self.__number += 1
+      self.__floor = self.__number
+      self.__users.clear()
+
+  def remove(self, user_ids: Iterable[int]):
+    # Removed users keep the version they were removed at,
+    # so tags sent for them earlier never match again
+
+    self.touch(user_ids)
+
+  def forget(self, user_id: int):
+    with self.__lock:
+      version = self.__users.pop(user_id, None)
+
+      if version is not None and version > self.__floor:
+        self.__floor = version
@@ -5,5 +5,7 @@ __all__ = ["ToDictConvertible"]
 
 
 class ToDictConvertible(ABC):
+  __slots__ = ()
+
   @abstractmethod
   def toDict(self) -> dict[str, Any]: ...
@@ -3,9 +3,11 @@ from collections.abc import Iterable
 from dataclasses import dataclass
 from types import NoneType, UnionType
 from typing import Any, TypeVar, Union, cast, get_args, get_origin, get_type_hints
+from weakref import WeakKeyDictionary
 
 __all__ = [
   "AttrInfo",
+  "clear_attrs_schema_cache",
   "get_all_typed_attrs_info",
   "get_attr_info",
   "cast_text",
@@ -139,20 +141,40 @@ class AttrInfo:
     )
 
 
+@dataclass(frozen=True)
+class _AttrSchema:
+  name: str
+  value_type: Any = None
+  value_set_type: Any = None
+  readonly: bool = False
+
+
+_attrs_schema_cache = WeakKeyDictionary[type, tuple[_AttrSchema, ...]]()
+_attr_schema_cache = WeakKeyDictionary[type, dict[str, _AttrSchema]]()
+
+
+def clear_attrs_schema_cache(obj_type: type | None = None):
+  # Needed only if a class is changed at runtime,
+  # e.g. when a property is added or re-annotated
+
+  if obj_type is None:
+    _attrs_schema_cache.clear()
+    _attr_schema_cache.clear()
+  else:
+    _attrs_schema_cache.pop(obj_type, None)
+    _attr_schema_cache.pop(obj_type, None)
+
+
 def get_all_typed_attrs_info(obj: Any) -> dict[str, AttrInfo]:
-  type_hints = get_type_hints(type(obj))
   all_attrs_info = dict[str, AttrInfo]()
 
-  for name in type_hints.keys():
-    while name.startswith("_"):
-      name = name[1:]
-
-    attr_info = get_attr_info(obj, name, type_hints)
+  for schema in _get_attrs_schema(type(obj)):
+    attr_info = _make_attr_info(obj, schema)
 
     if attr_info is None:
       continue
 
-    all_attrs_info[name] = attr_info
+    all_attrs_info[schema.name] = attr_info
 
   return all_attrs_info
 
@@ -162,48 +184,83 @@ def get_attr_info(
   name: str,
   type_hints: dict[str, Any] | None = None,
 ) -> AttrInfo | None:
-  if not hasattr(obj, name) or name.startswith("_"):
+  if name.startswith("_"):
     return None
 
   obj_type = type(obj)
 
-  if type_hints is None:
-    type_hints = get_type_hints(obj_type)
+  if type_hints is not None:
+    return _make_attr_info(obj, _compile_attr_schema(obj_type, name, type_hints))
+
+  schemas = _attr_schema_cache.get(obj_type)
+
+  if schemas is None:
+    schemas = _attr_schema_cache[obj_type] = {}
+
+  schema = schemas.get(name)
+
+  if schema is None:
+    schema = schemas[name] = _compile_attr_schema(obj_type, name, get_type_hints(obj_type))
 
-  value = getattr(obj, name)
-  value_type = type_hints.get(name)
+  return _make_attr_info(obj, schema)
 
-  if value_type is None:
-    value_type = type_hints.get("_" + name, type(value))
 
+def _get_attrs_schema(obj_type: type) -> tuple[_AttrSchema, ...]:
+  schemas = _attrs_schema_cache.get(obj_type)
+
+  if schemas is not None:
+    return schemas
+
+  type_hints = get_type_hints(obj_type)
+  names = dict[str, None]()
+
+  for name in type_hints.keys():
+    names[name.lstrip("_")] = None
+
+  schemas = tuple(_compile_attr_schema(obj_type, name, type_hints) for name in names)
+  _attrs_schema_cache[obj_type] = schemas
+
+  return schemas
+
+
+def _compile_attr_schema(obj_type: type, name: str, type_hints: dict[str, Any]) -> _AttrSchema:
+  # A None type stands for the type of the attribute's
+  # current value and is resolved by AttrInfo itself
+
+  value_type = type_hints.get(name, type_hints.get("_" + name))
   attr = getattr(obj_type, name, None)
 
-  if isinstance(attr, property):
-    value_type = get_type_hints(attr.fget).get("return", value_type) if attr.fget is not None else value_type
+  if not isinstance(attr, property):
+    return _AttrSchema(name, value_type, value_type)
 
-    if attr.fset is None:
-      value_set_type = value_type
-      readonly = True
-    else:
-      setter_type_hints = get_type_hints(attr.fset)
+  if attr.fget is not None:
+    value_type = get_type_hints(attr.fget).get("return", value_type)
 
-      if len(setter_type_hints) > 0:
-        setter_arg_name = next(iter(setter_type_hints))
-        value_set_type = setter_type_hints[setter_arg_name]
-      else:
-        value_set_type = value_type
+  if attr.fset is None:
+    return _AttrSchema(name, value_type, value_type, readonly=True)
 
-      readonly = False
+  setter_type_hints = get_type_hints(attr.fset)
+
+  if len(setter_type_hints) > 0:
+    value_set_type = setter_type_hints[next(iter(setter_type_hints))]
   else:
     value_set_type = value_type
-    readonly = False
+
+  return _AttrSchema(name, value_type, value_set_type)
+
+
+def _make_attr_info(obj: Any, schema: _AttrSchema) -> AttrInfo | None:
+  try:
+    value = getattr(obj, schema.name)
+  except AttributeError:
+    return None
 
   return AttrInfo(
-    name=name,
+    name=schema.name,
     value=value,
-    value_type=value_type,
-    value_set_type=value_set_type,
-    readonly=readonly,
+    value_type=schema.value_type,
+    value_set_type=schema.value_set_type,
+    readonly=schema.readonly,
   )
 
 
@@ -1,3 +1,4 @@
 from . import blueprint, io, user, util
+from .app import *
 from .arg_parser import *
 from .config import *
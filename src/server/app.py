@@ -0,0 +1,152 @@
+import sys
+from collections.abc import Sequence
+from random import randint
+
+from flask import Flask
+
+from common.io.storage import CachingStorage, Storage
+from common.user import User, UserManager
+
+from .arg_parser import arg_parser
+from .blueprint.api import create_blueprint as create_api_blueprint
+from .blueprint.web import create_blueprint as create_web_blueprint
+from .config import Config
+from .io.storage import InstrumentedStorage, LogStorage, PickleStorage
+from .multi_user_manager import MultiUserManager
+from .user.io.storage import PostgresUserStorage, Sqlite3UserStorage
+from .util.compression import compress_responses
+from .util.metrics import Metrics, instrument_app
+
+__all__ = [
+  "create_config",
+  "create_storage",
+  "create_multi_user_manager",
+  "create_app",
+  "create_metrics",
+]
+
+
+def create_config(args: Sequence[str] = sys.argv[1:]) -> Config:
+  parsed_args = arg_parser.parse_args(args)
+  args_dict = dict(parsed_args.__dict__)
+  enabled_str = args_dict.pop("enabled_storages", "pickle,sqlite3")
+  args_dict["enabled_storages"] = [s.strip() for s in str(enabled_str).split(",") if s.strip()]
+  lazy_str = args_dict.pop("lazy_storages", "")
+  args_dict["lazy_storages"] = [s.strip() for s in str(lazy_str).split(",") if s.strip()]
+  cached_str = args_dict.pop("cached_storages", "")
+  args_dict["cached_storages"] = [s.strip() for s in str(cached_str).split(",") if s.strip()]
+
+  config = Config(**args_dict)
+  return config
+
+
+def _postgres_conninfo(config: Config) -> str:
+  return (
+    f"host={config.postgres_host} port={config.postgres_port} "
+    f"dbname={config.postgres_db} user={config.postgres_user} "
+    f"password={config.postgres_password}"
+  )
+
+
+def create_storage(config: Config, storage_type: str) -> Storage[User]:
+  match storage_type:
+    case "pickle":
+      return PickleStorage(config.pickle_storage_dirname, fsync=config.pickle_storage_fsync)
+    case "log":
+      return LogStorage(
+        config.log_storage_filename,
+        fsync=config.log_storage_fsync,
+        mmap_reads=config.log_storage_mmap,
+        compact_ratio=config.log_storage_compact_ratio,
+      )
+    case "sqlite3":
+      return Sqlite3UserStorage(
+        config.sqlite3_storage_filename,
+        reuse_connections=config.sqlite3_reuse_connections,
+        journal_mode=config.sqlite3_journal_mode,
+        synchronous=config.sqlite3_synchronous,
+        cache_size=config.sqlite3_cache_size,
+        mmap_size=config.sqlite3_mmap_size,
+        busy_timeout=config.sqlite3_busy_timeout,
+      )
+    case "postgres":
+      return PostgresUserStorage(
+        _postgres_conninfo(config),
+        pooled=config.postgres_pool,
+        pool_min_size=config.postgres_pool_min,
+        pool_max_size=config.postgres_pool_max,
+        pool_max_idle=config.postgres_pool_max_idle,
+        pool_timeout=config.postgres_pool_timeout,
+        pool_check=config.postgres_pool_check,
+      )
+    case _:
+      raise ValueError(f"Unknown storage type: {storage_type}")
+
+
+def create_metrics(config: Config) -> Metrics | None:
+  return Metrics() if config.metrics else None
+
+
+def create_multi_user_manager(config: Config, metrics: Metrics | None = None) -> MultiUserManager:
+  managers: dict[str, UserManager] = {}
+  for name in config.enabled_storages:
+    storage = create_storage(config, name)
+    if name in config.cached_storages:
+      storage = CachingStorage(
+        storage,
+        max_entries=config.storage_cache_size,
+        max_bytes=config.storage_cache_bytes,
+        ttl=config.storage_cache_ttl,
+      )
+    if metrics is not None:
+      storage = InstrumentedStorage(storage, metrics, name)
+    cache_size = config.lazy_cache_size if name in config.lazy_storages else None
+    managers[name] = UserManager(
+      storage,
+      flush_interval=config.write_behind_interval,
+      cache_size=cache_size,
+      refresh_interval=config.refresh_interval,
+    )
+  return MultiUserManager(managers, config.enabled_storages)
+
+
+def create_app(config: Config, multi_manager: MultiUserManager, metrics: Metrics | None = None) -> Flask:
+  app = Flask(__name__)
+
+  if metrics is not None:
+    instrument_app(app, metrics, config.metrics_path, config.server_timing)
+
+  api_blueprint = create_api_blueprint(multi_manager)
+  web_blueprint = create_web_blueprint(multi_manager, config.fragment_cache_size)
+
+  if config.compression:
+    for blueprint in (api_blueprint, web_blueprint):
+      compress_responses(blueprint, config.compression_min_size, config.compression_level)
+
+  app.register_blueprint(api_blueprint, url_prefix=config.api_url_prefix)
+  app.register_blueprint(web_blueprint, url_prefix=config.web_url_prefix)
+
+  app.secret_key = read_or_create_secret_key_if_not_exists(config)
+
+  return app
+
+
+def read_or_create_secret_key_if_not_exists(config: Config) -> str:
+  try:
+    return read_secret_key(config)
+  except FileNotFoundError:
+    return create_secret_key(config)
+
+
+def read_secret_key(config: Config) -> str:
+  with open(config.secret_filename) as file:
+    return file.read()
+
+
+def create_secret_key(config: Config) -> str:
+  key = "".join([str(randint(0, 9)) for _ in range(config.secret_len)])
+
+  with open(config.secret_filename, "w") as file:
+    file.write(key)
+
+  return key
@@ -1,4 +1,4 @@
-from argparse import ArgumentError, ArgumentParser
+from argparse import ArgumentError, ArgumentParser, BooleanOptionalAction
 from gettext import gettext
 from typing import override
 
@@ -88,7 +88,7 @@ arg_parser.add_argument(
   "--enabled-storages",
   default="pickle,sqlite3",
   metavar="<pickle,sqlite3>",
-  help="comma-separated list of enabled storage backends (default: pickle,sqlite3)",
+  help="comma-separated list of enabled storage backends out of pickle, log, sqlite3, postgres (default: pickle,sqlite3)",
 )
 
 arg_parser.add_argument(
@@ -98,6 +98,42 @@ arg_parser.add_argument(
   help=f"name of the directory pickle storage uses to store database (default value is {repr(Config.pickle_storage_dirname)})",
 )
 
+arg_parser.add_argument(
+  "--pickle-storage-fsync",
+  default=Config.pickle_storage_fsync,
+  choices=["always", "batch", "never"],
+  help=f"when pickle storage fsyncs written files and its directory (default value is {repr(Config.pickle_storage_fsync)})",
+)
+
+arg_parser.add_argument(
+  "--log-storage-filename",
+  default=Config.log_storage_filename,
+  metavar="<filename>",
+  help=f"filename of the append-only log storage (default value is {repr(Config.log_storage_filename)})",
+)
+
+arg_parser.add_argument(
+  "--log-storage-fsync",
+  default=Config.log_storage_fsync,
+  action="store_true",
+  help="fsync the log storage after every write",
+)
+
+arg_parser.add_argument(
+  "--log-storage-mmap",
+  default=Config.log_storage_mmap,
+  action="store_true",
+  help="read objects of the log storage through a shared read-only memory map",
+)
+
+arg_parser.add_argument(
+  "--log-storage-compact-ratio",
+  default=Config.log_storage_compact_ratio,
+  type=float,
+  metavar="<ratio>",
+  help=f"share of garbage in the log storage which triggers compaction (default value is {Config.log_storage_compact_ratio})",
+)
+
 arg_parser.add_argument(
   "--sqlite3-storage-filename",
   default=Config.sqlite3_storage_filename,
@@ -105,6 +141,51 @@ arg_parser.add_argument(
   help=f"filename of the Sqlite3 database (default value is {repr(Config.sqlite3_storage_filename)})",
 )
 
+arg_parser.add_argument(
+  "--sqlite3-reuse-connections",
+  default=Config.sqlite3_reuse_connections,
+  action="store_true",
+  help="keep one Sqlite3 connection open per thread instead of connecting on every operation",
+)
+
+arg_parser.add_argument(
+  "--sqlite3-journal-mode",
+  default=Config.sqlite3_journal_mode,
+  choices=["delete", "truncate", "persist", "memory", "wal", "off"],
+  help=f"Sqlite3 journal mode (default value is {repr(Config.sqlite3_journal_mode)})",
+)
+
+arg_parser.add_argument(
+  "--sqlite3-synchronous",
+  default=Config.sqlite3_synchronous,
+  choices=["off", "normal", "full", "extra"],
+  help=f"Sqlite3 synchronous mode (default value is {repr(Config.sqlite3_synchronous)})",
+)
+
+arg_parser.add_argument(
+  "--sqlite3-cache-size",
+  default=Config.sqlite3_cache_size,
+  type=int,
+  metavar="<pages or -KiB>",
+  help=f"Sqlite3 page cache size (default value is {Config.sqlite3_cache_size})",
+)
+
+arg_parser.add_argument(
+  "--sqlite3-mmap-size",
+  default=Config.sqlite3_mmap_size,
+  type=int,
+  metavar="<bytes>",
+  help=f"maximum number of bytes of the Sqlite3 database to memory-map (default value is {Config.sqlite3_mmap_size})",
+)
+
+arg_parser.add_argument(
+  "--sqlite3-busy-timeout",
+  default=Config.sqlite3_busy_timeout,
+  type=float,
+  metavar="<seconds>",
+  help=f"time to wait for a locked Sqlite3 database (default value is {Config.sqlite3_busy_timeout})",
+)
+
 arg_parser.add_argument(
   "--postgres-host",
   default=Config.postgres_host,
@@ -141,6 +222,172 @@ arg_parser.add_argument(
   help="PostgreSQL password",
 )
 
+arg_parser.add_argument(
+  "--postgres-pool",
+  default=Config.postgres_pool,
+  action="store_true",
+  help="reuse PostgreSQL connections through a connection pool",
+)
+
+arg_parser.add_argument(
+  "--postgres-pool-min",
+  default=Config.postgres_pool_min,
+  type=int,
+  choices=range(0, 2**10),
+  metavar=f"[0-{2**10})",
+  help=f"minimum number of pooled PostgreSQL connections (default value is {Config.postgres_pool_min})",
+)
+
+arg_parser.add_argument(
+  "--postgres-pool-max",
+  default=Config.postgres_pool_max,
+  type=int,
+  choices=range(1, 2**10),
+  metavar=f"[1-{2**10})",
+  help=f"maximum number of pooled PostgreSQL connections (default value is {Config.postgres_pool_max})",
+)
+
+arg_parser.add_argument(
+  "--postgres-pool-max-idle",
+  default=Config.postgres_pool_max_idle,
+  type=float,
+  metavar="<seconds>",
+  help=f"time after which idle pooled connections are closed (default value is {Config.postgres_pool_max_idle})",
+)
+
+arg_parser.add_argument(
+  "--postgres-pool-timeout",
+  default=Config.postgres_pool_timeout,
+  type=float,
+  metavar="<seconds>",
+  help=f"maximum time to wait for a pooled connection (default value is {Config.postgres_pool_timeout})",
+)
+
+arg_parser.add_argument(
+  "--postgres-pool-check",
+  default=Config.postgres_pool_check,
+  action=BooleanOptionalAction,
+  help="check pooled connections before handing them out (enabled by default)",
+)
+
+arg_parser.add_argument(
+  "--lazy-storages",
+  default="",
+  metavar="<sqlite3,postgres>",
+  help="comma-separated list of storage backends whose users are loaded on demand instead of at startup (none by default)",
+)
+
+arg_parser.add_argument(
+  "--lazy-cache-size",
+  default=Config.lazy_cache_size,
+  type=int,
+  choices=range(1, 2**31),
+  metavar=f"[1-{2**31})",
+  help=f"number of users kept in memory by lazily loaded storages (default value is {Config.lazy_cache_size})",
+)
+
+arg_parser.add_argument(
+  "--cached-storages",
+  default="",
+  metavar="<postgres>",
+  help="comma-separated list of storage backends whose reads are cached in memory (none by default)",
+)
+
+arg_parser.add_argument(
+  "--storage-cache-size",
+  default=Config.storage_cache_size,
+  type=int,
+  choices=range(1, 2**31),
+  metavar=f"[1-{2**31})",
+  help=f"maximum number of entries cached per backend (default value is {Config.storage_cache_size})",
+)
+
+arg_parser.add_argument(
+  "--storage-cache-bytes",
+  default=Config.storage_cache_bytes,
+  type=int,
+  metavar="<bytes>",
+  help="maximum size of users cached per backend (unlimited by default)",
+)
+
+arg_parser.add_argument(
+  "--storage-cache-ttl",
+  default=Config.storage_cache_ttl,
+  type=float,
+  metavar="<seconds>",
+  help=f"time after which cached entries expire, writes of other processes are seen then (default value is {Config.storage_cache_ttl})",
+)
+
+arg_parser.add_argument(
+  "--write-behind-interval",
+  default=Config.write_behind_interval,
+  type=float,
+  metavar="<seconds>",
+  help="defer persisting user updates and flush them in batches at most this often (disabled by default)",
+)
+
+arg_parser.add_argument(
+  "--refresh-interval",
+  default=Config.refresh_interval,
+  type=float,
+  metavar="<seconds>",
+  help="reload users changed by other processes (e.g. uWSGI workers) at most this often (disabled by default)",
+)
+
+arg_parser.add_argument(
+  "--fragment-cache-size",
+  default=Config.fragment_cache_size,
+  type=int,
+  choices=range(1, 2**31),
+  metavar=f"[1-{2**31})",
+  help=f"number of rendered users kept for the index page (default value is {Config.fragment_cache_size})",
+)
+
+arg_parser.add_argument(
+  "--compression",
+  default=Config.compression,
+  action=BooleanOptionalAction,
+  help="compress responses with gzip, deflate, brotli or zstd as accepted by clients (enabled by default)",
+)
+
+arg_parser.add_argument(
+  "--compression-min-size",
+  default=Config.compression_min_size,
+  type=int,
+  metavar="<bytes>",
+  help=f"responses smaller than this are sent uncompressed (default value is {Config.compression_min_size})",
+)
+
+arg_parser.add_argument(
+  "--compression-level",
+  default=Config.compression_level,
+  type=int,
+  choices=range(1, 10),
+  metavar="[1-9]",
+  help=f"compression level (default value is {Config.compression_level})",
+)
+
+arg_parser.add_argument(
+  "--metrics",
+  default=Config.metrics,
+  action="store_true",
+  help="time requests, templates and storage operations and serve them in Prometheus text format",
+)
+
+arg_parser.add_argument(
+  "--metrics-path",
+  default=Config.metrics_path,
+  metavar="<path>",
+  help=f"path of the metrics endpoint (default value is {repr(Config.metrics_path)})",
+)
+
+arg_parser.add_argument(
+  "--server-timing",
+  default=Config.server_timing,
+  action="store_true",
+  help="add a Server-Timing header to every response (requires --metrics)",
+)
+
 arg_parser.add_argument(
   "-d",
   "--debug",
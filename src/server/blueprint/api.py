@@ -1,8 +1,10 @@
-from typing import cast
+from copy import copy
+from typing import Any, cast
 
-from flask import Blueprint, Response, jsonify, request
+from flask import Blueprint, Response, jsonify, request, url_for
+from werkzeug.http import is_resource_modified
 
-from common.user import Admin, Moderator, User, UserManager
+from common.user import Admin, Moderator, User, UserManager, UserQuery, UserVersion
 from server.io.dialog import JsonDialog
 from server.multi_user_manager import MultiUserManager
 
@@ -19,6 +21,127 @@ def _get_manager(multi: MultiUserManager) -> tuple[UserManager | None, tuple[Res
   return manager, None
 
 
+_USER_QUERY_ARGS = ("role", "login_prefix", "sort", "after_id", "offset", "limit")
+
+
+def _parse_user_query() -> tuple[UserQuery | None, tuple[Response, int] | None]:
+  args = request.args
+  after_id = args.get("after_id")
+  offset = args.get("offset")
+  limit = args.get("limit")
+  sort = args.get("sort", "id")
+
+  try:
+    query = UserQuery(
+      role=args.get("role"),
+      login_prefix=args.get("login_prefix"),
+      sort=sort.removeprefix("-"),
+      descending=sort.startswith("-"),
+      after_id=None if after_id is None else int(after_id),
+      offset=0 if offset is None else int(offset),
+      limit=None if limit is None else int(limit),
+    )
+  except ValueError as e:
+    return None, (jsonify(error=str(e)), 400)
+
+  return query, None
+
+
+def _make_user_query_url(query: UserQuery) -> str:
+  args = dict[str, Any](
+    storage=request.args.get("storage"),
+    role=query.role,
+    login_prefix=query.login_prefix,
+    sort=("-" if query.descending else "") + query.sort,
+    after_id=query.after_id,
+    offset=query.offset or None,
+    limit=query.limit,
+  )
+
+  return url_for(".get_all_users", **{name: value for name, value in args.items() if value is not None})
+
+
+def _parse_ids(text: str) -> list[int] | None:
+  try:
+    return [int(id) for id in text.split(",") if id.strip()]
+  except ValueError:
+    return None
+
+
+def _get_version(manager: UserManager, user_id: int | None = None) -> UserVersion | None:
+  # Versions of managers which miss changes made by other
+  # processes could validate stale users, so none are sent
+
+  if not manager.versioned:
+    return None
+
+  return manager.versions.collection if user_id is None else manager.versions.get_user(user_id)
+
+
+def _not_modified(version: UserVersion | None, etag: str | None = None) -> Response | None:
+  # Checked before anything is loaded or serialized,
+  # so polling an unchanged resource costs next to nothing
+
+  if version is None:
+    return None
+
+  etag = version.tag if etag is None else etag
+
+  # Only tags are compared, Last-Modified would be too coarse
+  # to tell apart changes made within the same second
+
+  if is_resource_modified(request.environ, etag=etag):
+    return None
+
+  return _with_version(Response(status=304), version, etag)
+
+
+def _with_version(res: Response, version: UserVersion | None, etag: str | None = None) -> Response:
+  if version is None:
+    return res
+
+  res.set_etag(version.tag if etag is None else etag)
+  res.cache_control.no_cache = True
+
+  return res
+
+
+def _create_user(role: Any) -> User | None:
+  if role == User.role:
+    return User()
+  elif role == Moderator.role:
+    return Moderator()
+  elif role == Admin.role:
+    return Admin()
+  else:
+    return None
+
+
+def _prompt_batch_user(manager: UserManager, user: User, item: dict[str, Any], new_logins: set[str]) -> str | None:
+  # Attributes are checked on a copy first, so an invalid item
+  # never leaves a managed user half updated
+
+  checked_user = copy(user)
+
+  try:
+    JsonDialog(item).prompt_all_attrs(checked_user)
+    manager.check_user_login(checked_user)
+  except ValueError as e:
+    return str(e)
+
+  if checked_user.login in new_logins:
+    return f'User with login "{checked_user.login}" already exists'
+
+  JsonDialog(item).prompt_all_attrs(user)
+  new_logins.add(user.login)
+
+  return None
+
+
+def _batch_results(results: list[User | str]) -> Response:
+  return jsonify([dict(id=result.id) if isinstance(result, User) else dict(error=result) for result in results])
+
+
 def create_blueprint(multi_manager: MultiUserManager) -> Blueprint:
   blueprint = Blueprint("api", __name__)
 
@@ -27,17 +150,32 @@ def create_blueprint(multi_manager: MultiUserManager) -> Blueprint:
     manager, err = _get_manager(multi_manager)
     if err is not None:
       return err[0], err[1]
+    version = _get_version(manager)
+    res = _not_modified(version)
+    if res is not None:
+      return res
     manager = manager.view(dialog=JsonDialog())
     users = manager.get_all_users()
     ids = [u.id for u in users]
-    return jsonify(ids)
+    return _with_version(jsonify(ids), version)
 
   @blueprint.get("/users/count")
   def get_user_count():
     manager, err = _get_manager(multi_manager)
     if err is not None:
       return err[0], err[1]
-    return jsonify(manager.user_count)
+    version = _get_version(manager)
+    res = _not_modified(version)
+    if res is not None:
+      return res
+    return _with_version(jsonify(manager.user_count), version)
+
+  @blueprint.get("/storage/stats")
+  def get_storage_stats():
+    manager, err = _get_manager(multi_manager)
+    if err is not None:
+      return err[0], err[1]
+    return jsonify(manager.storage.stats)
 
   @blueprint.get("/users")
   def get_all_users():
@@ -45,17 +183,60 @@ def create_blueprint(multi_manager: MultiUserManager) -> Blueprint:
     if err is not None:
       return err[0], err[1]
     manager = manager.view(dialog=JsonDialog())
-    return manager.show_all_users()
+    version = _get_version(manager)
+    ids_text = request.args.get("ids")
+    ids = None
+    query = None
+
+    if ids_text is not None:
+      ids = _parse_ids(ids_text)
+
+      if ids is None:
+        return jsonify(error="Expected a comma-separated list of ids"), 400
+    elif any(name in request.args for name in _USER_QUERY_ARGS):
+      query, err = _parse_user_query()
+      if err is not None:
+        return err[0], err[1]
+
+    # JSON and NDJSON bodies are different representations,
+    # so they're told apart by their tags
+
+    etag = None if version is None else f"{version.tag}-{JsonDialog.get_many_format()}"
+    res = _not_modified(version, etag)
+
+    if res is None:
+      if ids is not None:
+        res = cast(Response, manager.show_users(ids))
+      elif query is None:
+        res = cast(Response, manager.show_all_users())
+      else:
+        page = manager.query_users(query)
+        res = cast(Response, manager.get_dialog().show_many(page))
+        next_query = query.next_page(page)
+
+        if next_query is not None:
+          res.headers["Link"] = f'<{_make_user_query_url(next_query)}>; rel="next"'
+
+    res.vary.add("Accept")
+
+    return _with_version(res, version, etag)
 
   @blueprint.get("/users/<int:id>")
   def get_user(id: int):
     manager, err = _get_manager(multi_manager)
     if err is not None:
       return err[0], err[1]
+    version = _get_version(manager, id)
+    res = _not_modified(version)
+    if res is not None:
+      return res
     manager = manager.view(dialog=JsonDialog())
-    res = cast(Response, manager.show_user(id))
-    res.status_code = 404 if res.json is None else 200
-    return res
+    user = manager.get_user(id)
+
+    if user is None:
+      return jsonify(None), 404
+
+    return _with_version(cast(Response, manager.get_dialog().show(user)), version)
 
   @blueprint.post("/users")
   def register_user():
@@ -68,15 +249,9 @@ def create_blueprint(multi_manager: MultiUserManager) -> Blueprint:
     if not isinstance(json, dict):
       return jsonify(error="Expected an object"), 400
 
-    role = json.get("role")
+    user = _create_user(json.get("role"))
 
-    if role == User.role:
-      user = User()
-    elif role == Moderator.role:
-      user = Moderator()
-    elif role == Admin.role:
-      user = Admin()
-    else:
+    if user is None:
       return jsonify(error="Bad role"), 400
 
     try:
@@ -86,6 +261,105 @@ def create_blueprint(multi_manager: MultiUserManager) -> Blueprint:
 
     return manager.get_dialog().show(user)
 
+  # Batch routes answer with one {id} or {error} per item in request order,
+  # all valid items are persisted at once. POST still accepts items
+  # with ids (updates) for clients predating PATCH /users/batch
+
+  @blueprint.post("/users/batch")
+  def persist_users():
+    manager, err = _get_manager(multi_manager)
+    if err is not None:
+      return err[0], err[1]
+    json = request.json
+
+    if not isinstance(json, list):
+      return jsonify(error="Expected an array"), 400
+
+    results = list[User | str]()
+    new_logins = set[str]()
+    updated_ids = set[int]()
+
+    for item in json:
+      if not isinstance(item, dict):
+        results.append("Expected an object")
+        continue
+
+      id = item.get("id")
+
+      if isinstance(id, int) and not isinstance(id, bool) and id >= 0:
+        if id in updated_ids:
+          results.append(f"User with id {id} is updated twice")
+          continue
+
+        user = manager.get_user(id)
+
+        if user is None:
+          results.append(f"User with id {id} not found")
+          continue
+      else:
+        user = _create_user(item.get("role"))
+
+        if user is None:
+          results.append("Bad role")
+          continue
+
+      error = _prompt_batch_user(manager, user, item, new_logins)
+
+      if error is None and user.id >= 0:
+        updated_ids.add(user.id)
+
+      results.append(user if error is None else error)
+
+    manager.add_users(result for result in results if isinstance(result, User))
+
+    return _batch_results(results)
+
+  @blueprint.patch("/users/batch")
+  def update_users():
+    manager, err = _get_manager(multi_manager)
+    if err is not None:
+      return err[0], err[1]
+    json = request.json
+
+    if not isinstance(json, list):
+      return jsonify(error="Expected an array"), 400
+
+    results = list[User | str]()
+    new_logins = set[str]()
+    updated_ids = set[int]()
+
+    for item in json:
+      if not isinstance(item, dict):
+        results.append("Expected an object")
+        continue
+
+      id = item.get("id")
+
+      if not isinstance(id, int) or isinstance(id, bool) or id < 0:
+        results.append("Expected an id")
+        continue
+
+      if id in updated_ids:
+        results.append(f"User with id {id} is updated twice")
+        continue
+
+      user = manager.get_user(id)
+
+      if user is None:
+        results.append(f"User with id {id} not found")
+        continue
+
+      error = _prompt_batch_user(manager, user, item, new_logins)
+
+      if error is None:
+        updated_ids.add(id)
+
+      results.append(user if error is None else error)
+
+    manager.add_users(result for result in results if isinstance(result, User))
+
+    return _batch_results(results)
+
   @blueprint.patch("/users/<int:id>")
   def update_user(id: int):
     manager, err = _get_manager(multi_manager)
@@ -109,7 +383,17 @@ def create_blueprint(multi_manager: MultiUserManager) -> Blueprint:
     manager, err = _get_manager(multi_manager)
     if err is not None:
       return err[0], err[1]
-    return jsonify(deleted=manager.delete_all_users())
+    ids_text = request.args.get("ids")
+
+    if ids_text is None:
+      return jsonify(deleted=manager.delete_all_users())
+
+    ids = _parse_ids(ids_text)
+
+    if ids is None:
+      return jsonify(error="Expected a comma-separated list of ids"), 400
+
+    return jsonify(deleted=manager.delete_users(ids))
 
   @blueprint.delete("/users/<int:id>")
   def delete_user(id: int):
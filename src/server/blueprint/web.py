@@ -1,9 +1,9 @@
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, get_template_attribute, redirect, render_template, request, url_for
 
 from common.user import Admin, Moderator, User, UserManager
 from server.io.dialog import WebDialog
 from server.multi_user_manager import MultiUserManager
-from server.util.flask import render_object
+from server.util.flask import FragmentCache, get_object_attrs
 
 __all__ = ["create_blueprint"]
 
@@ -17,8 +17,38 @@ def _get_storage_and_manager(multi: MultiUserManager) -> tuple[str | None, UserM
   return current, manager
 
 
-def create_blueprint(multi_manager: MultiUserManager) -> Blueprint:
+def _render_user_items(
+  fragment_cache: FragmentCache,
+  manager: UserManager,
+  storage: str | None,
+  users: list[User],
+) -> list[str]:
+  # Every item is cached under its user's version, so only users
+  # changed since the last page view are rendered, all with the same macro.
+  # Lazy managers without refreshes miss changes of other processes
+  # in their versions, so their items are always rendered anew
+
+  user_item = get_template_attribute("macros.jinja", "user_item")
+
+  if not manager.versioned:
+    return [user_item(user, get_object_attrs(user), storage) for user in users]
+
+  versions = manager.versions
+  epoch = versions.epoch
+
+  return [
+    fragment_cache.get(
+      (epoch, storage, user.id),
+      versions.get_user(user.id).tag,
+      lambda user=user: user_item(user, get_object_attrs(user), storage),
+    )
+    for user in users
+  ]
+
+
+def create_blueprint(multi_manager: MultiUserManager, fragment_cache_size: int = 10000) -> Blueprint:
   blueprint = Blueprint("web", __name__)
+  fragment_cache = FragmentCache(fragment_cache_size)
 
   @blueprint.get("/")
   def index():
@@ -26,10 +56,10 @@ def create_blueprint(multi_manager: MultiUserManager) -> Blueprint:
     if manager is None:
       return "No storage backend enabled", 503
     manager = manager.view(dialog=WebDialog())
+    users = manager.get_all_users()
     return render_template(
       "index.jinja",
-      users=manager.get_all_users(),
-      render=render_object,
+      user_items=_render_user_items(fragment_cache, manager, current_storage, users),
       enabled_storages=multi_manager.enabled_storages,
       current_storage=current_storage,
     )
@@ -107,9 +137,13 @@ def create_blueprint(multi_manager: MultiUserManager) -> Blueprint:
     manager.delete_all_users()
     return "", 204
 
+  @blueprint.before_app_request
+  def set_up():
+    multi_manager.refresh()
+
   @blueprint.teardown_app_request
   def tear_down(exception):
-    multi_manager.persist_all_users()
+    multi_manager.flush()
 
   @blueprint.get("/<path:subpath>")
   def page_not_found(subpath):
@@ -7,7 +7,7 @@ __all__ = [
 ]
 
 
-StorageType: TypeAlias = Literal["pickle", "sqlite3", "postgres"]
+StorageType: TypeAlias = Literal["pickle", "log", "sqlite3", "postgres"]
 
 
 @dataclass
@@ -20,10 +20,42 @@ class Config:
   host: str = "127.0.0.1"
   enabled_storages: list[str] = field(default_factory=lambda: ["pickle", "sqlite3"])
   pickle_storage_dirname: str = "db.pickle"
+  pickle_storage_fsync: str = "never"
+  log_storage_filename: str = "db.log"
+  log_storage_fsync: bool = False
+  log_storage_mmap: bool = False
+  log_storage_compact_ratio: float = 0.5
   sqlite3_storage_filename: str = "db.sqlite3"
+  sqlite3_reuse_connections: bool = False
+  sqlite3_journal_mode: str = "wal"
+  sqlite3_synchronous: str = "normal"
+  sqlite3_cache_size: int = -2000
+  sqlite3_mmap_size: int = 0
+  sqlite3_busy_timeout: float = 5.0
   postgres_host: str = "localhost"
   postgres_port: int = 5432
   postgres_db: str = "admin_panel"
   postgres_user: str = "admin"
   postgres_password: str = "admin"
+  postgres_pool: bool = False
+  postgres_pool_min: int = 1
+  postgres_pool_max: int = 10
+  postgres_pool_max_idle: float = 600.0
+  postgres_pool_timeout: float = 30.0
+  postgres_pool_check: bool = True
+  lazy_storages: list[str] = field(default_factory=list)
+  cached_storages: list[str] = field(default_factory=list)
+  storage_cache_size: int = 10000
+  storage_cache_bytes: int | None = None
+  storage_cache_ttl: float | None = 30.0
+  lazy_cache_size: int = 10000
+  write_behind_interval: float | None = None
+  refresh_interval: float | None = None
+  fragment_cache_size: int = 10000
+  compression: bool = True
+  compression_min_size: int = 1024
+  compression_level: int = 6
+  metrics: bool = False
+  metrics_path: str = "/metrics"
+  server_timing: bool = False
   debug: bool = False
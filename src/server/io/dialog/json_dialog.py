@@ -1,7 +1,7 @@
-from collections.abc import Iterable
-from typing import Any
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any, Final
 
-from flask import Response, jsonify, request
+from flask import Response, current_app, jsonify, request
 
 from common.io.dialog import Dialog
 from common.util import ToDictConvertible
@@ -11,8 +11,16 @@ __all__ = ["JsonDialog"]
 
 
 class JsonDialog(Dialog):
+  NDJSON_MIMETYPE: Final = "application/x-ndjson"
+  STREAM_CHUNK_SIZE: Final = 64 * 1024
+
+  json: Any
+
+  def __init__(self, json: Any = None):
+    self.json = json
+
   def prompt_attr(self, obj: Any, attr_name: str):
-    json = request.json
+    json = request.json if self.json is None else self.json
 
     if json is None or not isinstance(json, dict):
       return
@@ -34,10 +42,64 @@ class JsonDialog(Dialog):
     setattr(obj, attr_name, value)
 
   def show_many(self, objs: Iterable[Any], **kwargs: Any) -> Response:
-    return jsonify([obj.toDict() if isinstance(obj, ToDictConvertible) else obj for obj in objs])
+    # Objects are serialized one by one while the response is being sent,
+    # so memory usage doesn't depend on the number of objects
+
+    dumps = current_app.json.dumps
+
+    if JsonDialog.get_many_format() == "ndjson":
+      mimetype = JsonDialog.NDJSON_MIMETYPE
+      chunks = JsonDialog.__generate_ndjson(objs, dumps)
+    else:
+      mimetype = "application/json"
+      chunks = JsonDialog.__generate_json_array(objs, dumps)
+
+    return Response(JsonDialog.__join_chunks(chunks), mimetype=mimetype)
+
+  @staticmethod
+  def get_many_format() -> str:
+    mimetype = request.accept_mimetypes.best_match(["application/json", JsonDialog.NDJSON_MIMETYPE])
+
+    return "ndjson" if mimetype == JsonDialog.NDJSON_MIMETYPE else "json"
 
   def show(self, obj: Any, **kwargs: Any) -> Response:
     if isinstance(obj, ToDictConvertible):
       obj = obj.toDict()
 
     return jsonify(obj)
+
+  @staticmethod
+  def __generate_json_array(objs: Iterable[Any], dumps: Callable[[Any], str]) -> Iterator[str]:
+    yield "["
+
+    for i, obj in enumerate(objs):
+      if i > 0:
+        yield ","
+
+      yield dumps(obj.toDict() if isinstance(obj, ToDictConvertible) else obj)
+
+    yield "]\n"
+
+  @staticmethod
+  def __generate_ndjson(objs: Iterable[Any], dumps: Callable[[Any], str]) -> Iterator[str]:
+    for obj in objs:
+      yield dumps(obj.toDict() if isinstance(obj, ToDictConvertible) else obj)
+      yield "\n"
+
+  @staticmethod
+  def __join_chunks(chunks: Iterable[str]) -> Iterator[str]:
+    buffer = list[str]()
+    buffer_size = 0
+
+    for chunk in chunks:
+      buffer.append(chunk)
+      buffer_size += len(chunk)
+
+      if buffer_size >= JsonDialog.STREAM_CHUNK_SIZE:
+        yield "".join(buffer)
+
+        buffer.clear()
+        buffer_size = 0
+
+    if buffer_size > 0:
+      yield "".join(buffer)
@@ -1 +1,3 @@
+from .instrumented_storage import *
+from .log_storage import *
 from .pickle_storage import *
@@ -0,0 +1,148 @@
+from collections.abc import Callable, Iterable, Iterator
+from time import perf_counter
+from typing import Any, TypeVar, override
+
+from common.io.storage.identifiable import Identifiable
+from common.io.storage.storage import Storage
+from server.util.metrics import Metrics, add_server_timing
+
+__all__ = ["InstrumentedStorage"]
+
+
+T = TypeVar("T", bound=Identifiable)
+R = TypeVar("R")
+
+
+class InstrumentedStorage(Storage[T]):
+  __storage: Storage[T]
+  __metrics: Metrics
+  __backend: str
+
+  def __init__(self, storage: Storage[T], metrics: Metrics, backend: str):
+    super().__init__()
+
+    self.__storage = storage
+    self.__metrics = metrics
+    self.__backend = backend
+
+    metrics.describe("storage_operations_total", "Storage method calls")
+    metrics.describe("storage_rows_total", "Objects or ids read, written or deleted by storage methods")
+    metrics.describe("storage_operation_duration_seconds", "Time spent in storage methods")
+    metrics.add_collector(self.__collect_stats)
+
+  @property
+  def storage(self) -> Storage[T]:
+    return self.__storage
+
+  @property
+  def backend(self) -> str:
+    return self.__backend
+
+  @override
+  def persist(self, obj: T) -> int:
+    return self.__call("persist", lambda: self.__storage.persist(obj), lambda _: 1)
+
+  @override
+  def persist_many(self, objs: Iterable[T]) -> list[int]:
+    return self.__call("persist_many", lambda: self.__storage.persist_many(objs), len)
+
+  @override
+  def load(self, obj_id: int) -> T | None:
+    return self.__call("load", lambda: self.__storage.load(obj_id), lambda obj: int(obj is not None))
+
+  @override
+  def load_many(self, obj_ids: Iterable[int]) -> Iterable[T]:
+    return self.__iterate("load_many", lambda: self.__storage.load_many(obj_ids))
+
+  @override
+  def load_page(self, after_id: int | None = None, limit: int | None = None) -> list[T]:
+    return self.__call("load_page", lambda: self.__storage.load_page(after_id, limit), len)
+
+  @override
+  def load_all_ids(self) -> Iterable[int]:
+    return self.__iterate("load_all_ids", self.__storage.load_all_ids)
+
+  @override
+  def load_all(self) -> Iterable[T]:
+    return self.__iterate("load_all", self.__storage.load_all)
+
+  @override
+  def load_by_login(self, login: str) -> T | None:
+    return self.__call("load_by_login", lambda: self.__storage.load_by_login(login), lambda obj: int(obj is not None))
+
+  @override
+  def count(self) -> int:
+    return self.__call("count", self.__storage.count, lambda _: 0)
+
+  @override
+  def delete(self, obj_id: int) -> bool:
+    return self.__call("delete", lambda: self.__storage.delete(obj_id), int)
+
+  @override
+  def delete_many(self, obj_ids: Iterable[int]) -> int:
+    return self.__call("delete_many", lambda: self.__storage.delete_many(obj_ids), int)
+
+  @override
+  def delete_all(self) -> int:
+    return self.__call("delete_all", self.__storage.delete_all, int)
+
+  @override
+  def poll_changes(self) -> list[int] | None:
+    return self.__call("poll_changes", self.__storage.poll_changes, lambda ids: 0 if ids is None else len(ids))
+
+  @property
+  @override
+  def stats(self) -> dict[str, int | float]:
+    return self.__storage.stats
+
+  def __getattr__(self, name: str) -> Any:
+    # Backend specific members (close(), conninfo, ...)
+    # are reached through the wrapper
+
+    if name.startswith("_"):
+      raise AttributeError(name)
+
+    return getattr(self.__storage, name)
+
+  def __call(self, op: str, run: Callable[[], R], count_rows: Callable[[R], int]) -> R:
+    start = perf_counter()
+    result = run()
+    self.__record(op, perf_counter() - start, count_rows(result))
+
+    return result
+
+  def __iterate(self, op: str, run: Callable[[], Iterable[R]]) -> Iterator[R]:
+    # Only time spent inside the storage is measured,
+    # not the time the caller spends between items
+
+    start = perf_counter()
+    iterator = iter(run())
+    seconds = perf_counter() - start
+    rows = 0
+
+    try:
+      while True:
+        start = perf_counter()
+
+        try:
+          obj = next(iterator)
+        except StopIteration:
+          break
+        finally:
+          seconds += perf_counter() - start
+
+        rows += 1
+
+        yield obj
+    finally:
+      self.__record(op, seconds, rows)
+
+  def __record(self, op: str, seconds: float, rows: int):
+    self.__metrics.inc("storage_operations_total", backend=self.__backend, op=op)
+    self.__metrics.inc("storage_rows_total", rows, backend=self.__backend, op=op)
+    self.__metrics.observe("storage_operation_duration_seconds", seconds, backend=self.__backend, op=op)
+    add_server_timing("storage", seconds)
+
+  def __collect_stats(self) -> Iterable[tuple[str, dict[str, str], float]]:
+    for name, value in self.__storage.stats.items():
+      yield "storage_stat", {"backend": self.__backend, "stat": name}, value
@@ -0,0 +1,494 @@
+import mmap
+import os
+import pickle
+import struct
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from os.path import abspath, dirname
+from threading import RLock
+from typing import Final, TypeVar, cast, override
+from zlib import crc32
+
+from common.io.storage.identifiable import Identifiable
+from common.io.storage.storage import Storage
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+__all__ = ["LogStorage"]
+
+
+T = TypeVar("T", bound=Identifiable)
+
+
+class LogStorage(Storage[T]):
+  # The file starts with MAGIC followed by records of
+  # <id: int64> <payload length: uint32> <crc32: uint32> <pickled object>,
+  # a record with an empty payload is a tombstone of a deleted object.
+  # Once changes are polled, ids of records appended by other processes
+  # are collected while they're indexed. A reopened or truncated file
+  # is indexed anew, so its changes can't be told
+
+  MAGIC: Final = b"USERLOG\x01"
+  HEADER: Final = struct.Struct("<qII")
+  SCAN_BUFFER_SIZE: Final = 1 << 20
+
+  __filename: str
+  __fsync: bool
+  __mmap_reads: bool
+  __map: mmap.mmap | None
+  __compact_ratio: float
+  __compact_min_bytes: int
+  __lock: RLock
+  __fd: int
+  __pid: int
+  __offsets: dict[int, tuple[int, int]]
+  __indexed_size: int
+  __live_bytes: int
+  __next_id: int
+  __tracking: bool
+  __changes: set[int] | None
+
+  def __init__(
+    self,
+    filename: str = "db.log",
+    fsync: bool = False,
+    compact_ratio: float = 0.5,
+    compact_min_bytes: int = 1 << 20,
+    mmap_reads: bool = False,
+  ):
+    super().__init__()
+
+    if not 0 < compact_ratio <= 1:
+      raise ValueError("compact_ratio must be in range (0, 1]")
+
+    self.__filename = filename
+    self.__fsync = fsync
+    self.__mmap_reads = mmap_reads
+    self.__map = None
+    self.__compact_ratio = compact_ratio
+    self.__compact_min_bytes = compact_min_bytes
+    self.__lock = RLock()
+    self.__fd = -1
+    self.__pid = -1
+    self.__next_id = 0
+    self.__tracking = False
+
+    self.__reset_index()
+
+    with self.__locked():
+      ...
+
+  @property
+  def filename(self) -> str:
+    return self.__filename
+
+  @property
+  def mmap_reads(self) -> bool:
+    return self.__mmap_reads
+
+  @property
+  @override
+  def stats(self) -> dict[str, int | float]:
+    with self.__locked():
+      return {
+        "objects": len(self.__offsets),
+        "file_bytes": self.__indexed_size,
+        "live_bytes": self.__live_bytes,
+        "garbage_bytes": self.__garbage_bytes(),
+      }
+
+  @override
+  def persist(self, obj: T) -> int:
+    self.persist_many([obj])
+
+    return obj.id
+
+  @override
+  def persist_many(self, objs: Iterable[T]) -> list[int]:
+    objs = list(objs)
+
+    if len(objs) == 0:
+      return []
+
+    with self.__locked(exclusive=True):
+      new_objs = [obj for obj in objs if obj.id < 0]
+
+      for obj in new_objs:
+        obj._id = self.__next_id
+        self.__next_id += 1
+
+      try:
+        self.__append([(obj.id, pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)) for obj in objs])
+      except BaseException:
+        for obj in new_objs:
+          obj._id = -1
+
+        raise
+
+    return [obj.id for obj in objs]
+
+  @override
+  def load(self, obj_id: int) -> T | None:
+    with self.__locked():
+      location = self.__offsets.get(obj_id)
+
+      if location is None:
+        return None
+
+      return self.__unpickle(*location)
+
+  @override
+  def load_many(self, obj_ids: Iterable[int]) -> Iterable[T]:
+    with self.__locked():
+      locations = [location for location in map(self.__offsets.get, obj_ids) if location is not None]
+
+      return [self.__unpickle(*location) for location in locations]
+
+  @override
+  def load_all(self) -> Iterable[T]:
+    # Objects are read in file order,
+    # which keeps the disk access sequential
+
+    with self.__locked():
+      locations = sorted(self.__offsets.values())
+
+      return [self.__unpickle(*location) for location in locations]
+
+  @override
+  def load_all_ids(self) -> Iterable[int]:
+    with self.__locked():
+      return list(self.__offsets.keys())
+
+  @override
+  def count(self) -> int:
+    with self.__locked():
+      return len(self.__offsets)
+
+  @override
+  def delete(self, obj_id: int) -> bool:
+    return self.delete_many([obj_id]) > 0
+
+  @override
+  def delete_many(self, obj_ids: Iterable[int]) -> int:
+    obj_ids = set(obj_ids)
+
+    with self.__locked(exclusive=True):
+      deleted_ids = [obj_id for obj_id in obj_ids if obj_id in self.__offsets]
+
+      if len(deleted_ids) > 0:
+        self.__append([(obj_id, b"") for obj_id in deleted_ids])
+
+      return len(deleted_ids)
+
+  @override
+  def delete_all(self) -> int:
+    with self.__locked(exclusive=True):
+      deleted = len(self.__offsets)
+
+      self.__rewrite([])
+
+      return deleted
+
+  @override
+  def poll_changes(self) -> list[int] | None:
+    with self.__locked():
+      changes = self.__changes if self.__tracking else set[int]()
+
+      self.__tracking = True
+      self.__changes = set()
+
+    return None if changes is None else list(changes)
+
+  def compact(self):
+    with self.__locked(exclusive=True):
+      self.__compact()
+
+  def close(self):
+    with self.__lock:
+      self.__unmap()
+
+      if self.__fd >= 0:
+        os.close(self.__fd)
+
+      self.__fd = -1
+      self.__pid = -1
+      self.__reset_index()
+
+  @contextmanager
+  def __locked(self, exclusive: bool = False) -> Iterator[None]:
+    # Threads are serialized by the RLock, processes (e.g. uWSGI workers)
+    # by flock, a compaction in another process replaces the file,
+    # so the lock is retaken until it is held on the current one
+
+    with self.__lock:
+      if self.__pid != os.getpid():
+        self.__open()
+
+      while True:
+        LogStorage.__flock(self.__fd, exclusive)
+
+        try:
+          replaced = os.stat(self.__filename).st_ino != os.fstat(self.__fd).st_ino
+        except FileNotFoundError:
+          replaced = True
+
+        if not replaced:
+          break
+
+        LogStorage.__funlock(self.__fd)
+        self.__open()
+
+      try:
+        self.__refresh(exclusive)
+        yield
+      finally:
+        LogStorage.__funlock(self.__fd)
+
+  def __open(self):
+    self.__unmap()
+
+    if self.__fd >= 0:
+      os.close(self.__fd)
+
+    # O_APPEND makes every write land at the end of the file
+    # regardless of the offset shared with forked processes
+
+    self.__fd = os.open(self.__filename, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+    self.__pid = os.getpid()
+    self.__reset_index()
+
+  def __reset_index(self):
+    self.__offsets = {}
+    self.__indexed_size = 0
+    self.__live_bytes = 0
+    self.__changes = None
+
+  def __refresh(self, exclusive: bool):
+    size = os.fstat(self.__fd).st_size
+
+    if size < self.__indexed_size:
+      self.__reset_index()
+
+    if size > self.__indexed_size:
+      self.__scan(size)
+
+    # Whatever is left after the last valid record is a torn write
+    # of a crashed process, it is cut off before anything is appended
+
+    if exclusive and size > self.__indexed_size:
+      os.ftruncate(self.__fd, self.__indexed_size)
+
+  def __scan(self, size: int):
+    with open(os.dup(self.__fd), "rb", buffering=LogStorage.SCAN_BUFFER_SIZE) as file:
+      offset = self.__indexed_size
+
+      # The duplicated descriptor shares its position with the original one,
+      # which is left at the end of the file by appends
+
+      file.seek(offset)
+
+      if offset == 0:
+        magic = file.read(len(LogStorage.MAGIC))
+
+        if len(magic) < len(LogStorage.MAGIC):
+          return
+
+        if magic != LogStorage.MAGIC:
+          raise ValueError(f"{self.__filename} is not a log storage file")
+
+        offset = self.__indexed_size = len(magic)
+
+      header_size = LogStorage.HEADER.size
+
+      while offset + header_size <= size:
+        header = file.read(header_size)
+        obj_id, length, crc = LogStorage.HEADER.unpack(header)
+        payload = file.read(length)
+
+        if len(payload) < length or crc32(payload, crc32(header[:12])) != crc:
+          break
+
+        self.__index_record(obj_id, offset + header_size, length)
+
+        if self.__changes is not None:
+          self.__changes.add(obj_id)
+
+        offset += header_size + length
+        self.__indexed_size = offset
+
+  def __index_record(self, obj_id: int, payload_offset: int, length: int):
+    old_location = self.__offsets.pop(obj_id, None)
+
+    if old_location is not None:
+      self.__live_bytes -= LogStorage.HEADER.size + old_location[1]
+
+    if length > 0:
+      self.__offsets[obj_id] = (payload_offset, length)
+      self.__live_bytes += LogStorage.HEADER.size + length
+
+    self.__next_id = max(self.__next_id, obj_id + 1)
+
+  def __append(self, records: list[tuple[int, bytes]]):
+    if self.__indexed_size == 0:
+      self.__write(LogStorage.MAGIC)
+      self.__indexed_size = len(LogStorage.MAGIC)
+
+    # All records go in one write, so a crash leaves
+    # at most one torn tail to cut off on the next write
+
+    chunks = list[bytes]()
+    locations = list[tuple[int, int, int]]()
+    offset = self.__indexed_size
+
+    for obj_id, payload in records:
+      header = LogStorage.HEADER.pack(obj_id, len(payload), 0)
+      crc = crc32(payload, crc32(header[:12]))
+
+      chunks.append(LogStorage.HEADER.pack(obj_id, len(payload), crc))
+      chunks.append(payload)
+      locations.append((obj_id, offset + LogStorage.HEADER.size, len(payload)))
+
+      offset += LogStorage.HEADER.size + len(payload)
+
+    self.__write(b"".join(chunks))
+
+    for obj_id, payload_offset, length in locations:
+      self.__index_record(obj_id, payload_offset, length)
+
+    self.__indexed_size = offset
+
+    if self.__should_compact():
+      self.__compact()
+
+  def __write(self, data: bytes):
+    view = memoryview(data)
+
+    while len(view) > 0:
+      written = os.write(self.__fd, view)
+      view = view[written:]
+
+    if self.__fsync:
+      os.fsync(self.__fd)
+
+  def __unpickle(self, offset: int, length: int) -> T:
+    if not self.__mmap_reads:
+      return pickle.loads(self.__read(offset, length))
+
+    # Objects are unpickled straight from the shared page cache,
+    # the mapping is only extended when it doesn't cover the record
+
+    if self.__map is None or len(self.__map) < offset + length:
+      self.__remap()
+
+    with memoryview(cast(mmap.mmap, self.__map)) as view, view[offset : offset + length] as payload:
+      return pickle.loads(payload)
+
+  def __remap(self):
+    self.__unmap()
+    self.__map = mmap.mmap(self.__fd, self.__indexed_size, access=mmap.ACCESS_READ)
+
+  def __unmap(self):
+    if self.__map is not None:
+      self.__map.close()
+
+    self.__map = None
+
+  def __read(self, offset: int, length: int) -> bytes:
+    if hasattr(os, "pread"):
+      return os.pread(self.__fd, length, offset)
+
+    os.lseek(self.__fd, offset, os.SEEK_SET)
+
+    return os.read(self.__fd, length)
+
+  def __garbage_bytes(self) -> int:
+    return max(0, self.__indexed_size - len(LogStorage.MAGIC) - self.__live_bytes)
+
+  def __should_compact(self) -> bool:
+    garbage = self.__garbage_bytes()
+
+    return garbage >= self.__compact_min_bytes and garbage >= self.__indexed_size * self.__compact_ratio
+
+  def __compact(self):
+    locations = sorted(self.__offsets.items(), key=lambda item: item[1][0])
+
+    self.__rewrite((obj_id, self.__read(*location)) for obj_id, location in locations)
+
+  def __rewrite(self, records: Iterable[tuple[int, bytes]]):
+    # The new file is fully written and synced under a temporary name
+    # and atomically renamed over the old one, so a crash keeps either of them
+
+    tmp_filename = f"{self.__filename}.{os.getpid()}.tmp"
+    offsets = dict[int, tuple[int, int]]()
+    offset = len(LogStorage.MAGIC)
+
+    try:
+      with open(tmp_filename, "wb") as file:
+        file.write(LogStorage.MAGIC)
+
+        for obj_id, payload in records:
+          header = LogStorage.HEADER.pack(obj_id, len(payload), 0)
+          crc = crc32(payload, crc32(header[:12]))
+
+          file.write(LogStorage.HEADER.pack(obj_id, len(payload), crc))
+          file.write(payload)
+
+          offsets[obj_id] = (offset + LogStorage.HEADER.size, len(payload))
+          offset += LogStorage.HEADER.size + len(payload)
+
+        file.flush()
+        os.fsync(file.fileno())
+
+      os.replace(tmp_filename, self.__filename)
+    except BaseException:
+      try:
+        os.remove(tmp_filename)
+      except FileNotFoundError:
+        ...
+
+      raise
+
+    LogStorage.__fsync_dir(dirname(abspath(self.__filename)))
+
+    # The old file stays locked until the lock is released,
+    # other processes then notice the replaced inode and reopen
+
+    self.__unmap()
+
+    old_fd = self.__fd
+    self.__fd = os.open(self.__filename, os.O_RDWR | os.O_APPEND)
+    LogStorage.__flock(self.__fd, exclusive=True)
+    LogStorage.__funlock(old_fd)
+    os.close(old_fd)
+
+    self.__offsets = offsets
+    self.__indexed_size = offset
+    self.__live_bytes = offset - len(LogStorage.MAGIC)
+
+  # Without fcntl (e.g. on Windows) only threads of one process
+  # are synchronized, so the file must not be shared between processes
+
+  @staticmethod
+  def __flock(fd: int, exclusive: bool):
+    if fcntl is not None:
+      fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+  @staticmethod
+  def __funlock(fd: int):
+    if fcntl is not None:
+      fcntl.flock(fd, fcntl.LOCK_UN)
+
+  @staticmethod
+  def __fsync_dir(path: str):
+    if os.name == "nt":
+      return
+
+    fd = os.open(path, os.O_RDONLY)
+
+    try:
+      os.fsync(fd)
+    finally:
+      os.close(fd)
@@ -1,16 +1,27 @@
+import os
 import pickle
 import re
 from collections.abc import Iterable
+from contextlib import suppress
 from os import listdir, mkdir
 from os import remove as remove_file
 from os.path import join as join_paths
 from re import Match
+from secrets import token_hex
 from shutil import rmtree
-from typing import TypeVar, cast, override
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+from typing import Final, TypeVar, cast, override
 
 from common.io.storage.identifiable import Identifiable
 from common.io.storage.storage import Storage
 
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
 __all__ = ["PickleStorage"]
 
 
@@ -18,21 +29,57 @@ T = TypeVar("T", bound=Identifiable)
 
 
 class PickleStorage(Storage[T]):
+  # Objects are written to a temporary file which then replaces the target,
+  # so a crash never leaves a truncated pickle behind. Fsync policies:
+  #   always - fsync every file and the directory after every rename
+  #   batch  - fsync every file, the directory once per persist_many/delete_many
+  #   never  - leave flushing to the OS
+  # Ids of written and removed files are then appended to CHANGES_FILENAME,
+  # which is polled from the last read offset. It starts with a random token
+  # and is replaced with a new one once it's grown past MAX_CHANGES_BYTES,
+  # pollers which find another token or no file can't tell the changes.
+  # New ids are taken from the NEXT_ID_FILENAME counter under flock,
+  # so processes sharing the directory never hand out the same id
+
+  FSYNC_POLICIES: Final = ("always", "batch", "never")
+  TMP_SUFFIX: Final = ".tmp"
+  STALE_TMP_SECONDS: Final = 60.0
+  CHANGES_FILENAME: Final = ".changes"
+  MAX_CHANGES_BYTES: Final = 1 << 20
+  NEXT_ID_FILENAME: Final = ".next_id"
+
   __dirname: str
   __filename_pattern: str
   __filename_re: re.Pattern
-  __next_id: int
+  __fsync: str
+  __file_mode: int
+  __id_lock: Lock
+  __poll_lock: Lock
+  __changes_position: tuple[bytes | None, int] | None
 
-  def __init__(self, dirname: str = "db", filename_pattern: str = "{id}.pickle"):
+  def __init__(
+    self,
+    dirname: str = "db",
+    filename_pattern: str = "{id}.pickle",
+    fsync: str = "never",
+  ):
     super().__init__()
 
+    fsync = fsync.lower()
+
+    if fsync not in PickleStorage.FSYNC_POLICIES:
+      raise ValueError(f"Bad fsync policy: {repr(fsync)}")
+
     self.__dirname = dirname
     self.__filename_pattern = filename_pattern
     self.__filename_re = re.compile(filename_pattern.format(id="(\\d+)"))
+    self.__fsync = fsync
+    self.__file_mode = PickleStorage.__get_file_mode()
+    self.__id_lock = Lock()
+    self.__poll_lock = Lock()
+    self.__changes_position = None
 
-    ids = list(self.load_all_ids())
-
-    self.__next_id = 0 if len(ids) == 0 else max(ids) + 1
+    self.__remove_tmp_files()
 
   @property
   def dirname(self) -> str:
@@ -42,20 +89,40 @@ class PickleStorage(Storage[T]):
   def filename_pattern(self) -> str:
     return self.__filename_pattern
 
+  @property
+  def fsync(self) -> str:
+    return self.__fsync
+
   @override
   def persist(self, obj: T) -> int:
     self.__create_dir()
+    self.__assign_ids([obj])
 
-    if obj.id < 0:
-      obj._id = self.__next_id
-      self.__next_id += 1
+    obj_id = self.__write(obj)
 
-    filepath = self.__create_filepath(obj.id)
+    if self.__fsync != "never":
+      self.__fsync_dir()
 
-    with open(filepath, "wb") as file:
-      pickle.dump(obj, file)
+    self.__append_changes([obj_id])
 
-    return obj.id
+    return obj_id
+
+  @override
+  def persist_many(self, objs: Iterable[T]) -> list[int]:
+    objs = list(objs)
+
+    self.__create_dir()
+    self.__assign_ids(objs)
+
+    ids = [self.__write(obj, sync_dir=self.__fsync == "always") for obj in objs]
+
+    if self.__fsync == "batch" and len(ids) > 0:
+      self.__fsync_dir()
+
+    if len(ids) > 0:
+      self.__append_changes(ids)
+
+    return ids
 
   @override
   def load(self, obj_id: int) -> T | None:
@@ -104,13 +171,38 @@ class PickleStorage(Storage[T]):
 
   @override
   def delete(self, obj_id: int) -> bool:
-    filepath = self.__create_filepath(obj_id)
+    deleted = self.__remove(obj_id)
 
-    try:
-      remove_file(filepath)
-      return True
-    except FileNotFoundError:
-      return False
+    if deleted and self.__fsync != "never":
+      self.__fsync_dir()
+
+    if deleted:
+      self.__append_changes([obj_id])
+
+    return deleted
+
+  @override
+  def delete_many(self, obj_ids: Iterable[int]) -> int:
+    deleted = 0
+    deleted_ids = list[int]()
+
+    for obj_id in obj_ids:
+      removed = self.__remove(obj_id)
+      deleted += removed
+
+      if removed:
+        deleted_ids.append(obj_id)
+
+      if removed and self.__fsync == "always":
+        self.__fsync_dir()
+
+    if deleted > 0 and self.__fsync == "batch":
+      self.__fsync_dir()
+
+    if deleted > 0:
+      self.__append_changes(deleted_ids)
+
+    return deleted
 
   @override
   def delete_all(self) -> int:
@@ -121,8 +213,223 @@ class PickleStorage(Storage[T]):
     except FileNotFoundError:
       ...
 
+    # The changes file is removed with the rest,
+    # pollers find a new one and reload everything
+
+    self.__create_dir()
+    self.__replace_changes()
+
     return deleted
 
+  @override
+  def poll_changes(self) -> list[int] | None:
+    with self.__poll_lock:
+      old_position = self.__changes_position
+
+      # Tracking starts from an existing file, otherwise
+      # the one created by the first write would look replaced
+
+      if old_position is None:
+        self.__create_dir()
+        self.__replace_changes(exclusive=True)
+
+      token, offset, data = self.__read_changes(old_position)
+
+      self.__changes_position = (token, offset)
+
+      if old_position is None:
+        return []
+
+      if token != old_position[0]:
+        return None
+
+      return list(dict.fromkeys(int(line) for line in data.split() if line.isdigit()))
+
+  def __assign_ids(self, objs: list[T]):
+    new_objs = [obj for obj in objs if obj.id < 0]
+
+    if len(new_objs) == 0:
+      return
+
+    next_id = self.__allocate_ids(len(new_objs))
+
+    for obj in new_objs:
+      obj._id = next_id
+      next_id += 1
+
+  def __allocate_ids(self, count: int) -> int:
+    # Threads are serialized by the lock, processes by flock. A missing
+    # or torn counter is recovered from the ids of the existing files
+
+    with self.__id_lock:
+      fd = os.open(join_paths(self.dirname, PickleStorage.NEXT_ID_FILENAME), os.O_RDWR | os.O_CREAT, 0o666)
+
+      try:
+        if fcntl is not None:
+          fcntl.flock(fd, fcntl.LOCK_EX)
+
+        text = os.read(fd, 32).strip()
+
+        if text.isdigit():
+          next_id = int(text)
+        else:
+          next_id = max(self.load_all_ids(), default=-1) + 1
+
+        os.ftruncate(fd, 0)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, str(next_id + count).encode())
+      finally:
+        # Closing the descriptor releases the lock
+
+        os.close(fd)
+
+    return next_id
+
+  def __write(self, obj: T, sync_dir: bool = False) -> int:
+    filename = self.filename_pattern.format(id=obj.id)
+    fd, tmp_filepath = mkstemp(suffix=PickleStorage.TMP_SUFFIX, prefix=f".{filename}.", dir=self.dirname)
+
+    try:
+      with open(fd, "wb") as file:
+        pickle.dump(obj, file)
+
+        if self.__fsync != "never":
+          file.flush()
+          os.fsync(file.fileno())
+
+      os.chmod(tmp_filepath, self.__file_mode)
+      os.replace(tmp_filepath, join_paths(self.dirname, filename))
+    except BaseException:
+      try:
+        remove_file(tmp_filepath)
+      except FileNotFoundError:
+        ...
+
+      raise
+
+    if sync_dir:
+      self.__fsync_dir()
+
+    return obj.id
+
+  def __append_changes(self, obj_ids: list[int]):
+    # Every line goes in a single O_APPEND write,
+    # so lines of concurrent writers never interleave
+
+    filepath = join_paths(self.dirname, PickleStorage.CHANGES_FILENAME)
+
+    try:
+      fd = os.open(filepath, os.O_WRONLY | os.O_APPEND)
+    except FileNotFoundError:
+      self.__replace_changes(exclusive=True)
+      fd = os.open(filepath, os.O_WRONLY | os.O_APPEND)
+
+    try:
+      os.write(fd, "".join(f"{obj_id}\n" for obj_id in obj_ids).encode())
+      size = os.fstat(fd).st_size
+    finally:
+      os.close(fd)
+
+    if size > PickleStorage.MAX_CHANGES_BYTES:
+      self.__replace_changes()
+
+  def __replace_changes(self, exclusive: bool = False):
+    # An exclusive replace only creates a missing file, so
+    # processes creating it at once keep the same one
+
+    prefix = f"{PickleStorage.CHANGES_FILENAME}."
+    fd, tmp_filepath = mkstemp(suffix=PickleStorage.TMP_SUFFIX, prefix=prefix, dir=self.dirname)
+
+    try:
+      with open(fd, "w") as file:
+        file.write(f"{token_hex(8)}\n")
+
+      os.chmod(tmp_filepath, self.__file_mode)
+
+      if exclusive:
+        with suppress(FileExistsError):
+          os.link(tmp_filepath, join_paths(self.dirname, PickleStorage.CHANGES_FILENAME))
+
+        remove_file(tmp_filepath)
+      else:
+        os.replace(tmp_filepath, join_paths(self.dirname, PickleStorage.CHANGES_FILENAME))
+    except BaseException:
+      try:
+        remove_file(tmp_filepath)
+      except FileNotFoundError:
+        ...
+
+      raise
+
+  def __read_changes(self, position: tuple[bytes | None, int] | None) -> tuple[bytes | None, int, bytes]:
+    # Only whole lines are read, the last one may
+    # still be being appended by another process
+
+    try:
+      with open(join_paths(self.dirname, PickleStorage.CHANGES_FILENAME), "rb") as file:
+        token = file.readline()
+        start = position[1] if position is not None and position[0] == token else file.tell()
+
+        file.seek(start)
+        data = file.read()
+    except FileNotFoundError:
+      return None, 0, b""
+
+    end = data.rfind(b"\n") + 1
+
+    return token, start + end, data[:end]
+
+  # mkstemp creates files readable by the owner only, they're given
+  # the same mode open() would give them before replacing the targets
+
+  @staticmethod
+  def __get_file_mode() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+
+    return 0o666 & ~umask
+
+  def __remove(self, obj_id: int) -> bool:
+    try:
+      remove_file(self.__create_filepath(obj_id))
+      return True
+    except FileNotFoundError:
+      return False
+
+  # Temporary files of writers which crashed before the rename,
+  # fresh ones may still belong to a writer in another process
+
+  def __remove_tmp_files(self):
+    try:
+      files = listdir(self.dirname)
+    except FileNotFoundError:
+      return
+
+    now = time()
+
+    for file in files:
+      if not file.startswith(".") or not file.endswith(PickleStorage.TMP_SUFFIX):
+        continue
+
+      filepath = join_paths(self.dirname, file)
+
+      try:
+        if now - os.stat(filepath).st_mtime > PickleStorage.STALE_TMP_SECONDS:
+          remove_file(filepath)
+      except FileNotFoundError:
+        ...
+
+  def __fsync_dir(self):
+    if os.name == "nt":
+      return
+
+    fd = os.open(self.dirname, os.O_RDONLY)
+
+    try:
+      os.fsync(fd)
+    finally:
+      os.close(fd)
+
   def __create_dir(self):
     try:
       mkdir(self.dirname)
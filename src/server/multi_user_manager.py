@@ -30,3 +30,11 @@ class MultiUserManager:
   def persist_all_users(self):
     for manager in self.__managers.values():
       manager.persist_all_users()
+
+  def refresh(self, force: bool = False):
+    for manager in self.__managers.values():
+      manager.refresh(force)
+
+  def flush(self, force: bool = False):
+    for manager in self.__managers.values():
+      manager.flush(force)
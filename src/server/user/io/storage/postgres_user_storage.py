@@ -1,9 +1,16 @@
+import sys
+from collections import defaultdict
 from collections.abc import Iterable
+from contextlib import AbstractContextManager
+from os import getpid, register_at_fork
 from os.path import dirname
-from typing import cast, override
+from threading import Lock
+from typing import Any, Final, cast, override
+from weakref import ref
 
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
 
 from common.io.storage import Storage
 from common.user import Admin, Moderator, User
@@ -11,28 +18,108 @@ from common.user import Admin, Moderator, User
 __all__ = ["PostgresUserStorage"]
 
 
+# Connections inherited by forked children share their sockets with
+# the parent, so they're kept here and never closed or garbage collected
+
+_inherited_connections = list[Any]()
+
+
 class PostgresUserStorage(Storage[User]):
-  __conninfo: str
+  # A trigger notifies CHANGES_CHANNEL of every changed user,
+  # notifications are received by a separate connection per process.
+  # Those sent while it wasn't listening are lost, so the first poll
+  # of a new connection can't tell what has changed
+
+  CHANGES_CHANNEL: Final = "user_changes"
 
-  def __init__(self, conninfo: str):
+  __conninfo: str
+  __pooled: bool
+  __pool_min_size: int
+  __pool_max_size: int
+  __pool_max_idle: float
+  __pool_timeout: float
+  __pool_check: bool
+  __pool: ConnectionPool | None
+  __pool_pid: int
+  __pool_lock: Lock
+  __listener_lock: Lock
+  __listener: psycopg.Connection | None
+  __listener_pid: int
+
+  def __init__(
+    self,
+    conninfo: str,
+    pooled: bool = False,
+    pool_min_size: int = 1,
+    pool_max_size: int = 10,
+    pool_max_idle: float = 600.0,
+    pool_timeout: float = 30.0,
+    pool_check: bool = True,
+  ):
     super().__init__()
+
+    if pool_min_size < 0 or pool_max_size < max(pool_min_size, 1):
+      raise ValueError("Bad pool size bounds")
+
     self.__conninfo = conninfo
+    self.__pooled = pooled
+    self.__pool_min_size = pool_min_size
+    self.__pool_max_size = pool_max_size
+    self.__pool_max_idle = pool_max_idle
+    self.__pool_timeout = pool_timeout
+    self.__pool_check = pool_check
+    self.__pool = None
+    self.__pool_pid = -1
+    self.__pool_lock = Lock()
+    self.__listener_lock = Lock()
+    self.__listener = None
+    self.__listener_pid = -1
+
+    storage = ref(self)
+    register_at_fork(after_in_child=lambda: PostgresUserStorage.__detach_in_child(storage))
 
     schema_path = f"{dirname(__file__)}/schema.postgres.sql"
     with open(schema_path) as f:
       schema = f.read()
 
+    # Without parameters the script is sent as a simple query,
+    # so function bodies may contain semicolons
+
     with self.__connect() as conn:
       with conn.transaction():
-        for stmt in schema.split(";"):
-          stmt = stmt.strip()
-          if stmt:
-            conn.execute(stmt)
+        conn.execute(schema)
 
   @property
   def conninfo(self) -> str:
     return self.__conninfo
 
+  @property
+  def pooled(self) -> bool:
+    return self.__pooled
+
+  @property
+  @override
+  def stats(self) -> dict[str, int | float]:
+    pool = self.__pool
+
+    if pool is None or self.__pool_pid != getpid():
+      return {}
+
+    return dict(pool.get_stats())
+
+  def close(self):
+    with self.__pool_lock:
+      if self.__pool is not None and self.__pool_pid == getpid():
+        self.__pool.close()
+
+      self.__pool = None
+
+    with self.__listener_lock:
+      if self.__listener is not None and self.__listener_pid == getpid():
+        self.__listener.close()
+
+      self.__listener = None
+
   @override
   def persist(self, obj: User) -> int:
     return self.__insert(obj) if obj.id < 0 else self.__update(obj)
@@ -82,6 +169,85 @@ class PostgresUserStorage(Storage[User]):
 
         return user.id
 
+  @override
+  def persist_many(self, objs: Iterable[User]) -> list[int]:
+    users = list(objs)
+    new_users = [user for user in users if user.id < 0]
+    old_users = [user for user in users if user.id >= 0]
+
+    try:
+      with self.__connect() as conn:
+        with conn.transaction(), conn.cursor() as cursor:
+          if new_users:
+            cursor.executemany(
+              """
+                INSERT INTO "User" (login, name)
+                VALUES (%s, %s)
+                RETURNING id
+              """,
+              [(user.login, user.name) for user in new_users],
+              returning=True,
+            )
+
+            for user, result in zip(new_users, cursor.results(), strict=True):
+              user._id = cast(int, result.fetchone()["id"])
+
+          if old_users:
+            cursor.executemany(
+              """
+                UPDATE "User"
+                SET login = %s, name = %s
+                WHERE id = %s
+              """,
+              [(user.login, user.name, user.id) for user in old_users],
+            )
+
+          new_moderators = [user for user in new_users if isinstance(user, Moderator)]
+          old_moderators = [user for user in old_users if isinstance(user, Moderator)]
+          moderators = new_moderators + old_moderators
+          admins = [moderator for moderator in moderators if isinstance(moderator, Admin)]
+
+          if new_moderators:
+            cursor.executemany(
+              "INSERT INTO Moderator (id) VALUES (%s)",
+              [(moderator.id,) for moderator in new_moderators],
+            )
+
+          new_admins = [moderator for moderator in new_moderators if isinstance(moderator, Admin)]
+
+          if new_admins:
+            cursor.executemany(
+              "INSERT INTO Admin (id) VALUES (%s)",
+              [(admin.id,) for admin in new_admins],
+            )
+
+          if old_moderators:
+            cursor.execute(
+              "DELETE FROM VerifiedUser WHERE moderator_id = ANY(%s)",
+              ([moderator.id for moderator in old_moderators],),
+            )
+            cursor.execute(
+              "DELETE FROM CreatedPage WHERE admin_id = ANY(%s)",
+              ([moderator.id for moderator in old_moderators if isinstance(moderator, Admin)],),
+            )
+
+          with cursor.copy("COPY VerifiedUser (moderator_id, user_login) FROM STDIN") as copy:
+            for moderator in moderators:
+              for login in moderator._verified_users:
+                copy.write_row((moderator.id, login))
+
+          with cursor.copy("COPY CreatedPage (admin_id, name) FROM STDIN") as copy:
+            for admin in admins:
+              for page in admin._created_pages:
+                copy.write_row((admin.id, page))
+    except BaseException:
+      for user in new_users:
+        user._id = -1
+
+      raise
+
+    return [user.id for user in users]
+
   @staticmethod
   def __insert_to_moderators(conn: psycopg.Connection, moderator: Moderator):
     conn.execute("INSERT INTO Moderator (id) VALUES (%s)", (moderator.id,))
@@ -124,60 +290,110 @@ class PostgresUserStorage(Storage[User]):
 
   @override
   def load(self, user_id: int) -> User | None:
+    users = self.load_many([user_id])
+
+    return users[0] if len(users) > 0 else None
+
+  @override
+  def load_by_login(self, login: str) -> User | None:
     with self.__connect() as conn:
       with conn.transaction():
-        row = conn.execute(
-          """
-            SELECT
-              u.id AS user_id,
-              m.id AS moderator_id,
-              a.id AS admin_id,
-              u.login,
-              u.name
-            FROM "User" u
-            LEFT JOIN Moderator m ON u.id = m.id
-            LEFT JOIN Admin a ON u.id = a.id
-            WHERE u.id = %s
-          """,
-          (user_id,),
-        ).fetchone()
+        row = conn.execute('SELECT id FROM "User" WHERE login = %s LIMIT 1', (login,)).fetchone()
+        users = [] if row is None else PostgresUserStorage.__load_users(conn, [row["id"]])
 
-        if row is None:
-          return None
+    return users[0] if len(users) > 0 else None
 
-        user_id_val = row["user_id"]
-        moderator_id = row["moderator_id"]
-        admin_id = row["admin_id"]
-        login = row["login"]
-        name = row["name"]
+  @override
+  def load_many(self, obj_ids: Iterable[int]) -> list[User]:
+    ids = list(obj_ids)
 
-        user: User | None = None
+    with self.__connect() as conn:
+      with conn.transaction():
+        users_by_id = {user.id: user for user in PostgresUserStorage.__load_users(conn, ids)}
 
-        if admin_id is not None:
-          user = Admin()
-          pages = conn.execute(
-            "SELECT name FROM CreatedPage WHERE admin_id = %s",
-            (admin_id,),
-          ).fetchall()
-          user._created_pages = frozenset(r["name"] for r in pages)
+    users = map(users_by_id.get, ids)
 
-        if moderator_id is not None:
-          if user is None:
-            user = Moderator()
-          users = conn.execute(
-            "SELECT user_login FROM VerifiedUser WHERE moderator_id = %s",
-            (moderator_id,),
-          ).fetchall()
-          cast(Moderator, user)._verified_users = frozenset(r["user_login"] for r in users)
+    return [user for user in users if user is not None]
 
-        if user is None:
-          user = User()
+  @override
+  def load_all(self) -> list[User]:
+    with self.__connect() as conn:
+      with conn.transaction():
+        return PostgresUserStorage.__load_users(conn)
 
-        user._id = user_id_val
-        user._login = login
-        user._name = name
+  @override
+  def load_page(self, after_id: int | None = None, limit: int | None = None) -> list[User]:
+    with self.__connect() as conn:
+      with conn.transaction():
+        rows = conn.execute(
+          'SELECT id FROM "User" WHERE id > %s ORDER BY id LIMIT %s',
+          (-1 if after_id is None else after_id, limit),
+        ).fetchall()
 
-        return user
+        return PostgresUserStorage.__load_users(conn, [r["id"] for r in rows])
+
+  @staticmethod
+  def __load_users(conn: psycopg.Connection, user_ids: list[int] | None = None) -> list[User]:
+    if user_ids is None:
+      user_filter = moderator_filter = admin_filter = ""
+      params = ()
+    else:
+      user_filter = "WHERE u.id = ANY(%s)"
+      moderator_filter = "WHERE moderator_id = ANY(%s)"
+      admin_filter = "WHERE admin_id = ANY(%s)"
+      params = (user_ids,)
+
+    rows = conn.execute(
+      f"""
+        SELECT
+          u.id AS user_id,
+          m.id AS moderator_id,
+          a.id AS admin_id,
+          u.login,
+          u.name
+        FROM "User" u
+        LEFT JOIN Moderator m ON u.id = m.id
+        LEFT JOIN Admin a ON u.id = a.id
+        {user_filter}
+        ORDER BY u.id
+      """,
+      params,
+    ).fetchall()
+
+    verified_users = defaultdict[int, list[str]](list)
+
+    for r in conn.execute(f"SELECT moderator_id, user_login FROM VerifiedUser {moderator_filter}", params):
+      verified_users[r["moderator_id"]].append(r["user_login"])
+
+    created_pages = defaultdict[int, list[str]](list)
+
+    for r in conn.execute(f"SELECT admin_id, name FROM CreatedPage {admin_filter}", params):
+      created_pages[r["admin_id"]].append(r["name"])
+
+    users = list[User]()
+
+    for row in rows:
+      user_id = row["user_id"]
+      user: User
+
+      if row["admin_id"] is not None:
+        user = Admin()
+        user._created_pages = User._compact_set(created_pages.get(user_id, ()))
+      elif row["moderator_id"] is not None:
+        user = Moderator()
+      else:
+        user = User()
+
+      if isinstance(user, Moderator):
+        user._verified_users = User._compact_set(map(sys.intern, verified_users.get(user_id, ())))
+
+      user._id = user_id
+      user._login = row["login"]
+      user._name = row["name"]
+
+      users.append(user)
+
+    return users
 
   @override
   def load_all_ids(self) -> Iterable[int]:
@@ -197,10 +413,103 @@ class PostgresUserStorage(Storage[User]):
       result = conn.execute('DELETE FROM "User" WHERE id = %s', (user_id,))
       return result.rowcount > 0
 
+  @override
+  def delete_many(self, obj_ids: Iterable[int]) -> int:
+    with self.__connect() as conn:
+      result = conn.execute('DELETE FROM "User" WHERE id = ANY(%s)', (list(obj_ids),))
+      return result.rowcount
+
   @override
   def delete_all(self):
     with self.__connect() as conn:
       conn.execute('DELETE FROM "User"')
 
-  def __connect(self) -> psycopg.Connection:
-    return psycopg.connect(self.__conninfo, row_factory=dict_row)
+  @override
+  def poll_changes(self) -> list[int] | None:
+    with self.__listener_lock:
+      listener = self.__listener
+
+      if listener is None or self.__listener_pid != getpid() or listener.closed:
+        started = self.__listener_pid < 0
+        self.__listen()
+
+        return [] if started else None
+
+      try:
+        notifies = list(listener.notifies(timeout=0))
+      except psycopg.OperationalError:
+        self.__listen()
+        return None
+
+    return list(dict.fromkeys(int(notify.payload) for notify in notifies))
+
+  def __listen(self):
+    # The old connection is closed only in the process which opened it,
+    # a forked one would close the socket shared with its parent
+
+    if self.__listener is not None and self.__listener_pid == getpid():
+      self.__listener.close()
+
+    self.__listener = psycopg.connect(self.__conninfo, autocommit=True)
+    self.__listener_pid = getpid()
+    self.__listener.execute(f"LISTEN {PostgresUserStorage.CHANGES_CHANNEL}")
+
+  def __connect(self) -> AbstractContextManager[psycopg.Connection[Any]]:
+    if not self.__pooled:
+      return psycopg.connect(self.__conninfo, row_factory=dict_row)
+
+    return self.__get_pool().connection()
+
+  @staticmethod
+  def __detach_in_child(storage_ref: "ref[PostgresUserStorage]"):
+    storage = storage_ref()
+
+    if storage is not None:
+      storage.__detach_pool()
+      storage.__detach_listener()
+
+  def __detach_pool(self):
+    # The lock may have been held by another thread at the time of fork()
+
+    self.__pool_lock = Lock()
+
+    if self.__pool is not None:
+      _inherited_connections.append(self.__pool)
+
+    self.__pool = None
+    self.__pool_pid = -1
+
+  def __detach_listener(self):
+    # The pid is kept, so the next poll tells that
+    # notifications sent until then have been missed
+
+    self.__listener_lock = Lock()
+
+    if self.__listener is not None:
+      _inherited_connections.append(self.__listener)
+
+    self.__listener = None
+
+  def __get_pool(self) -> ConnectionPool:
+    pid = getpid()
+
+    # The pool's worker threads don't survive fork(), so each forked
+    # uWSGI worker lazily opens a pool of its own once the inherited
+    # one is detached
+
+    with self.__pool_lock:
+      if self.__pool is None or self.__pool_pid != pid:
+        self.__pool = ConnectionPool(
+          self.__conninfo,
+          min_size=self.__pool_min_size,
+          max_size=self.__pool_max_size,
+          max_idle=self.__pool_max_idle,
+          timeout=self.__pool_timeout,
+          check=ConnectionPool.check_connection if self.__pool_check else None,
+          kwargs={"row_factory": dict_row},
+          name="postgres-user-storage",
+          open=True,
+        )
+        self.__pool_pid = pid
+
+      return self.__pool
@@ -4,6 +4,8 @@ CREATE TABLE IF NOT EXISTS "User" (
     name  TEXT
 );
 
+CREATE INDEX IF NOT EXISTS UserLogin ON "User" (login);
+
 CREATE TABLE IF NOT EXISTS Moderator (
     id INTEGER PRIMARY KEY,
 
@@ -35,3 +37,21 @@ CREATE TABLE IF NOT EXISTS CreatedPage (
 
     FOREIGN KEY (admin_id) REFERENCES Admin (id) ON DELETE CASCADE
 );
+
+-- Ids of changed users are sent to other processes listening on user_changes
+
+CREATE OR REPLACE FUNCTION NotifyUserChange() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('user_changes', OLD.id::text);
+    ELSE
+        PERFORM pg_notify('user_changes', NEW.id::text);
+    END IF;
+
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER UserChanged
+    AFTER INSERT OR UPDATE OR DELETE ON "User"
+    FOR EACH ROW EXECUTE FUNCTION NotifyUserChange();
@@ -4,6 +4,8 @@ CREATE TABLE IF NOT EXISTS User (
     name  TEXT
 );
 
+CREATE INDEX IF NOT EXISTS UserLogin ON User (login);
+
 CREATE TABLE IF NOT EXISTS Moderator (
     id INTEGER PRIMARY KEY,
 
@@ -33,3 +35,27 @@ CREATE TABLE IF NOT EXISTS CreatedPage (
 
     UNIQUE (admin_id, name) ON CONFLICT REPLACE
 );
+
+-- Ids of changed users for other processes to refresh,
+-- only the most recent changes are kept
+
+CREATE TABLE IF NOT EXISTS UserChange (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS UserInserted AFTER INSERT ON User BEGIN
+    INSERT INTO UserChange (user_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS UserUpdated AFTER UPDATE ON User BEGIN
+    INSERT INTO UserChange (user_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS UserDeleted AFTER DELETE ON User BEGIN
+    INSERT INTO UserChange (user_id) VALUES (OLD.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS UserChangeAdded AFTER INSERT ON UserChange BEGIN
+    DELETE FROM UserChange WHERE seq <= NEW.seq - 10000;
+END;
@@ -1,7 +1,12 @@
 import sqlite3
-from collections.abc import Iterable
+import sys
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from os import getpid
 from os.path import dirname
-from typing import cast, override
+from threading import Lock, local
+from typing import Final, cast, override
 
 from common.io.storage import Storage
 from common.user import Admin, Moderator, User
@@ -10,24 +15,92 @@ __all__ = ["Sqlite3UserStorage"]
 
 
 class Sqlite3UserStorage(Storage[User]):
-  __database: str
+  # Triggers log ids of changed users to the UserChange table.
+  # Changes are polled through a separate connection whose data_version
+  # tells if anything has been committed since the previous poll
+
+  JOURNAL_MODES: Final = ("delete", "truncate", "persist", "memory", "wal", "off")
+  SYNCHRONOUS_MODES: Final = ("off", "normal", "full", "extra")
+  IDS_PER_QUERY: Final = 500
 
-  def __init__(self, database: str = "users.sqlite3"):
+  __database: str
+  __reuse_connections: bool
+  __synchronous: str
+  __cache_size: int
+  __mmap_size: int
+  __busy_timeout: float
+  __local: local
+  __watch_lock: Lock
+  __watch_connection: sqlite3.Connection | None
+  __watch_pid: int
+  __data_version: int | None
+  __change_seq: int | None
+
+  def __init__(
+    self,
+    database: str = "users.sqlite3",
+    reuse_connections: bool = False,
+    journal_mode: str = "wal",
+    synchronous: str = "normal",
+    cache_size: int = -2000,
+    mmap_size: int = 0,
+    busy_timeout: float = 5.0,
+  ):
     super().__init__()
 
+    journal_mode = journal_mode.lower()
+    synchronous = synchronous.lower()
+
+    if journal_mode not in Sqlite3UserStorage.JOURNAL_MODES:
+      raise ValueError(f"Bad journal mode: {repr(journal_mode)}")
+
+    if synchronous not in Sqlite3UserStorage.SYNCHRONOUS_MODES:
+      raise ValueError(f"Bad synchronous mode: {repr(synchronous)}")
+
     self.__database = database
+    self.__reuse_connections = reuse_connections
+    self.__synchronous = synchronous
+    self.__cache_size = int(cache_size)
+    self.__mmap_size = int(mmap_size)
+    self.__busy_timeout = busy_timeout
+    self.__local = local()
+    self.__watch_lock = Lock()
+    self.__watch_connection = None
+    self.__watch_pid = -1
+    self.__data_version = None
+    self.__change_seq = None
 
     schema_script_path = f"{dirname(__file__)}/schema.sqlite3.sql"
     with open(schema_script_path) as f:
       schema_script = f.read()
 
     with self.__connect() as connection:
+      # Journal mode is persistent, so it's enough to set it once per database
+      connection.execute(f"PRAGMA journal_mode = {journal_mode}")
       connection.executescript(schema_script)
 
   @property
   def database(self) -> str:
     return self.__database
 
+  @property
+  def reuse_connections(self) -> bool:
+    return self.__reuse_connections
+
+  def close(self):
+    connection = getattr(self.__local, "connection", None)
+
+    if connection is not None and self.__local.pid == getpid():
+      connection.close()
+
+    self.__local.connection = None
+
+    with self.__watch_lock:
+      if self.__watch_connection is not None and self.__watch_pid == getpid():
+        self.__watch_connection.close()
+
+      self.__watch_connection = None
+
   @override
   def persist(self, obj: User) -> int:
     return self.__insert(obj) if obj.id < 0 else self.__update(obj)
@@ -36,7 +109,7 @@ class Sqlite3UserStorage(Storage[User]):
     with self.__connect() as connection:
       cursor = connection.cursor()
 
-      cursor.execute("BEGIN")
+      cursor.execute("BEGIN IMMEDIATE")
 
       Sqlite3UserStorage.__insert_to_users(cursor, user)
 
@@ -58,7 +131,7 @@ class Sqlite3UserStorage(Storage[User]):
     with self.__connect() as connection:
       cursor = connection.cursor()
 
-      cursor.execute("BEGIN")
+      cursor.execute("BEGIN IMMEDIATE")
 
       Sqlite3UserStorage.__update_user(cursor, user)
 
@@ -74,6 +147,91 @@ class Sqlite3UserStorage(Storage[User]):
 
       return user.id
 
+  @override
+  def persist_many(self, objs: Iterable[User]) -> list[int]:
+    users = list(objs)
+    new_users = [user for user in users if user.id < 0]
+    old_users = [user for user in users if user.id >= 0]
+
+    with self.__connect() as connection:
+      cursor = connection.cursor()
+
+      cursor.execute("BEGIN IMMEDIATE")
+
+      try:
+        for user in new_users:
+          Sqlite3UserStorage.__insert_to_users(cursor, user)
+          user._id = cast(int, cursor.lastrowid)
+
+        cursor.executemany(
+          """
+            UPDATE
+              User
+            SET
+              login = ?,
+              name  = ?
+            WHERE
+              id = ?
+          """,
+          map(lambda user: (user.login, user.name, user.id), old_users),
+        )
+
+        new_moderators = [user for user in new_users if isinstance(user, Moderator)]
+        old_moderators = [user for user in old_users if isinstance(user, Moderator)]
+        moderators = new_moderators + old_moderators
+        admins = [moderator for moderator in moderators if isinstance(moderator, Admin)]
+
+        cursor.executemany(
+          "INSERT INTO Moderator (id) VALUES (?)",
+          map(lambda moderator: (moderator.id,), new_moderators),
+        )
+
+        cursor.executemany(
+          "INSERT INTO Admin (id) VALUES (?)",
+          map(lambda admin: (admin.id,), filter(lambda moderator: isinstance(moderator, Admin), new_moderators)),
+        )
+
+        cursor.executemany(
+          "DELETE FROM VerifiedUser WHERE moderator_id = ?",
+          map(lambda moderator: (moderator.id,), old_moderators),
+        )
+
+        cursor.executemany(
+          "DELETE FROM CreatedPage WHERE admin_id = ?",
+          map(lambda admin: (admin.id,), filter(lambda moderator: isinstance(moderator, Admin), old_moderators)),
+        )
+
+        cursor.executemany(
+          """
+            INSERT INTO
+              VerifiedUser (moderator_id, user_login)
+            VALUES
+              (?, ?)
+          """,
+          ((moderator.id, login) for moderator in moderators for login in moderator._verified_users),
+        )
+
+        cursor.executemany(
+          """
+            INSERT INTO
+              CreatedPage (admin_id, name)
+            VALUES
+              (?, ?)
+          """,
+          ((admin.id, page) for admin in admins for page in admin._created_pages),
+        )
+
+        cursor.execute("COMMIT")
+      except BaseException:
+        cursor.execute("ROLLBACK")
+
+        for user in new_users:
+          user._id = -1
+
+        raise
+
+    return [user.id for user in users]
+
   @staticmethod
   def __update_user(cursor: sqlite3.Cursor, user: User):
     cursor.execute(
@@ -153,91 +311,187 @@ class Sqlite3UserStorage(Storage[User]):
 
   @override
   def load(self, user_id: int) -> User | None:
+    users = self.load_many([user_id])
+
+    return users[0] if len(users) > 0 else None
+
+  @override
+  def load_by_login(self, login: str) -> User | None:
+    with self.__connect() as connection:
+      cursor = connection.cursor()
+
+      cursor.execute("BEGIN")
+      cursor.execute("SELECT id FROM User WHERE login = ? LIMIT 1", (login,))
+
+      row = cursor.fetchone()
+      users = [] if row is None else Sqlite3UserStorage.__load_users(cursor, [row[0]])
+
+      cursor.execute("COMMIT")
+
+    return users[0] if len(users) > 0 else None
+
+  @override
+  def load_many(self, obj_ids: Iterable[int]) -> list[User]:
+    ids = list(obj_ids)
+
+    with self.__connect() as connection:
+      cursor = connection.cursor()
+
+      cursor.execute("BEGIN")
+
+      users_by_id = dict[int, User]()
+
+      # Chunked to stay under SQLITE_MAX_VARIABLE_NUMBER
+
+      for i in range(0, len(ids), Sqlite3UserStorage.IDS_PER_QUERY):
+        chunk = ids[i : i + Sqlite3UserStorage.IDS_PER_QUERY]
+
+        for user in Sqlite3UserStorage.__load_users(cursor, chunk):
+          users_by_id[user.id] = user
+
+      cursor.execute("COMMIT")
+
+    users = map(users_by_id.get, ids)
+
+    return [user for user in users if user is not None]
+
+  @override
+  def load_all(self) -> list[User]:
     with self.__connect() as connection:
       cursor = connection.cursor()
 
       cursor.execute("BEGIN")
 
+      users = Sqlite3UserStorage.__load_users(cursor)
+
+      cursor.execute("COMMIT")
+
+      return users
+
+  @override
+  def load_page(self, after_id: int | None = None, limit: int | None = None) -> list[User]:
+    with self.__connect() as connection:
+      cursor = connection.cursor()
+
+      cursor.execute("BEGIN")
       cursor.execute(
         """
           SELECT
-            u.id as user_id,
-            m.id as moderator_id,
-            a.id as admin_id,
-            u.login,
-            u.name
+            id
           FROM
-            User u
-          LEFT JOIN Moderator m ON
-            u.id = m.id
-          LEFT JOIN Admin a ON
-            u.id = a.id
+            User
           WHERE
-            u.id = ?
+            id > ?
+          ORDER BY
+            id
+          LIMIT
+            ?
         """,
-        (user_id,),
+        (-1 if after_id is None else after_id, -1 if limit is None else limit),
       )
 
-      row = cursor.fetchone()
+      ids = [row[0] for row in cursor.fetchall()]
+      users = list[User]()
 
-      if row is None:
-        return None
+      for i in range(0, len(ids), Sqlite3UserStorage.IDS_PER_QUERY):
+        users.extend(Sqlite3UserStorage.__load_users(cursor, ids[i : i + Sqlite3UserStorage.IDS_PER_QUERY]))
 
-      _, moderator_id, admin_id, login, name = row
+      cursor.execute("COMMIT")
 
-      user: User | None = None
+      return users
 
-      if admin_id is not None:
-        user = Admin()
+  @staticmethod
+  def __load_users(cursor: sqlite3.Cursor, user_ids: list[int] | None = None) -> list[User]:
+    if user_ids is None:
+      user_filter = moderator_filter = admin_filter = ""
+      params = ()
+    else:
+      placeholders = ", ".join("?" * len(user_ids))
+      user_filter = f"WHERE u.id IN ({placeholders})"
+      moderator_filter = f"WHERE moderator_id IN ({placeholders})"
+      admin_filter = f"WHERE admin_id IN ({placeholders})"
+      params = tuple(user_ids)
 
-        cursor.execute(
-          """
-            SELECT
-              name
-            FROM
-              CreatedPage
-            WHERE
-              admin_id = ?
-          """,
-          (admin_id,),
-        )
+    cursor.execute(
+      f"""
+        SELECT
+          u.id as user_id,
+          m.id as moderator_id,
+          a.id as admin_id,
+          u.login,
+          u.name
+        FROM
+          User u
+        LEFT JOIN Moderator m ON
+          u.id = m.id
+        LEFT JOIN Admin a ON
+          u.id = a.id
+        {user_filter}
+        ORDER BY
+          u.id
+      """,
+      params,
+    )
 
-        rows = cursor.fetchall()
-        pages = map(lambda entry: entry[0], rows)
+    rows = cursor.fetchall()
 
-        user._created_pages = frozenset(pages)
+    cursor.execute(
+      f"""
+        SELECT
+          moderator_id,
+          user_login
+        FROM
+          VerifiedUser
+        {moderator_filter}
+      """,
+      params,
+    )
 
-      if moderator_id is not None:
-        if user is None:
-          user = Moderator()
+    verified_users = defaultdict[int, list[str]](list)
 
-        cursor.execute(
-          """
-            SELECT
-              user_login
-            FROM
-              VerifiedUser
-            WHERE
-              moderator_id = ?
-          """,
-          (moderator_id,),
-        )
+    for moderator_id, user_login in cursor:
+      verified_users[moderator_id].append(user_login)
 
-        rows = cursor.fetchall()
-        users = map(lambda entry: entry[0], rows)
+    cursor.execute(
+      f"""
+        SELECT
+          admin_id,
+          name
+        FROM
+          CreatedPage
+        {admin_filter}
+      """,
+      params,
+    )
+
+    created_pages = defaultdict[int, list[str]](list)
+
+    for admin_id, name in cursor:
+      created_pages[admin_id].append(name)
 
-        cast(Moderator, user)._verified_users = frozenset(users)
+    users = list[User]()
 
-      if user is None:
+    for user_id, moderator_id, admin_id, login, name in rows:
+      user: User
+
+      if admin_id is not None:
+        user = Admin()
+        user._created_pages = User._compact_set(created_pages.get(admin_id, ()))
+      elif moderator_id is not None:
+        user = Moderator()
+      else:
         user = User()
 
+      if isinstance(user, Moderator):
+        user._verified_users = User._compact_set(map(sys.intern, verified_users.get(user_id, ())))
+
       user._id = user_id
       user._login = login
       user._name = name
 
-      cursor.execute("COMMIT")
+      users.append(user)
 
-      return user
+    return users
 
   @override
   def load_all_ids(self) -> Iterable[int]:
@@ -265,10 +519,111 @@ class Sqlite3UserStorage(Storage[User]):
 
       return deleted
 
+  @override
+  def delete_many(self, obj_ids: Iterable[int]) -> int:
+    with self.__connect() as connection:
+      cursor = connection.cursor()
+
+      cursor.execute("BEGIN IMMEDIATE")
+      cursor.executemany("DELETE FROM User WHERE id = ?", map(lambda user_id: (user_id,), obj_ids))
+
+      deleted = cursor.rowcount
+
+      cursor.execute("COMMIT")
+
+      return deleted
+
   @override
   def delete_all(self):
     with self.__connect() as connection:
       connection.execute("DELETE FROM User")
 
-  def __connect(self) -> sqlite3.Connection:
-    return sqlite3.connect(self.__database, isolation_level=None)
+  @override
+  def poll_changes(self) -> list[int] | None:
+    with self.__watch_lock:
+      connection = self.__get_watch_connection()
+      data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+
+      if data_version == self.__data_version and self.__change_seq is not None:
+        return []
+
+      self.__data_version = data_version
+
+      connection.execute("BEGIN")
+
+      try:
+        first_seq, last_seq = connection.execute("SELECT MIN(seq), MAX(seq) FROM UserChange").fetchone()
+        last_seq = 0 if last_seq is None else last_seq
+
+        if self.__change_seq is None:
+          ids = []
+        elif first_seq is not None and first_seq > self.__change_seq + 1:
+          # Some of the changes have already been dropped from the log
+
+          ids = None
+        else:
+          cursor = connection.execute("SELECT DISTINCT user_id FROM UserChange WHERE seq > ?", (self.__change_seq,))
+          ids = [row[0] for row in cursor]
+
+        self.__change_seq = last_seq
+      finally:
+        connection.execute("COMMIT")
+
+      return ids
+
+  def __get_watch_connection(self) -> sqlite3.Connection:
+    pid = getpid()
+
+    # data_version values of different connections can't be compared,
+    # so the log is read on the first poll of a new connection
+
+    if self.__watch_connection is None or self.__watch_pid != pid:
+      self.__watch_connection = self.__open_connection(check_same_thread=False)
+      self.__watch_pid = pid
+      self.__data_version = None
+
+    return self.__watch_connection
+
+  @contextmanager
+  def __connect(self) -> Iterator[sqlite3.Connection]:
+    connection = self.__get_thread_connection() if self.__reuse_connections else self.__open_connection()
+
+    try:
+      yield connection
+    finally:
+      # A transaction left open by a failed operation
+      # must not leak into the next user of the connection
+
+      if connection.in_transaction:
+        connection.execute("ROLLBACK")
+
+      if not self.__reuse_connections:
+        connection.close()
+
+  def __get_thread_connection(self) -> sqlite3.Connection:
+    connection = getattr(self.__local, "connection", None)
+    pid = getpid()
+
+    # Connections must not be carried across fork(),
+    # so forked uWSGI workers open their own ones
+
+    if connection is None or self.__local.pid != pid:
+      connection = self.__open_connection()
+      self.__local.connection = connection
+      self.__local.pid = pid
+
+    return connection
+
+  def __open_connection(self, check_same_thread: bool = True) -> sqlite3.Connection:
+    connection = sqlite3.connect(
+      self.__database,
+      timeout=self.__busy_timeout,
+      isolation_level=None,
+      check_same_thread=check_same_thread,
+    )
+
+    connection.execute(f"PRAGMA synchronous = {self.__synchronous}")
+    connection.execute(f"PRAGMA cache_size = {self.__cache_size}")
+    connection.execute(f"PRAGMA mmap_size = {self.__mmap_size}")
+
+    return connection
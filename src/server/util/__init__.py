@@ -1 +1 @@
-from . import flask
+from . import compression, flask, metrics
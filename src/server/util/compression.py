@@ -0,0 +1,153 @@
+import zlib
+from collections.abc import Callable, Iterable, Iterator
+from typing import Final
+
+from flask import Blueprint, Flask, Response, request
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+__all__ = [
+  "COMPRESSIBLE_MIMETYPES",
+  "compress_responses",
+  "get_available_encodings",
+]
+
+
+COMPRESSIBLE_MIMETYPES: Final = frozenset(
+  [
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+  ]
+)
+
+
+class _Compressor:
+  compress: Callable[[bytes], bytes]
+  flush: Callable[[], bytes]
+  finish: Callable[[], bytes]
+
+  def __init__(self, encoding: str, level: int):
+    match encoding:
+      case "zstd":
+        zstd = zstandard.ZstdCompressor(level=level).compressobj()
+        self.compress = zstd.compress
+        self.flush = lambda: zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        self.finish = zstd.flush
+      case "br":
+        br = brotli.Compressor(quality=level)
+        self.compress = br.process
+        self.flush = br.flush
+        self.finish = br.finish
+      case "gzip" | "deflate":
+        # gzip wraps the deflate stream in a gzip header,
+        # HTTP deflate in a zlib one
+
+        wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+        z = zlib.compressobj(level, zlib.DEFLATED, wbits)
+        self.compress = z.compress
+        self.flush = lambda: z.flush(zlib.Z_SYNC_FLUSH)
+        self.finish = z.flush
+      case _:
+        raise ValueError(f"Unsupported encoding: {repr(encoding)}")
+
+
+def get_available_encodings() -> list[str]:
+  # In order of preference, zstd and brotli
+  # are used only if their packages are installed
+
+  encodings = list[str]()
+
+  if zstandard is not None:
+    encodings.append("zstd")
+
+  if brotli is not None:
+    encodings.append("br")
+
+  encodings += ["gzip", "deflate"]
+
+  return encodings
+
+
+def compress_responses(target: Flask | Blueprint, min_size: int = 1024, level: int = 6):
+  # Responses are compressed with the best encoding accepted by the client.
+  # Streamed ones are compressed chunk by chunk and flushed after
+  # every chunk, so they're still sent while being produced
+
+  if min_size < 0:
+    raise ValueError("min_size must be non-negative")
+
+  if not 1 <= level <= 9:
+    raise ValueError("level must be in range [1, 9]")
+
+  encodings = get_available_encodings()
+
+  @target.after_request
+  def compress_response(response: Response) -> Response:
+    if not _is_compressible(response):
+      return response
+
+    content_length = response.content_length
+
+    if content_length is not None and content_length < min_size:
+      return response
+
+    response.vary.add("Accept-Encoding")
+
+    encoding = request.accept_encodings.best_match(encodings)
+
+    if encoding is None:
+      return response
+
+    if response.is_streamed:
+      response.response = _compress_chunks(response.iter_encoded(), encoding, level)
+      response.headers.pop("Content-Length", None)
+    else:
+      compressor = _Compressor(encoding, level)
+      response.set_data(compressor.compress(response.get_data()) + compressor.finish())
+
+    response.headers["Content-Encoding"] = encoding
+
+    # Compressed bodies differ byte by byte from the original ones,
+    # a weak tag still matches the original one in If-None-Match
+
+    etag, weak = response.get_etag()
+
+    if etag is not None and not weak:
+      response.set_etag(etag, weak=True)
+
+    return response
+
+
+def _is_compressible(response: Response) -> bool:
+  if response.status_code < 200 or response.status_code in (204, 206, 304):
+    return False
+
+  if response.direct_passthrough or "Content-Encoding" in response.headers:
+    return False
+
+  mimetype = response.mimetype or ""
+
+  return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def _compress_chunks(chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+  compressor = _Compressor(encoding, level)
+
+  for chunk in chunks:
+    data = compressor.compress(chunk) + compressor.flush()
+
+    if len(data) > 0:
+      yield data
+
+  yield compressor.finish()
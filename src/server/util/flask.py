@@ -1,11 +1,66 @@
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from threading import Lock
 from typing import Any
 
 from flask import render_template
 
-from common.util.type import get_all_typed_attrs_info
+from common.util.type import AttrInfo, get_all_typed_attrs_info
 
-__all__ = ["render_object"]
+from .metrics import timed
+
+__all__ = ["FragmentCache", "get_object_attrs", "render_object"]
+
+
+class FragmentCache:
+  # Fragments are kept with the version they were rendered for
+  # and rendered anew once it changes. The least recently used
+  # ones are dropped when there are more than max_entries
+
+  __max_entries: int
+  __entries: OrderedDict[Hashable, tuple[str, str]]
+  __lock: Lock
+
+  def __init__(self, max_entries: int = 10000):
+    if max_entries <= 0:
+      raise ValueError("max_entries must be positive")
+
+    self.__max_entries = max_entries
+    self.__entries = OrderedDict()
+    self.__lock = Lock()
+
+  @property
+  def max_entries(self) -> int:
+    return self.__max_entries
+
+  def get(self, key: Hashable, version: str, render: Callable[[], str]) -> str:
+    with self.__lock:
+      entry = self.__entries.get(key)
+
+      if entry is not None and entry[0] == version:
+        self.__entries.move_to_end(key)
+        return entry[1]
+
+    fragment = render()
+
+    with self.__lock:
+      self.__entries[key] = (version, fragment)
+      self.__entries.move_to_end(key)
+
+      while len(self.__entries) > self.__max_entries:
+        self.__entries.popitem(last=False)
+
+    return fragment
+
+  def clear(self):
+    with self.__lock:
+      self.__entries.clear()
+
+
+def get_object_attrs(obj: Any) -> dict[str, AttrInfo]:
+  with timed("reflection_duration_seconds", "reflection", type=type(obj).__name__):
+    return get_all_typed_attrs_info(obj)
 
 
 def render_object(obj: Any) -> str:
-  return render_template("object.jinja", attrs=get_all_typed_attrs_info(obj))
+  return render_template("object.jinja", attrs=get_object_attrs(obj))
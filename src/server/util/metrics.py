@@ -0,0 +1,236 @@
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from threading import Lock
+from time import perf_counter
+from typing import Any, Final
+
+from flask import Flask, Response, current_app, g, has_app_context, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+
+__all__ = [
+  "Metrics",
+  "add_server_timing",
+  "instrument_app",
+  "timed",
+]
+
+
+LabelsKey = tuple[tuple[str, str], ...]
+
+
+class Metrics:
+  BUCKETS: Final = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+  __lock: Lock
+  __help: dict[str, str]
+  __counters: dict[str, dict[LabelsKey, float]]
+  __histograms: dict[str, dict[LabelsKey, list[float]]]
+  __collectors: list[Callable[[], Iterable[tuple[str, dict[str, str], float]]]]
+
+  def __init__(self):
+    self.__lock = Lock()
+    self.__help = {}
+    self.__counters = {}
+    self.__histograms = {}
+    self.__collectors = []
+
+  def describe(self, name: str, help: str):
+    self.__help[name] = help
+
+  def add_collector(self, collector: Callable[[], Iterable[tuple[str, dict[str, str], float]]]):
+    self.__collectors.append(collector)
+
+  def inc(self, name: str, value: float = 1, **labels: str):
+    key = Metrics.__labels_key(labels)
+
+    with self.__lock:
+      series = self.__counters.setdefault(name, {})
+      series[key] = series.get(key, 0) + value
+
+  def observe(self, name: str, seconds: float, **labels: str):
+    key = Metrics.__labels_key(labels)
+    bucket = bisect_left(Metrics.BUCKETS, seconds)
+
+    # Per-bucket counts plus count and sum in the last two slots,
+    # cumulative counts are only computed when rendering
+
+    with self.__lock:
+      series = self.__histograms.setdefault(name, {})
+      values = series.get(key)
+
+      if values is None:
+        values = series[key] = [0.0] * (len(Metrics.BUCKETS) + 3)
+
+      values[bucket] += 1
+      values[-2] += 1
+      values[-1] += seconds
+
+  @contextmanager
+  def timer(self, name: str, timing: str | None = None, **labels: str) -> Iterator[None]:
+    start = perf_counter()
+
+    try:
+      yield
+    finally:
+      seconds = perf_counter() - start
+      self.observe(name, seconds, **labels)
+
+      if timing is not None:
+        add_server_timing(timing, seconds)
+
+  def clear(self):
+    with self.__lock:
+      self.__counters.clear()
+      self.__histograms.clear()
+
+  def render(self) -> str:
+    lines = list[str]()
+
+    with self.__lock:
+      counters = {name: dict(series) for name, series in self.__counters.items()}
+      histograms = {
+        name: {key: list(values) for key, values in series.items()} for name, series in self.__histograms.items()
+      }
+
+    for name, series in sorted(counters.items()):
+      self.__render_header(lines, name, "counter")
+
+      for key, value in sorted(series.items()):
+        lines.append(f"{name}{Metrics.__format_labels(key)} {Metrics.__format_value(value)}")
+
+    for name, series in sorted(histograms.items()):
+      self.__render_header(lines, name, "histogram")
+
+      for key, values in sorted(series.items()):
+        cumulative = 0.0
+
+        for bound, count in zip((*Metrics.BUCKETS, "+Inf"), values[:-2], strict=True):
+          cumulative += count
+          labels = Metrics.__format_labels((*key, ("le", str(bound))))
+          lines.append(f"{name}_bucket{labels} {Metrics.__format_value(cumulative)}")
+
+        lines.append(f"{name}_count{Metrics.__format_labels(key)} {Metrics.__format_value(values[-2])}")
+        lines.append(f"{name}_sum{Metrics.__format_labels(key)} {values[-1]}")
+
+    gauges = dict[str, list[tuple[LabelsKey, float]]]()
+
+    for collector in self.__collectors:
+      for name, labels, value in collector():
+        gauges.setdefault(name, []).append((Metrics.__labels_key(labels), value))
+
+    for name, series in sorted(gauges.items()):
+      self.__render_header(lines, name, "gauge")
+
+      for key, value in sorted(series):
+        lines.append(f"{name}{Metrics.__format_labels(key)} {Metrics.__format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+  def __render_header(self, lines: list[str], name: str, type: str):
+    help = self.__help.get(name)
+
+    if help is not None:
+      lines.append(f"# HELP {name} {help}")
+
+    lines.append(f"# TYPE {name} {type}")
+
+  @staticmethod
+  def __labels_key(labels: dict[str, str]) -> LabelsKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+  @staticmethod
+  def __format_labels(key: LabelsKey) -> str:
+    if len(key) == 0:
+      return ""
+
+    def escape(value: str) -> str:
+      return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in key) + "}"
+
+  @staticmethod
+  def __format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def timed(name: str, timing: str | None = None, **labels: str) -> AbstractContextManager:
+  metrics = current_app.extensions.get("metrics") if has_app_context() else None
+
+  return nullcontext() if metrics is None else metrics.timer(name, timing, **labels)
+
+
+def add_server_timing(name: str, seconds: float):
+  if not has_request_context():
+    return
+
+  timings = g.get("server_timings")
+
+  if timings is not None:
+    timings[name] = timings.get(name, 0.0) + seconds
+
+
+def instrument_app(app: Flask, metrics: Metrics, path: str = "/metrics", server_timing: bool = False):
+  app.extensions["metrics"] = metrics
+
+  metrics.describe("http_requests_total", "Handled HTTP requests")
+  metrics.describe("http_request_duration_seconds", "Time spent handling HTTP requests")
+  metrics.describe("template_render_duration_seconds", "Time spent rendering top-level templates")
+  metrics.describe("reflection_duration_seconds", "Time spent collecting typed attributes of rendered objects")
+
+  @app.before_request
+  def start_request_timer():
+    g.request_start = perf_counter()
+    g.server_timings = dict[str, float]()
+    g.template_starts = list[float]()
+
+  @app.after_request
+  def stop_request_timer(response: Response) -> Response:
+    start = g.get("request_start")
+
+    if start is None:
+      return response
+
+    seconds = perf_counter() - start
+    endpoint = request.endpoint or "unknown"
+    status = str(response.status_code)
+
+    metrics.inc("http_requests_total", method=request.method, endpoint=endpoint, status=status)
+    metrics.observe("http_request_duration_seconds", seconds, method=request.method, endpoint=endpoint)
+
+    if server_timing:
+      timings = g.get("server_timings", {})
+      entries = [f"{name};dur={duration * 1000:.3f}" for name, duration in timings.items()]
+      entries.append(f"total;dur={seconds * 1000:.3f}")
+      response.headers["Server-Timing"] = ", ".join(entries)
+
+    return response
+
+  @before_render_template.connect_via(app)
+  def start_template_timer(sender: Flask, template: Any, context: dict[str, Any], **extra: Any):
+    starts = g.get("template_starts")
+
+    if starts is not None:
+      starts.append(perf_counter())
+
+  @template_rendered.connect_via(app)
+  def stop_template_timer(sender: Flask, template: Any, context: dict[str, Any], **extra: Any):
+    starts = g.get("template_starts")
+
+    if not starts:
+      return
+
+    start = starts.pop()
+
+    # Templates rendered from inside other templates (e.g. objects in the index)
+    # are already part of the outer one's time
+
+    if len(starts) == 0:
+      seconds = perf_counter() - start
+      metrics.observe("template_render_duration_seconds", seconds, template=template.name or "")
+      add_server_timing("render", seconds)
+
+  def get_metrics() -> Response:
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+  app.add_url_rule(path, "metrics", get_metrics)
@@ -0,0 +1,126 @@
+import gzip
+
+import pytest
+
+from common.user import User, UserManager
+from server.app import create_app
+from server.config import Config
+from server.io.storage import PickleStorage
+from server.multi_user_manager import MultiUserManager
+
+
+@pytest.fixture
+def managers(tmp_path) -> dict[str, UserManager]:
+  return {
+    "eager": UserManager(PickleStorage(str(tmp_path / "eager"))),
+    "lazy": UserManager(PickleStorage(str(tmp_path / "lazy")), cache_size=10),
+    "refreshed": UserManager(PickleStorage(str(tmp_path / "refreshed")), cache_size=10, refresh_interval=0.0),
+  }
+
+
+@pytest.fixture
+def client(tmp_path, managers):
+  config = Config(secret_filename=str(tmp_path / "secret.key"))
+  app = create_app(config, MultiUserManager(managers, list(managers)))
+
+  return app.test_client()
+
+
+def test_batch_register_reports_errors_per_item(client):
+  res = client.post(
+    "/api/users/batch",
+    json=[
+      {"role": "user", "login": "alice"},
+      "alice",
+      {"role": "owner", "login": "bobby"},
+      {"role": "user", "login": "alice"},
+      {"role": "user", "login": "x"},
+      {"id": 100, "name": "Nobody"},
+    ],
+  )
+
+  assert res.status_code == 200
+
+  results = res.json
+
+  assert results[0] == {"id": 0}
+  assert results[1] == {"error": "Expected an object"}
+  assert results[2] == {"error": "Bad role"}
+  assert "already exists" in results[3]["error"]
+  assert "too short" in results[4]["error"]
+  assert results[5] == {"error": "User with id 100 not found"}
+  assert client.get("/api/users/count").json == 1
+
+
+def test_batch_routes_reject_repeated_ids(client, managers):
+  managers["eager"].add_user(User(login="alice"))
+
+  for method in (client.post, client.patch):
+    res = method("/api/users/batch", json=[{"id": 0, "name": "First"}, {"id": 0, "name": "Second"}])
+
+    assert res.json == [{"id": 0}, {"error": "User with id 0 is updated twice"}]
+    assert managers["eager"].get_user(0).name == "First"
+
+
+def test_batch_update_requires_ids(client):
+  res = client.patch("/api/users/batch", json=[{"name": "Nobody"}, {"id": True}])
+
+  assert res.json == [{"error": "Expected an id"}, {"error": "Expected an id"}]
+
+
+@pytest.mark.parametrize("storage", ["eager", "refreshed"])
+def test_unchanged_users_are_not_sent_again(client, managers, storage):
+  managers[storage].add_user(User(login="alice"))
+
+  for url in (
+    f"/api/users/0?storage={storage}",
+    f"/api/users?storage={storage}",
+    f"/api/users/count?storage={storage}",
+  ):
+    res = client.get(url)
+    etag = res.headers["ETag"]
+
+    assert res.status_code == 200
+    assert "Last-Modified" not in res.headers
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+  etag = client.get(f"/api/users/0?storage={storage}").headers["ETag"]
+  client.patch(f"/api/users/0?storage={storage}", json={"name": "Alice"})
+
+  res = client.get(f"/api/users/0?storage={storage}", headers={"If-None-Match": etag})
+
+  assert res.status_code == 200
+  assert res.json["name"] == "Alice"
+
+
+def test_deleted_users_are_not_validated(client, managers):
+  managers["eager"].add_user(User(login="alice"))
+  etag = client.get("/api/users/0").headers["ETag"]
+
+  client.delete("/api/users/0")
+
+  assert client.get("/api/users/0", headers={"If-None-Match": etag}).status_code == 404
+
+
+def test_lazy_managers_without_refresh_send_no_validators(client, managers):
+  managers["lazy"].add_user(User(login="alice"))
+
+  res = client.get("/api/users/0?storage=lazy")
+
+  assert res.status_code == 200
+  assert "ETag" not in res.headers
+  assert client.get("/api/users/0?storage=lazy", headers={"If-None-Match": "*"}).status_code == 200
+
+
+def test_large_responses_are_compressed(client, managers):
+  managers["eager"].add_users([User(login=f"user{i:04}", name="Some Name") for i in range(100)])
+
+  res = client.get("/api/users", headers={"Accept-Encoding": "gzip"})
+
+  assert res.headers["Content-Encoding"] == "gzip"
+  assert "Accept-Encoding" in res.headers["Vary"]
+  assert len(gzip.decompress(res.data)) > len(res.data)
+
+  small = client.get("/api/users/count", headers={"Accept-Encoding": "gzip"})
+
+  assert "Content-Encoding" not in small.headers
@@ -0,0 +1,69 @@
+from common.io.storage import CachingStorage
+from common.user import User
+from server.io.storage import PickleStorage
+
+
+def test_loads_are_cached_as_copies(tmp_path):
+  storage = CachingStorage(PickleStorage(str(tmp_path / "db")))
+  user_id = storage.persist(User(login="alice"))
+
+  user = storage.load(user_id)
+  user.name = "Changed"
+
+  assert storage.load(user_id).name is None
+  assert storage.stats["cache_hits"] == 1
+
+
+def test_writes_invalidate_cached_results(tmp_path):
+  storage = CachingStorage(PickleStorage(str(tmp_path / "db")))
+  user_id = storage.persist(User(login="alice"))
+
+  assert storage.count() == 1
+
+  storage.persist(User(login="bobby"))
+  user = storage.load(user_id)
+  user.name = "Alice"
+  storage.persist(user)
+
+  assert storage.count() == 2
+  assert storage.load(user_id).name == "Alice"
+  assert storage.delete(user_id)
+  assert storage.load(user_id) is None
+
+
+def test_polled_changes_of_other_instances_invalidate_cached_results(tmp_path):
+  storage = CachingStorage(PickleStorage(str(tmp_path / "db")))
+  other = PickleStorage(str(tmp_path / "db"))
+  user_id = storage.persist(User(login="alice"))
+
+  storage.poll_changes()
+  storage.load(user_id)
+
+  user = other.load(user_id)
+  user.name = "Alice"
+  other.persist(user)
+
+  assert storage.load(user_id).name is None
+  assert storage.poll_changes() == [user_id]
+  assert storage.load(user_id).name == "Alice"
+
+
+def test_entries_are_evicted_past_max_entries(tmp_path):
+  storage = CachingStorage(PickleStorage(str(tmp_path / "db")), max_entries=2)
+  ids = storage.persist_many([User(login=f"user{i:04}") for i in range(3)])
+
+  for user_id in ids:
+    storage.load(user_id)
+
+  assert storage.stats["cache_entries"] == 2
+  assert storage.stats["cache_evictions"] == 1
+
+
+def test_load_by_login_reaches_wrapped_storage(tmp_path):
+  storage = CachingStorage(PickleStorage(str(tmp_path / "db")))
+  user_id = storage.persist(User(login="alice"))
+
+  user = storage.load_by_login("alice")
+
+  assert user is not None
+  assert user.id == user_id
@@ -0,0 +1,116 @@
+import os
+
+from common.user import User
+from server.io.storage import LogStorage
+
+
+def make_user(login: str) -> User:
+  return User(login=login, name=login)
+
+
+def test_persist_load_and_delete(tmp_path):
+  storage = LogStorage(str(tmp_path / "db.log"))
+  alice_id, bobby_id = storage.persist_many([make_user("alice"), make_user("bobby")])
+
+  assert storage.delete(alice_id)
+  assert not storage.delete(alice_id)
+
+  reopened = LogStorage(str(tmp_path / "db.log"))
+
+  assert reopened.load(alice_id) is None
+  assert [user.login for user in reopened.load_all()] == ["bobby"]
+  assert reopened.load_all_ids() == [bobby_id]
+
+
+def test_mmap_reads_see_appended_records(tmp_path):
+  storage = LogStorage(str(tmp_path / "db.log"), mmap_reads=True)
+  alice_id = storage.persist(make_user("alice"))
+
+  assert storage.load(alice_id).login == "alice"
+
+  bobby_id = storage.persist(make_user("bobby"))
+
+  assert storage.load(bobby_id).login == "bobby"
+
+
+def test_compaction_keeps_live_objects(tmp_path):
+  filename = str(tmp_path / "db.log")
+  storage = LogStorage(filename, compact_min_bytes=1)
+  other = LogStorage(filename)
+  user = make_user("alice")
+
+  storage.persist(user)
+
+  for i in range(10):
+    user.name = f"name{i:04}"
+    storage.persist(user)
+
+  storage.persist(make_user("bobby"))
+
+  assert storage.stats["garbage_bytes"] < storage.stats["live_bytes"]
+  assert os.path.getsize(filename) == storage.stats["file_bytes"]
+
+  # The other instance still holds the replaced file open
+
+  assert sorted(user.name for user in other.load_all()) == ["bobby", "name0009"]
+
+
+def test_torn_tail_is_ignored_and_cut_off(tmp_path):
+  filename = str(tmp_path / "db.log")
+  storage = LogStorage(filename)
+  alice_id = storage.persist(make_user("alice"))
+
+  with open(filename, "ab") as file:
+    file.write(LogStorage.HEADER.pack(100, 1000, 0) + b"torn")
+
+  reopened = LogStorage(filename)
+
+  assert reopened.load_all_ids() == [alice_id]
+
+  bobby_id = reopened.persist(make_user("bobby"))
+
+  assert sorted(LogStorage(filename).load_all_ids()) == [alice_id, bobby_id]
+
+
+def test_records_with_bad_checksum_are_ignored(tmp_path):
+  filename = str(tmp_path / "db.log")
+  storage = LogStorage(filename)
+  alice_id = storage.persist(make_user("alice"))
+  storage.persist(make_user("bobby"))
+
+  with open(filename, "r+b") as file:
+    file.seek(-1, os.SEEK_END)
+    last_byte = file.read(1)
+    file.seek(-1, os.SEEK_END)
+    file.write(bytes([last_byte[0] ^ 0xFF]))
+
+  assert LogStorage(filename).load_all_ids() == [alice_id]
+
+
+def test_poll_changes_reports_appends_of_other_instances(tmp_path):
+  filename = str(tmp_path / "db.log")
+  writer = LogStorage(filename)
+  poller = LogStorage(filename)
+
+  assert poller.poll_changes() == []
+
+  alice_id = writer.persist(make_user("alice"))
+  writer.delete(alice_id)
+  bobby_id = poller.persist(make_user("bobby"))
+
+  assert poller.poll_changes() == [alice_id]
+  assert poller.poll_changes() == []
+  assert bobby_id != alice_id
+
+
+def test_poll_changes_after_compaction_by_other_instance_can_not_tell_changes(tmp_path):
+  filename = str(tmp_path / "db.log")
+  writer = LogStorage(filename)
+  poller = LogStorage(filename)
+
+  writer.persist(make_user("alice"))
+  poller.poll_changes()
+  writer.compact()
+
+  assert poller.poll_changes() is None
+  assert poller.poll_changes() == []
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from common.user import User
+from server.io.storage import PickleStorage
+
+
+def make_user(login: str) -> User:
+  return User(login=login, name=login)
+
+
+def test_persist_load_and_delete(tmp_path):
+  storage = PickleStorage(str(tmp_path / "db"))
+  user_id = storage.persist(make_user("alice"))
+
+  loaded = storage.load(user_id)
+
+  assert loaded is not None
+  assert loaded.login == "alice"
+  assert storage.count() == 1
+  assert storage.delete(user_id)
+  assert not storage.delete(user_id)
+  assert storage.load(user_id) is None
+
+
+def test_instances_sharing_directory_get_distinct_ids(tmp_path):
+  first = PickleStorage(str(tmp_path / "db"))
+  second = PickleStorage(str(tmp_path / "db"))
+
+  ids = [
+    first.persist(make_user("alice")),
+    second.persist(make_user("bobby")),
+    *first.persist_many([make_user("carol"), make_user("david")]),
+    second.persist(make_user("erika")),
+  ]
+
+  assert len(set(ids)) == len(ids)
+  assert sorted(user.login for user in first.load_all()) == ["alice", "bobby", "carol", "david", "erika"]
+
+
+def test_missing_id_counter_is_recovered_from_files(tmp_path):
+  storage = PickleStorage(str(tmp_path / "db"))
+  storage.persist_many([make_user("alice"), make_user("bobby")])
+
+  os.remove(tmp_path / "db" / PickleStorage.NEXT_ID_FILENAME)
+
+  assert storage.persist(make_user("carol")) == 2
+
+
+def test_poll_changes_reports_writes_of_other_instances(tmp_path):
+  writer = PickleStorage(str(tmp_path / "db"))
+  poller = PickleStorage(str(tmp_path / "db"))
+
+  assert poller.poll_changes() == []
+
+  alice_id = writer.persist(make_user("alice"))
+  bobby_id = writer.persist(make_user("bobby"))
+  writer.delete(alice_id)
+
+  assert poller.poll_changes() == [alice_id, bobby_id]
+  assert poller.poll_changes() == []
+
+
+def test_poll_changes_after_delete_all_can_not_tell_changes(tmp_path):
+  writer = PickleStorage(str(tmp_path / "db"))
+  poller = PickleStorage(str(tmp_path / "db"))
+
+  writer.persist(make_user("alice"))
+  poller.poll_changes()
+  writer.delete_all()
+
+  assert poller.poll_changes() is None
+  assert poller.poll_changes() == []
+
+
+def test_poll_changes_after_change_log_replacement_can_not_tell_changes(tmp_path, monkeypatch):
+  monkeypatch.setattr(PickleStorage, "MAX_CHANGES_BYTES", 64)
+
+  writer = PickleStorage(str(tmp_path / "db"))
+  poller = PickleStorage(str(tmp_path / "db"))
+
+  poller.poll_changes()
+  writer.persist_many([make_user(f"user{i:04}") for i in range(20)])
+
+  assert poller.poll_changes() is None
+
+  user_id = writer.persist(make_user("alice"))
+
+  assert poller.poll_changes() == [user_id]
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX file modes")
+def test_files_get_umask_mode(tmp_path):
+  umask = os.umask(0o022)
+
+  try:
+    storage = PickleStorage(str(tmp_path / "db"))
+    user_id = storage.persist(make_user("alice"))
+  finally:
+    os.umask(umask)
+
+  mode = os.stat(tmp_path / "db" / f"{user_id}.pickle").st_mode & 0o777
+
+  assert mode == 0o644
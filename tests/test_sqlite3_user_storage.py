@@ -0,0 +1,47 @@
+from common.user import Admin, User
+from server.user.io.storage import Sqlite3UserStorage
+
+
+def test_persist_load_and_delete(tmp_path):
+  storage = Sqlite3UserStorage(str(tmp_path / "users.sqlite3"))
+  alice_id, bobby_id = storage.persist_many([User(login="alice"), Admin(login="bobby")])
+
+  bobby = storage.load(bobby_id)
+
+  assert isinstance(bobby, Admin)
+  assert [user.login for user in storage.load_many([alice_id, 100, bobby_id])] == ["alice", "bobby"]
+  assert storage.delete(alice_id)
+  assert storage.count() == 1
+
+
+def test_load_by_login(tmp_path):
+  storage = Sqlite3UserStorage(str(tmp_path / "users.sqlite3"))
+  user_id = storage.persist(User(login="alice", name="Alice"))
+
+  user = storage.load_by_login("alice")
+
+  assert user is not None
+  assert user.id == user_id
+  assert storage.load_by_login("bobby") is None
+
+
+def test_load_page(tmp_path):
+  storage = Sqlite3UserStorage(str(tmp_path / "users.sqlite3"))
+  ids = storage.persist_many([User(login=f"user{i:04}") for i in range(5)])
+
+  assert [user.id for user in storage.load_page(limit=2)] == ids[:2]
+  assert [user.id for user in storage.load_page(after_id=ids[2])] == ids[3:]
+
+
+def test_poll_changes_reports_writes_of_other_connections(tmp_path):
+  writer = Sqlite3UserStorage(str(tmp_path / "users.sqlite3"))
+  poller = Sqlite3UserStorage(str(tmp_path / "users.sqlite3"))
+
+  assert poller.poll_changes() == []
+
+  alice_id = writer.persist(User(login="alice"))
+  bobby_id = writer.persist(User(login="bobby"))
+  writer.delete(alice_id)
+
+  assert sorted(poller.poll_changes() or []) == sorted([alice_id, bobby_id])
+  assert poller.poll_changes() == []
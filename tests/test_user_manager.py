@@ -0,0 +1,122 @@
+import pytest
+
+from common.user import User, UserManager
+from server.io.storage import PickleStorage
+
+
+@pytest.fixture(params=[None, 2], ids=["eager", "lazy"])
+def cache_size(request) -> int | None:
+  return request.param
+
+
+def test_add_get_and_delete_users(tmp_path, cache_size):
+  manager = UserManager(PickleStorage(str(tmp_path / "db")), cache_size=cache_size)
+  users = [User(login=f"user{i:04}") for i in range(4)]
+
+  manager.add_users(users)
+
+  assert manager.user_count == 4
+  assert manager.get_user(users[0].id).login == "user0000"
+  assert manager.get_user_by_login("user0003").id == users[3].id
+  assert [user.id for user in manager.get_users([users[2].id, users[1].id])] == [users[2].id, users[1].id]
+  assert manager.delete_user(users[0].id)
+  assert manager.get_user(users[0].id) is None
+  assert manager.user_count == 3
+
+
+def test_taken_login_is_rejected(tmp_path, cache_size):
+  manager = UserManager(PickleStorage(str(tmp_path / "db")), cache_size=cache_size)
+  manager.add_user(User(login="alice"))
+
+  with pytest.raises(ValueError):
+    manager.add_user(User(login="alice"))
+
+  with pytest.raises(ValueError):
+    manager.add_users([User(login="bobby"), User(login="bobby")])
+
+
+def test_lazy_manager_keeps_only_most_recently_used_users(tmp_path):
+  storage = PickleStorage(str(tmp_path / "db"))
+  ids = storage.persist_many([User(login=f"user{i:04}") for i in range(4)])
+  manager = UserManager(storage, cache_size=2)
+  first = manager.get_user(ids[0])
+  last = None
+
+  for user_id in ids[1:]:
+    last = manager.get_user(user_id)
+
+  assert manager.get_user(ids[-1]) is last
+  assert manager.get_user(ids[0]) is not first
+  assert manager.get_user(ids[0]).login == "user0000"
+
+
+def test_write_behind_defers_updates_until_flush(tmp_path, cache_size):
+  storage = PickleStorage(str(tmp_path / "db"))
+  manager = UserManager(storage, cache_size=cache_size, flush_interval=3600.0)
+  user = User(login="alice")
+
+  manager.add_user(user)
+  user.name = "Alice"
+  manager.add_user(user)
+
+  assert storage.load(user.id).name is None
+  assert manager.flush() == 0
+  assert manager.flush(force=True) == 1
+  assert storage.load(user.id).name == "Alice"
+
+
+def test_lazy_manager_persists_deferred_updates_of_evicted_users(tmp_path):
+  storage = PickleStorage(str(tmp_path / "db"))
+  manager = UserManager(storage, cache_size=1, flush_interval=3600.0)
+  alice = User(login="alice")
+  manager.add_user(alice)
+  manager.add_user(User(login="bobby"))
+
+  alice = manager.get_user(alice.id)
+  alice.name = "Alice"
+  manager.add_user(alice)
+  manager.get_user_by_login("bobby")
+
+  assert storage.load(alice.id).name == "Alice"
+
+
+def test_refresh_picks_up_writes_of_other_instances(tmp_path, cache_size):
+  manager = UserManager(PickleStorage(str(tmp_path / "db")), cache_size=cache_size, refresh_interval=0.0)
+  other = PickleStorage(str(tmp_path / "db"))
+  user = User(login="alice")
+  manager.add_user(user)
+  version = manager.versions.get_user(user.id)
+
+  changed = other.load(user.id)
+  changed.name = "Alice"
+  other.persist(changed)
+  new_id = other.persist(User(login="bobby"))
+
+  assert manager.refresh(force=True) == 2
+  assert manager.get_user(user.id).name == "Alice"
+  assert manager.get_user(new_id).login == "bobby"
+  assert manager.versions.get_user(user.id) != version
+
+
+def test_refresh_skips_own_writes(tmp_path, cache_size):
+  manager = UserManager(PickleStorage(str(tmp_path / "db")), cache_size=cache_size, refresh_interval=0.0)
+  user = User(login="alice")
+  manager.add_user(user)
+  removed = User(login="bobby")
+  manager.add_user(removed)
+  manager.delete_user(removed.id)
+  version = manager.versions.collection
+
+  assert manager.refresh(force=True) == 0
+  assert manager.versions.collection == version
+
+
+def test_removed_users_never_get_their_old_version_back(tmp_path, cache_size):
+  manager = UserManager(PickleStorage(str(tmp_path / "db")), cache_size=cache_size)
+  user = User(login="alice")
+  manager.add_user(user)
+  version = manager.versions.get_user(user.id)
+
+  manager.delete_user(user.id)
+
+  assert manager.versions.get_user(user.id) != version
@@ -0,0 +1,45 @@
+import pytest
+
+from common.user import User, UserManager
+from server.app import create_app
+from server.config import Config
+from server.io.storage import PickleStorage
+from server.multi_user_manager import MultiUserManager
+
+
+def make_client(tmp_path, manager: UserManager):
+  config = Config(secret_filename=str(tmp_path / "secret.key"))
+
+  return create_app(config, MultiUserManager({"pickle": manager}, ["pickle"])).test_client()
+
+
+@pytest.mark.parametrize("cache_size", [None, 10], ids=["eager", "lazy"])
+def test_index_shows_users_updated_since_last_view(tmp_path, cache_size):
+  manager = UserManager(PickleStorage(str(tmp_path / "db")), cache_size=cache_size)
+  user = User(login="alice", name="First")
+  manager.add_user(user)
+  client = make_client(tmp_path, manager)
+
+  assert "First" in client.get("/").get_data(as_text=True)
+
+  user.name = "Second"
+  manager.add_user(user)
+
+  assert "Second" in client.get("/").get_data(as_text=True)
+
+
+@pytest.mark.parametrize("refresh_interval", [None, 0.0], ids=["lazy", "refreshed"])
+def test_index_shows_users_updated_by_other_instances(tmp_path, refresh_interval):
+  storage = PickleStorage(str(tmp_path / "db"))
+  user_id = storage.persist(User(login="alice", name="First"))
+  manager = UserManager(storage, cache_size=10, refresh_interval=refresh_interval)
+  client = make_client(tmp_path, manager)
+
+  assert "First" in client.get("/").get_data(as_text=True)
+
+  other = PickleStorage(str(tmp_path / "db"))
+  user = other.load(user_id)
+  user.name = "Second"
+  other.persist(user)
+
+  assert "Second" in client.get("/").get_data(as_text=True)